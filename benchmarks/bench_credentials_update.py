@@ -0,0 +1,109 @@
+"""Compare the incremental credentials updater with a ConfigParser round trip.
+
+Usage: python benchmarks/bench_credentials_update.py [--profiles N] [--repeat N]
+
+Builds a synthetic ~/.aws/credentials with N profiles (default 1000) in a
+temp dir, then refreshes one profile in the middle repeatedly: once the way
+write_sts_token used to (lock, ConfigParser read, set, write everything) and
+once through CredentialsStore. Reports time per update and how many bytes
+outside the refreshed profile changed.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from configparser import ConfigParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from oktaawscli._credentials_store import CredentialsStore
+from oktaawscli._locking import atomic_write, locked
+
+
+def _credentials(profiles):
+    blocks = []
+    for i in range(profiles):
+        blocks.append(
+            "# account %d, refreshed by okta-awscli\n"
+            "[profile-%04d]\n"
+            "output=json\n"
+            "region = us-east-1\n"
+            "aws_access_key_id = AKIA%016d\n"
+            "aws_secret_access_key = %s\n"
+            "aws_session_token = %s\n"
+            "aws_security_token = %s\n"
+            "x_security_token_expires = 2099-01-01T00:00:00Z\n"
+            % (i, i, i, "s" * 40, "t" * 600, "t" * 600)
+        )
+    return "\n".join(blocks)
+
+
+def _values(i):
+    return {
+        "aws_access_key_id": "AKIANEW%013d" % i,
+        "aws_session_token": "n" * 600,
+        "aws_security_token": "n" * 600,
+    }
+
+
+def _configparser_update(path, profile, values):
+    with locked(path):
+        config = ConfigParser()
+        config.read(path)
+        for key, value in values.items():
+            config.set(profile, key, value)
+        with atomic_write(path) as creds_file:
+            config.write(creds_file)
+
+
+def _store_update(path, profile, values):
+    store = CredentialsStore(path)
+    store.upsert(profile, values)
+    store.commit()
+
+
+def _outside_bytes_changed(before, after, profile):
+    def outside(text):
+        start = text.index("[%s]" % profile)
+        end = text.index("\n[", start + 1)
+        return text[:start] + text[end:]
+
+    old, new = outside(before), outside(after)
+    return sum(a != b for a, b in zip(old, new)) + abs(len(old) - len(new))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    content = _credentials(args.profiles)
+    profile = "profile-%04d" % (args.profiles // 2)
+    print(
+        "%d profiles, %d KiB; updating [%s]"
+        % (args.profiles, len(content) // 1024, profile)
+    )
+    print("%-14s %10s %22s" % ("writer", "ms/update", "bytes changed outside"))
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "credentials")
+        for label, update in (
+            ("configparser", _configparser_update),
+            ("incremental", _store_update),
+        ):
+            with open(path, "w") as creds_file:
+                creds_file.write(content)
+            start = time.perf_counter()
+            for i in range(args.repeat):
+                update(path, profile, _values(i))
+            elapsed = (time.perf_counter() - start) / args.repeat
+            with open(path) as creds_file:
+                changed = _outside_bytes_changed(content, creds_file.read(), profile)
+            print("%-14s %10.2f %22d" % (label, elapsed * 1000, changed))
+
+
+if __name__ == "__main__":
+    main()
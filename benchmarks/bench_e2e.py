@@ -0,0 +1,258 @@
+"""End-to-end okta-awscli timings against local fake Okta and AWS services.
+
+Usage: python benchmarks/bench_e2e.py [--repeat N] [--okta-latency-ms MS]
+           [--aws-latency-ms MS] [--rate-limit-every N] [--write-baseline]
+
+Runs three scenarios in a throwaway $HOME, through both the `main` CLI and
+`get_credentials`:
+
+  cold-auth          nothing cached: authn, TOTP, session, app list, SAML, STS
+  warm-session       ~/.okta-token is valid, credentials and caches are not
+  valid-credentials  ~/.aws/credentials already holds unexpired credentials
+
+Reports median wall time, requests per endpoint and time spent waiting for
+file locks. Results are compared with benchmarks/baselines/bench_e2e.json:
+any change in request counts, or a median more than 50% (and 5 ms) slower,
+is reported as a regression and the script exits 1. --write-baseline
+records the current results instead.
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import filelock
+from fake_services import APP_LABEL, FakeAws, FakeOkta
+
+from oktaawscli import okta_awscli
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baselines", "bench_e2e.json"
+)
+SCENARIOS = ("cold-auth", "warm-session", "valid-credentials")
+ENTRIES = ("main", "get_credentials")
+PROFILE = "bench"
+TOTP = "123456"
+SLOWDOWN_TOLERANCE = 0.5
+SLOWDOWN_FLOOR_MS = 5.0
+
+
+class _LockTimer:
+    """Accumulates time spent in filelock acquire() while installed"""
+
+    def __init__(self):
+        self.waited = 0.0
+        self._original = filelock.BaseFileLock.acquire
+
+    def __enter__(self):
+        original = self._original
+        timer = self
+
+        def acquire(lock, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(lock, *args, **kwargs)
+            finally:
+                timer.waited += time.perf_counter() - start
+
+        filelock.BaseFileLock.acquire = acquire
+        return self
+
+    def __exit__(self, *exc_info):
+        filelock.BaseFileLock.acquire = self._original
+
+
+def _prepare(home, scenario, okta_url):
+    if scenario == "cold-auth":
+        shutil.rmtree(home, ignore_errors=True)
+        os.makedirs(home)
+        with open(os.path.join(home, ".okta-aws"), "w") as config:
+            config.write(
+                "[default]\nbase-url = %s\nusername = bench\npassword = bench\n"
+                "app = %s\nregion = us-east-1\n" % (okta_url, APP_LABEL)
+            )
+    elif scenario == "warm-session":
+        for name in (
+            ".aws/credentials",
+            ".okta-saml-cache",
+            ".okta-apps-cache",
+        ):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(home, name))
+
+
+def _run(entry):
+    logger = logging.getLogger("okta-awscli")
+    try:
+        if entry == "main":
+            okta_awscli.main.main(
+                ["--profile", PROFILE, "--token", TOTP], standalone_mode=False
+            )
+        else:
+            okta_awscli.get_credentials(
+                okta_profile="default",
+                profile=PROFILE,
+                account=None,
+                write_default=False,
+                verbose=False,
+                logger=logger,
+                totp_token=TOTP,
+                cache=False,
+                export=False,
+                reset=False,
+                force=False,
+                region=None,
+            )
+    except SystemExit as ex:
+        if ex.code not in (0, None):
+            raise RuntimeError("okta-awscli exited %s" % ex.code) from ex
+    finally:
+        # main() adds a handler per call; don't let them pile up.
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+
+
+def _measure(args, okta, aws, home, devnull):
+    samples = {}
+    for _ in range(args.repeat):
+        for entry in ENTRIES:
+            for scenario in SCENARIOS:
+                _prepare(home, scenario, okta.url)
+                okta.reset()
+                aws.reset()
+                with _LockTimer() as lock_timer, contextlib.redirect_stdout(
+                    devnull
+                ), contextlib.redirect_stderr(devnull):
+                    start = time.perf_counter()
+                    _run(entry)
+                    elapsed = time.perf_counter() - start
+                sample = samples.setdefault(
+                    "%s/%s" % (scenario, entry),
+                    {"times": [], "lock_waits": [], "requests": None},
+                )
+                sample["times"].append(elapsed * 1000)
+                sample["lock_waits"].append(lock_timer.waited * 1000)
+                requests = dict(okta.requests)
+                requests.update(("aws " + k, v) for k, v in aws.requests.items())
+                sample["requests"] = dict(sorted(requests.items()))
+    return {
+        key: {
+            "median_ms": round(statistics.median(sample["times"]), 2),
+            "lock_wait_ms": round(statistics.median(sample["lock_waits"]), 2),
+            "requests": sample["requests"],
+        }
+        for key, sample in samples.items()
+    }
+
+
+def _regressions(results, baseline):
+    found = []
+    for key, result in results.items():
+        expected = baseline.get("results", {}).get(key)
+        if expected is None:
+            continue
+        if result["requests"] != expected["requests"]:
+            found.append(
+                "%s: requests %s, baseline %s"
+                % (key, result["requests"], expected["requests"])
+            )
+        limit = expected["median_ms"] * (1 + SLOWDOWN_TOLERANCE) + SLOWDOWN_FLOOR_MS
+        if result["median_ms"] > limit:
+            found.append(
+                "%s: %.1f ms, baseline %.1f ms"
+                % (key, result["median_ms"], expected["median_ms"])
+            )
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--okta-latency-ms", type=float, default=0.0)
+    parser.add_argument("--aws-latency-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--write-baseline", action="store_true")
+    args = parser.parse_args()
+    settings = {
+        "okta_latency_ms": args.okta_latency_ms,
+        "aws_latency_ms": args.aws_latency_ms,
+        "rate_limit_every": args.rate_limit_every,
+    }
+
+    with tempfile.TemporaryDirectory() as tempdir, FakeOkta(
+        latency=args.okta_latency_ms / 1000, rate_limit_every=args.rate_limit_every
+    ) as okta, FakeAws(latency=args.aws_latency_ms / 1000) as aws, open(
+        os.devnull, "w"
+    ) as devnull:
+        home = os.path.join(tempdir, "home")
+        for name in ("AWS_PROFILE", "AWS_DEFAULT_PROFILE", "AWS_ACCESS_KEY_ID"):
+            os.environ.pop(name, None)
+        os.environ.update(
+            {
+                "HOME": home,
+                "NO_PROXY": "127.0.0.1",
+                "AWS_ENDPOINT_URL_STS": aws.url,
+                "AWS_ENDPOINT_URL_IAM": aws.url,
+                "AWS_EC2_METADATA_DISABLED": "true",
+                # IAM is global; with an endpoint override it needs a signing region.
+                "AWS_DEFAULT_REGION": "us-east-1",
+            }
+        )
+        results = _measure(args, okta, aws, home, devnull)
+
+    print(
+        "%-36s %10s %10s  %s" % ("scenario/entry", "median ms", "lock ms", "requests")
+    )
+    for key, result in results.items():
+        print(
+            "%-36s %10.1f %10.2f  %s"
+            % (
+                key,
+                result["median_ms"],
+                result["lock_wait_ms"],
+                ", ".join("%s=%d" % item for item in result["requests"].items()) or "-",
+            )
+        )
+
+    if args.write_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w") as baseline_file:
+            json.dump(
+                {"settings": settings, "results": results},
+                baseline_file,
+                indent=2,
+                sort_keys=True,
+            )
+            baseline_file.write("\n")
+        print("Baseline written to %s" % BASELINE_PATH)
+        return 0
+
+    try:
+        with open(BASELINE_PATH) as baseline_file:
+            baseline = json.load(baseline_file)
+    except FileNotFoundError:
+        print("No baseline at %s; run with --write-baseline" % BASELINE_PATH)
+        return 0
+    if baseline.get("settings") != settings:
+        print("Baseline was recorded with %s; not comparing" % baseline.get("settings"))
+        return 0
+    regressions = _regressions(results, baseline)
+    for regression in regressions:
+        print("REGRESSION %s" % regression)
+    if not regressions:
+        print("No regressions against %s" % BASELINE_PATH)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Reader throughput under shared vs exclusive locks.
+
+Usage: python benchmarks/bench_lock_contention.py [--readers N] [--reads N]
+           [--hold-ms MS]
+
+Starts N reader processes (default 32) that each lock a file, read it and
+hold the lock for --hold-ms (default 2, standing in for parsing the alias
+cache) --reads times, once with exclusive locks and once with shared ones.
+Reports total reads per second and the slowest single lock wait.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from oktaawscli._locking import locked
+
+
+def _reader(path, reads, hold_seconds, shared, start_at, results):
+    while time.time() < start_at:
+        time.sleep(0.001)
+    max_wait = 0.0
+    for _ in range(reads):
+        with locked(path, shared=shared) as lock:
+            with open(path) as data_file:
+                json.load(data_file)
+            time.sleep(hold_seconds)
+        max_wait = max(max_wait, lock.waited)
+    results.put(max_wait)
+
+
+def _run(path, readers, reads, hold_seconds, shared):
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    start_at = time.time() + 0.5
+    procs = [
+        ctx.Process(
+            target=_reader, args=(path, reads, hold_seconds, shared, start_at, results)
+        )
+        for _ in range(readers)
+    ]
+    for proc in procs:
+        proc.start()
+    max_wait = max(results.get() for _ in procs)
+    for proc in procs:
+        proc.join()
+    return time.time() - start_at, max_wait
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=32)
+    parser.add_argument("--reads", type=int, default=20)
+    parser.add_argument("--hold-ms", type=float, default=2.0)
+    args = parser.parse_args()
+    # Waits here are the point; keep "Waiting for ..." warnings out of the table.
+    logging.getLogger("okta-awscli").addHandler(logging.NullHandler())
+
+    print(
+        "%d readers x %d reads, %.1f ms under the lock"
+        % (args.readers, args.reads, args.hold_ms)
+    )
+    print("%-10s %12s %16s" % ("lock", "reads/s", "max wait ms"))
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, ".okta-alias-info")
+        with open(path, "w") as data_file:
+            json.dump(
+                {"%012d" % i: {"alias": "account-%d" % i} for i in range(100)},
+                data_file,
+            )
+        for label, shared in (("exclusive", False), ("shared", True)):
+            elapsed, max_wait = _run(
+                path, args.readers, args.reads, args.hold_ms / 1000, shared
+            )
+            print(
+                "%-10s %12.0f %16.1f"
+                % (label, args.readers * args.reads / elapsed, max_wait * 1000)
+            )
+
+
+if __name__ == "__main__":
+    main()
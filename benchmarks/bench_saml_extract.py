@@ -0,0 +1,119 @@
+"""Compare streaming SAMLResponse extraction with the BeautifulSoup parse.
+
+Usage: python benchmarks/bench_saml_extract.py [--repeat N]
+
+The pages mimic what Okta's amazon_aws app link returns: an auto-submitting
+form holding the base64 SAMLResponse, preceded by the tenant's branding.
+"tenant-branded" inlines ~2 MB of CSS, scripts and logo data the way large
+custom sign-in pages do. Reports parse time per call and peak memory.
+"""
+
+import argparse
+import base64
+import io
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import requests
+from bs4 import BeautifulSoup
+
+from oktaawscli.okta_auth import OktaAuth
+
+
+def _assertion(role_count):
+    roles = "".join(
+        "<saml2:AttributeValue>arn:aws:iam::%012d:saml-provider/okta,"
+        "arn:aws:iam::%012d:role/role-%d</saml2:AttributeValue>" % (i, i, i)
+        for i in range(role_count)
+    )
+    return base64.b64encode(
+        ("<saml2p:Response>%s</saml2p:Response>" % roles).encode()
+    ).decode()
+
+
+def _page(branding_bytes, role_count):
+    # Split the branding between stylesheet, script and markup: the markup is
+    # what makes a full DOM parse expensive.
+    share = branding_bytes // 3
+    style = "<style>%s</style>" % (".okta-brand{color:#123456}\n" * (share // 28))
+    script = "<script>var logo = '%s';</script>" % ("A" * share)
+    tile = '<div class="brand-tile"><a href="/app/%d"><span>Tile %d</span></a></div>'
+    markup = "".join(tile % (i, i) for i in range(share // 72))
+    return (
+        "<!DOCTYPE html><html><head><title>Signing in...</title>%s%s</head>"
+        '<body id="app" onload="document.forms[0].submit()"><nav>%s</nav>'
+        '<form id="appForm" method="POST" action="https://signin.aws.amazon.com/saml">'
+        '<input name="SAMLResponse" type="hidden" value="%s"/>'
+        '<input name="RelayState" type="hidden" value=""/>'
+        "</form></body></html>" % (style, script, markup, _assertion(role_count))
+    )
+
+
+PAGES = {
+    "typical": _page(8 * 1024, 20),
+    "tenant-branded": _page(2 * 1024 * 1024, 120),
+}
+
+
+def _response(body):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.raw = io.BytesIO(body)
+    resp.encoding = "utf-8"
+    return resp
+
+
+def _soup(body):
+    soup = BeautifulSoup(_response(body).text, "html.parser")
+    for input_tag in soup.find_all("input"):
+        if input_tag.get("name") == "SAMLResponse":
+            return input_tag.get("value")
+    return None
+
+
+def _stream(body):
+    auth = OktaAuth.__new__(OktaAuth)
+    auth.logger = logging.getLogger("bench")
+    return auth.get_saml_assertion(_response(body))
+
+
+def _measure(func, body, repeat):
+    assert func(body) == _soup(body)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(body)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    func(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    print(
+        "%-15s %10s %-10s %12s %12s" % ("page", "size", "parser", "ms/call", "peak MiB")
+    )
+    for name, page in PAGES.items():
+        body = page.encode("utf-8")
+        for label, func in (("bs4", _soup), ("streaming", _stream)):
+            elapsed, peak = _measure(func, body, args.repeat)
+            print(
+                "%-15s %9dK %-10s %12.2f %12.2f"
+                % (name, len(body) // 1024, label, elapsed * 1000, peak / 2**20)
+            )
+
+
+if __name__ == "__main__":
+    main()
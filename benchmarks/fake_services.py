@@ -0,0 +1,249 @@
+"""In-process stand-ins for Okta and AWS STS/IAM used by the end-to-end benchmark.
+
+`FakeOkta` answers the authn, factor verify, sessions, users/me and
+appLinks APIs plus the amazon_aws app page. `FakeAws` answers the STS
+AssumeRoleWithSAML and GetCallerIdentity and IAM ListAccountAliases query
+APIs; point boto3 at it with AWS_ENDPOINT_URL_STS / AWS_ENDPOINT_URL_IAM.
+
+Both count requests per endpoint and can add latency to every request.
+FakeOkta can also answer every Nth rate-limited API call with an HTTP 429
+E0000047, the way an exhausted org rate limit does.
+"""
+
+import base64
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ACCOUNT_ID = "123456789012"
+ACCOUNT_ALIAS = "bench-account"
+APP_LABEL = "AWS Bench"
+APP_PATH = "/home/amazon_aws/0oabench/272"
+USER_ID = "00ubench"
+
+# Okta APIs okta-awscli sends through its rate-limit retry.
+RATE_LIMITED_PATHS = (
+    "/api/v1/authn",
+    "/api/v1/sessions",
+    "/api/v1/users/me/appLinks",
+)
+
+
+def _timestamp(seconds_from_now, fmt):
+    moment = datetime.now(timezone.utc) + timedelta(seconds=seconds_from_now)
+    return moment.strftime(fmt)
+
+
+def saml_assertion(role_count=1):
+    """Return a base64 SAMLResponse granting `role_count` roles in ACCOUNT_ID"""
+    roles = "".join(
+        "<saml2:AttributeValue>arn:aws:iam::%s:saml-provider/okta,"
+        "arn:aws:iam::%s:role/bench-%d</saml2:AttributeValue>"
+        % (ACCOUNT_ID, ACCOUNT_ID, i)
+        for i in range(role_count)
+    )
+    not_on_or_after = _timestamp(300, "%Y-%m-%dT%H:%M:%S.000Z")
+    xml = (
+        '<saml2p:Response xmlns:saml2p="urn:oasis:names:tc:SAML:2.0:protocol" '
+        'xmlns:saml2="urn:oasis:names:tc:SAML:2.0:assertion"><saml2:Assertion>'
+        "<saml2:Subject><saml2:SubjectConfirmation>"
+        '<saml2:SubjectConfirmationData NotOnOrAfter="%s"/>'
+        "</saml2:SubjectConfirmation></saml2:Subject>"
+        '<saml2:Conditions NotOnOrAfter="%s"/><saml2:AttributeStatement>'
+        '<saml2:Attribute Name="https://aws.amazon.com/SAML/Attributes/Role">%s'
+        "</saml2:Attribute></saml2:AttributeStatement></saml2:Assertion>"
+        "</saml2p:Response>" % (not_on_or_after, not_on_or_after, roles)
+    )
+    return base64.b64encode(xml.encode("utf-8")).decode("ascii")
+
+
+class _FakeServer:
+    """A ThreadingHTTPServer on 127.0.0.1 run from a daemon thread"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = Counter()
+        self._counter_lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Routes every request to the owning fake's `handle`"""
+
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                server.dispatch(self)
+
+            do_POST = do_GET
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = "http://127.0.0.1:%d" % self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset(self):
+        """Forget the requests seen so far"""
+        with self._counter_lock:
+            self.requests.clear()
+
+    def count(self, endpoint):
+        """Record one request to `endpoint`, returning the running total"""
+        with self._counter_lock:
+            self.requests[endpoint] += 1
+            return self.requests[endpoint]
+
+    def dispatch(self, handler):
+        """Read the request body, wait the configured latency and answer it"""
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        if self.latency:
+            time.sleep(self.latency)
+        status, content_type, payload, headers = self.handle(
+            handler.command, urlsplit(handler.path), body
+        )
+        data = payload.encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def handle(self, method, url, body):
+        """Return (status, content type, payload, extra headers) for a request"""
+        raise NotImplementedError
+
+
+class FakeOkta(_FakeServer):
+    """Okta org with one user, a TOTP factor and one amazon_aws app"""
+
+    def __init__(self, latency=0.0, rate_limit_every=0, role_count=1):
+        super().__init__(latency)
+        self.rate_limit_every = rate_limit_every
+        self.role_count = role_count
+        self._rate_limit_counter = 0
+
+    def reset(self):
+        super().reset()
+        self._rate_limit_counter = 0
+
+    def _rate_limited(self):
+        if not self.rate_limit_every:
+            return False
+        with self._counter_lock:
+            self._rate_limit_counter += 1
+            return self._rate_limit_counter % self.rate_limit_every == 0
+
+    def handle(self, method, url, body):
+        path = url.path
+        if path in RATE_LIMITED_PATHS and self._rate_limited():
+            self.count("429 " + path)
+            error = {"errorCode": "E0000047", "errorSummary": "API call exceeded"}
+            headers = {
+                "X-Rate-Limit-Remaining": "0",
+                "X-Rate-Limit-Reset": str(int(time.time())),
+            }
+            return 429, "application/json", json.dumps(error), headers
+        self.count("%s %s" % (method, path))
+        if path == "/api/v1/authn":
+            verify = self.url + "/api/v1/authn/factors/totp/verify"
+            response = {
+                "status": "MFA_REQUIRED",
+                "stateToken": "state-bench",
+                "_embedded": {
+                    "factors": [
+                        {
+                            "factorType": "token:software:totp",
+                            "provider": "GOOGLE",
+                            "_links": {"verify": {"href": verify}},
+                        }
+                    ]
+                },
+            }
+        elif path == "/api/v1/authn/factors/totp/verify":
+            response = {"status": "SUCCESS", "sessionToken": "session-token-bench"}
+        elif path == "/api/v1/sessions":
+            response = {
+                "id": "sid-bench",
+                "userId": USER_ID,
+                "expiresAt": _timestamp(7200, "%Y-%m-%dT%H:%M:%S.000Z"),
+            }
+        elif path == "/api/v1/users/me":
+            response = {"id": USER_ID}
+        elif path == "/api/v1/users/me/appLinks":
+            response = [
+                {
+                    "appName": "amazon_aws",
+                    "label": APP_LABEL,
+                    "linkUrl": self.url + APP_PATH,
+                    "sortOrder": 0,
+                }
+            ]
+        elif path == APP_PATH:
+            page = (
+                "<html><body><form method='POST' "
+                "action='https://signin.aws.amazon.com/saml'>"
+                '<input name="SAMLResponse" type="hidden" value="%s"/>'
+                "</form></body></html>" % saml_assertion(self.role_count)
+            )
+            return 200, "text/html", page, {}
+        else:
+            return 404, "application/json", json.dumps({"errorCode": "E0000007"}), {}
+        return 200, "application/json", json.dumps(response), {}
+
+
+class FakeAws(_FakeServer):
+    """STS and IAM query APIs for one account"""
+
+    def handle(self, method, url, body):
+        params = parse_qs(body.decode("utf-8"))
+        params.update(parse_qs(url.query))
+        action = params.get("Action", ["?"])[0]
+        self.count(action)
+        if action == "AssumeRoleWithSAML":
+            duration = int(params.get("DurationSeconds", ["3600"])[0])
+            result = (
+                "<Credentials><AccessKeyId>ASIABENCH</AccessKeyId>"
+                "<SecretAccessKey>secret-bench</SecretAccessKey>"
+                "<SessionToken>session-bench</SessionToken>"
+                "<Expiration>%s</Expiration></Credentials>"
+                % _timestamp(duration, "%Y-%m-%dT%H:%M:%SZ")
+            )
+            xmlns = "https://sts.amazonaws.com/doc/2011-06-15/"
+        elif action == "GetCallerIdentity":
+            result = (
+                "<Arn>arn:aws:sts::%s:assumed-role/bench-0/bench</Arn>"
+                "<UserId>AROABENCH:bench</UserId><Account>%s</Account>"
+                % (ACCOUNT_ID, ACCOUNT_ID)
+            )
+            xmlns = "https://sts.amazonaws.com/doc/2011-06-15/"
+        elif action == "ListAccountAliases":
+            result = (
+                "<IsTruncated>false</IsTruncated>"
+                "<AccountAliases><member>%s</member></AccountAliases>" % ACCOUNT_ALIAS
+            )
+            xmlns = "https://iam.amazonaws.com/doc/2010-05-08/"
+        else:
+            return 400, "text/xml", "<ErrorResponse/>", {}
+        payload = (
+            '<%sResponse xmlns="%s"><%sResult>%s</%sResult>'
+            "<ResponseMetadata><RequestId>bench</RequestId></ResponseMetadata>"
+            "</%sResponse>" % (action, xmlns, action, result, action, action)
+        )
+        return 200, "text/xml", payload, {}
@@ -0,0 +1,90 @@
+"""Process-wide snapshot of ~/.okta-aws, reparsed only when the file changes."""
+
+import os
+import threading
+from configparser import ConfigParser
+
+DEFAULT_SECTION = "default"
+# Parsed with no real default section so each profile's own options stay
+# separate; inheritance from [default] is applied per lookup instead.
+_NO_DEFAULT_SECTION = "okta-awscli:no-default-section"
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def load_config(path):
+    """Return the snapshot of `path`, reparsing it only if it changed on disk.
+
+    A file counts as changed when its mtime, size or inode differ from the
+    cached snapshot's, so atomic replacements are always picked up.
+    """
+    signature = _signature(path)
+    snapshot = _snapshots.get(path)
+    if snapshot is not None and snapshot.signature == signature:
+        return snapshot
+    with _snapshots_lock:
+        snapshot = _snapshots.get(path)
+        if snapshot is None or snapshot.signature != signature:
+            snapshot = ConfigSnapshot(path, signature)
+            _snapshots[path] = snapshot
+    return snapshot
+
+
+def to_bool(value):
+    """Convert a config string the way ConfigParser.getboolean does"""
+    try:
+        return ConfigParser.BOOLEAN_STATES[value.lower()]
+    except KeyError:
+        raise ValueError("Not a boolean: %s" % value) from None
+
+
+class ConfigSnapshot:  # pylint: disable=too-few-public-methods
+    """One parse of ~/.okta-aws with memoized, typed lookups.
+
+    Lookups never touch the disk; call `load_config` again to pick up
+    changes.
+    """
+
+    def __init__(self, path, signature):
+        self.path = path
+        self.signature = signature
+        self._parser = ConfigParser(default_section=_NO_DEFAULT_SECTION)
+        if signature is not None:
+            self._parser.read(path)
+        self._resolved = {}
+
+    def get(self, section, key, fallback=None, convert=None, inherit=True):
+        """Return `key` for profile `section`, converted by `convert` if found
+
+        With `inherit`, existing profiles fall back to the [default]
+        profile's value; without it only the profile's own section is
+        consulted, as AwsAuth does for `role`.
+        """
+        cache_key = (section, key, fallback, convert, inherit)
+        try:
+            return self._resolved[cache_key]
+        except KeyError:
+            pass
+        value = self._parser.get(section, key, fallback=None)
+        if (
+            value is None
+            and inherit
+            and section != DEFAULT_SECTION
+            and self._parser.has_section(section)
+        ):
+            value = self._parser.get(DEFAULT_SECTION, key, fallback=None)
+        if value is None:
+            value = fallback
+        elif convert is not None:
+            value = convert(value)
+        self._resolved[cache_key] = value
+        return value
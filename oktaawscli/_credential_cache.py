@@ -0,0 +1,65 @@
+"""Per-role cache of unexpired STS credentials for credential_process mode."""
+
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+from oktaawscli._locking import atomic_write
+from oktaawscli._timestamps import format_expiration, parse_expiration
+
+CACHE_DIR_NAME = ".okta-aws-cache"
+
+
+def cache_path_for(okta_profile, account, role):
+    """Return the cache file for credentials requested with these settings.
+
+    The key is what decides which role gets chosen (okta profile, account
+    filter and predefined role), so it is known before talking to Okta.
+    """
+    key = "\0".join([okta_profile or "", account or "", role or ""])
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(os.path.expanduser("~"), CACHE_DIR_NAME, digest + ".json")
+
+
+def load(path, margin):
+    """Return the cached credential_process document at `path`, or None.
+
+    Entries expiring within `margin` seconds count as missing.
+    """
+    try:
+        with open(path, "r") as cache_file:
+            cached = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    return cached if is_fresh(cached, margin) else None
+
+
+def is_fresh(document, margin):
+    """Return whether a credential_process document outlives `margin` seconds."""
+    expiration = parse_expiration((document or {}).get("Expiration"))
+    if expiration is None:
+        return False
+    return (expiration - datetime.now(timezone.utc)).total_seconds() > margin
+
+
+def store(path, document):
+    """Atomically write a credential_process document to `path`."""
+    with atomic_write(path) as cache_file:
+        json.dump(document, cache_file)
+
+
+def ensure_cache_dir(path):
+    """Create the (user-only) directory holding `path` if needed."""
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+
+
+def credential_process_document(sts_token):
+    """Build the JSON document AWS SDKs expect from a credential_process."""
+    return {
+        "Version": 1,
+        "AccessKeyId": sts_token["AccessKeyId"],
+        "SecretAccessKey": sts_token["SecretAccessKey"],
+        "SessionToken": sts_token["SessionToken"],
+        "Expiration": format_expiration(sts_token["Expiration"]),
+    }
@@ -0,0 +1,194 @@
+"""Staged, single-commit edits to ~/.aws/credentials."""
+
+import os
+import re
+
+from oktaawscli._locking import atomic_write, locked
+
+_SECTION_RE = re.compile(r"\[(?P<name>[^\]]+)\]")
+_OPTION_RE = re.compile(r"(?P<key>[^=:\s][^=:]*?)\s*[=:]\s*(?P<value>.*)")
+_COMMENT_PREFIXES = ("#", ";")
+
+
+class CredentialsStore:
+    """Collects profile upserts, copies and deletes and applies them in one commit.
+
+    Nothing touches the file until `commit`, which takes the lock once,
+    reads the file once, applies the staged operations in order and only
+    rewrites the file if its content actually changed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._operations = []
+
+    def upsert(self, profile, values, remove=()):
+        """Stage setting `values` in `profile`, creating it if needed
+
+        Keys in `remove` are dropped from the profile.
+        """
+        self._operations.append(("upsert", (profile, dict(values), tuple(remove))))
+
+    def copy(self, source, target, keys, remove_missing=()):
+        """Stage copying `keys` from `source` into `target`
+
+        Keys in `remove_missing` that `source` lacks are dropped from `target`.
+        """
+        self._operations.append(("copy", (source, target, keys, remove_missing)))
+
+    def delete(self, profile):
+        """Stage removing `profile` entirely"""
+        self._operations.append(("delete", (profile,)))
+
+    def commit(self):
+        """Apply the staged operations, returning whether the file was rewritten"""
+        operations, self._operations = self._operations, []
+        if not operations:
+            return False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with locked(self.path, purpose="writing credentials"):
+            try:
+                with open(self.path, "r") as creds_file:
+                    original = creds_file.read()
+            except FileNotFoundError:
+                original = None
+            document = CredentialsDocument(original or "")
+            for name, args in operations:
+                getattr(document, name)(*args)
+            content = document.text()
+            if content == original:
+                return False
+            with atomic_write(self.path) as creds_file:
+                creds_file.write(content)
+        return True
+
+
+class CredentialsDocument:
+    """An INI file indexed by section, edited one profile block at a time.
+
+    Only the blocks of profiles being changed are rewritten: comments,
+    ordering and formatting everywhere else stay byte-identical. Section
+    headers must start their line. Keys are matched case-insensitively and
+    written as `key = value`, the way ConfigParser reads and writes them.
+    """
+
+    def __init__(self, text):
+        self._preamble = []
+        self._blocks = []
+        self._index = {}
+        block = self._preamble
+        for line in text.splitlines(keepends=True):
+            match = _SECTION_RE.match(line.strip()) if line[:1] == "[" else None
+            if match is not None:
+                block = [line]
+                self._index.setdefault(match.group("name"), len(self._blocks))
+                self._blocks.append(block)
+            else:
+                block.append(line)
+
+    def text(self):
+        """Return the document as file content"""
+        return "".join(self._preamble) + "".join(
+            "".join(block) for block in self._blocks if block
+        )
+
+    def get(self, profile, key):
+        """Return the value of `key` in `profile`, or None"""
+        block = self._block(profile)
+        if block is None:
+            return None
+        found = self._find_option(block, key)
+        if found is None:
+            return None
+        start, end = found
+        value = _OPTION_RE.match(block[start].strip()).group("value")
+        continuation = [line.strip() for line in block[start + 1 : end]]
+        return "\n".join([value] + continuation).rstrip("\n")
+
+    def upsert(self, profile, values, remove=()):
+        """Set `values` in `profile`, creating it at the end if needed"""
+        block = self._block(profile)
+        if block is None:
+            block = self._add_block(profile)
+        for key, value in values.items():
+            line = "%s = %s\n" % (key, str(value).replace("\n", "\n\t"))
+            found = self._find_option(block, key)
+            if found is None:
+                insert_at = self._end_of_options(block)
+                if not block[insert_at - 1].endswith("\n"):
+                    block[insert_at - 1] += "\n"
+                block.insert(insert_at, line)
+            else:
+                start, end = found
+                block[start:end] = [line]
+        for key in remove:
+            found = self._find_option(block, key)
+            if found is not None:
+                del block[found[0] : found[1]]
+
+    def copy(self, source, target, keys, remove_missing=()):
+        """Copy `keys` from `source` into `target`"""
+        if self._block(source) is None:
+            self._add_block(source)
+        values = {}
+        removed = []
+        for key in keys:
+            value = self.get(source, key)
+            if value is not None:
+                values[key] = value
+            elif key in remove_missing:
+                removed.append(key)
+        self.upsert(target, values, removed)
+
+    def delete(self, profile):
+        """Remove `profile`'s block, comments inside it included"""
+        position = self._index.pop(profile, None)
+        if position is not None:
+            self._blocks[position].clear()
+
+    def _block(self, profile):
+        position = self._index.get(profile)
+        return None if position is None else self._blocks[position]
+
+    def _add_block(self, profile):
+        last = next(
+            (block for block in reversed(self._blocks) if block), self._preamble
+        )
+        if last:
+            # Separate the new profile by a blank line, as ConfigParser does.
+            if not last[-1].endswith("\n"):
+                last[-1] += "\n"
+            if last[-1].strip():
+                last.append("\n")
+        block = ["[%s]\n" % profile, "\n"]
+        self._index[profile] = len(self._blocks)
+        self._blocks.append(block)
+        return block
+
+    @staticmethod
+    def _find_option(block, key):
+        """Return the line range of `key` and its continuation lines, or None"""
+        key = key.lower()
+        for start in range(1, len(block)):
+            line = block[start]
+            if line[:1].isspace() or line.lstrip().startswith(_COMMENT_PREFIXES):
+                continue
+            match = _OPTION_RE.match(line.strip())
+            if match is None or match.group("key").lower() != key:
+                continue
+            end = start + 1
+            while end < len(block) and block[end][:1].isspace() and block[end].strip():
+                end += 1
+            return start, end
+        return None
+
+    @staticmethod
+    def _end_of_options(block):
+        """Return the index just past the block's last non-blank, non-comment line"""
+        end = len(block)
+        while end > 1 and (
+            not block[end - 1].strip()
+            or block[end - 1].lstrip().startswith(_COMMENT_PREFIXES)
+        ):
+            end -= 1
+        return end
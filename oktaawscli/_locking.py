@@ -1,18 +1,283 @@
 """Cross-process advisory locking and atomic writes for dotfiles."""
 
+import errno
+import json
+import logging
 import os
+import socket
 import tempfile
-from contextlib import contextmanager
+import time
+from contextlib import contextmanager, suppress
 
-from filelock import FileLock
+from filelock import FileLock, Timeout
+
+from oktaawscli import _timing
+
+try:
+    import fcntl
+except ImportError:  # Windows: shared locks fall back to exclusive ones.
+    fcntl = None
 
 LOCK_TIMEOUT_SECONDS = 60
 INTERACTIVE_LOCK_TIMEOUT_SECONDS = 300
+# Next to each held lock file, e.g. ~/.okta-token.lock.holder.
+HOLDER_SUFFIX = ".holder"
+SHARED_LOCK_POLL_SECONDS = 0.05
+# Waits shorter than this are routine and not worth a warning.
+LOCK_WAIT_LOG_AFTER_SECONDS = 1.0
+
+_LOGGER = logging.getLogger("okta-awscli")
+
+
+def locked(path, timeout=LOCK_TIMEOUT_SECONDS, purpose=None, shared=False):
+    """Return a FileLock guarding `path`, using `<path>.lock` as the lock file.
+
+    While the lock is held, `<path>.lock.holder` records the holder's PID,
+    host, `purpose` and start time so that waiters and --lock-status can say
+    who they are waiting on.
+
+    With `shared`, return a reader lock instead: any number of processes may
+    hold it at once, but never together with the exclusive lock. Keep
+    exclusive locks for the short read-modify-write that commits a change.
+    Where flock isn't available the shared lock is an exclusive one.
+    """
+    if shared and fcntl is not None:
+        return SharedFileLock(f"{path}.lock", timeout=timeout, purpose=purpose)
+    return TelemetryFileLock(f"{path}.lock", timeout=timeout, purpose=purpose)
+
+
+class TelemetryFileLock(FileLock):
+    """A FileLock that records its wait and hold times and advertises its holder.
+
+    Wait and hold times go to the debug log and, with --timings, become the
+    `lock <name>` and `lock <name> held` phases. If the lock is busy, the
+    current holder is logged before waiting for it.
+    """
+
+    def __init__(self, lock_file, timeout=LOCK_TIMEOUT_SECONDS, purpose=None):
+        super().__init__(lock_file, timeout=timeout)
+        self.purpose = purpose
+        self.waited = None
+        self._acquired_at = None
+
+    @property
+    def name(self):
+        """The guarded file's name, e.g. `.okta-token`"""
+        return os.path.basename(self.lock_file)[: -len(".lock")]
+
+    def acquire(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        if self.is_locked or args or kwargs:
+            return super().acquire(*args, **kwargs)
+        start = time.perf_counter()
+        timeout = self.timeout
+        patience = LOCK_WAIT_LOG_AFTER_SECONDS
+        if timeout >= 0:
+            patience = min(timeout, patience)
+        with _timing.span("lock " + self.name):
+            try:
+                proxy = super().acquire(timeout=patience)
+            except Timeout:
+                if 0 <= timeout <= patience:
+                    raise
+                _log_wait(self.lock_file)
+                if timeout >= 0:
+                    timeout = max(timeout - (time.perf_counter() - start), 0)
+                proxy = super().acquire(timeout=timeout)
+        self._acquired_at = time.perf_counter()
+        self.waited = self._acquired_at - start
+        _write_holder(self.lock_file, self.purpose)
+        _LOGGER.debug(
+            "Acquired %s after waiting %.1f ms", self.lock_file, self.waited * 1000
+        )
+        return proxy
+
+    def release(self, force=False):
+        if self._acquired_at is not None and (force or self.lock_counter == 1):
+            held_since, self._acquired_at = self._acquired_at, None
+            # Still holding the lock, so the holder file is ours to remove.
+            with suppress(OSError):
+                os.remove(self.lock_file + HOLDER_SUFFIX)
+            released_at = time.perf_counter()
+            _timing.record("lock %s held" % self.name, held_since, released_at)
+            _LOGGER.debug(
+                "Released %s after holding it %.1f ms",
+                self.lock_file,
+                (released_at - held_since) * 1000,
+            )
+        super().release(force=force)
+
+
+class SharedFileLock:
+    """A shared flock on the lock file FileLock locks exclusively.
+
+    Used like FileLock and reentrant per instance. Shared holders don't
+    write `.holder` metadata; their wait and hold times are recorded as the
+    `lock <name> shared` and `lock <name> shared held` phases.
+    """
+
+    def __init__(self, lock_file, timeout=LOCK_TIMEOUT_SECONDS, purpose=None):
+        self.lock_file = lock_file
+        self.timeout = timeout
+        self.purpose = purpose
+        self.waited = None
+        self._fd = None
+        self._counter = 0
+        self._acquired_at = None
+
+    @property
+    def name(self):
+        """The guarded file's name, e.g. `.okta-alias-info`"""
+        return os.path.basename(self.lock_file)[: -len(".lock")]
 
+    @property
+    def is_locked(self):
+        """Whether this instance holds the lock"""
+        return self._fd is not None
 
-def locked(path, timeout=LOCK_TIMEOUT_SECONDS):
-    """Return a FileLock guarding `path`, using `<path>.lock` as the lock file."""
-    return FileLock(f"{path}.lock", timeout=timeout)
+    def acquire(self):
+        """Take the shared lock, waiting up to `timeout` seconds for writers"""
+        if self._fd is not None:
+            self._counter += 1
+            return self
+        start = time.perf_counter()
+        with _timing.span("lock %s shared" % self.name):
+            fd = _try_flock(self.lock_file, fcntl.LOCK_SH)
+            logged = False
+            while fd is None:
+                waited = time.perf_counter() - start
+                if 0 <= self.timeout <= waited:
+                    raise Timeout(self.lock_file)
+                if not logged and waited >= LOCK_WAIT_LOG_AFTER_SECONDS:
+                    _log_wait(self.lock_file)
+                    logged = True
+                time.sleep(SHARED_LOCK_POLL_SECONDS)
+                fd = _try_flock(self.lock_file, fcntl.LOCK_SH)
+        self._fd, self._counter = fd, 1
+        self._acquired_at = time.perf_counter()
+        self.waited = self._acquired_at - start
+        _LOGGER.debug(
+            "Acquired %s shared after waiting %.1f ms",
+            self.lock_file,
+            self.waited * 1000,
+        )
+        return self
+
+    def release(self, force=False):
+        """Drop one level of the shared lock, or all of them with `force`"""
+        if self._fd is None:
+            return
+        self._counter = 0 if force else self._counter - 1
+        if self._counter > 0:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+        released_at = time.perf_counter()
+        _timing.record(
+            "lock %s shared held" % self.name, self._acquired_at, released_at
+        )
+        _LOGGER.debug(
+            "Released %s shared after holding it %.1f ms",
+            self.lock_file,
+            (released_at - self._acquired_at) * 1000,
+        )
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def _try_flock(lock_file, operation):
+    """Open `lock_file` and flock it without blocking; return the fd, or None if busy"""
+    fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        # A lock on an inode unlinked since we opened it guards nothing.
+        if os.fstat(fd).st_nlink:
+            return fd
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    except OSError as ex:
+        if ex.errno not in (errno.EAGAIN, errno.EACCES):
+            os.close(fd)
+            raise
+    os.close(fd)
+    return None
+
+
+def _log_wait(lock_file):
+    _LOGGER.warning(
+        "Waiting for %s, %s", lock_file, describe_holder(read_holder(lock_file))
+    )
+
+
+def _write_holder(lock_file, purpose):
+    holder = {
+        "pid": os.getpid(),
+        "host": socket.gethostname(),
+        "purpose": purpose,
+        "acquired_at": round(time.time(), 3),
+    }
+    # Telemetry only: failing to advertise the holder must not fail the caller.
+    with suppress(OSError):
+        with atomic_write(lock_file + HOLDER_SUFFIX) as holder_file:
+            json.dump(holder, holder_file)
+
+
+def read_holder(lock_file):
+    """Return the holder metadata recorded for `lock_file`, or None"""
+    try:
+        with open(lock_file + HOLDER_SUFFIX) as holder_file:
+            holder = json.load(holder_file)
+    except (OSError, ValueError):
+        return None
+    return holder if isinstance(holder, dict) else None
+
+
+def describe_holder(holder):
+    """Return e.g. `held by PID 1234 on host (Okta login and MFA) for 12s`"""
+    if not holder:
+        return "holder unknown"
+    description = "held by PID %s on %s" % (holder.get("pid"), holder.get("host"))
+    if holder.get("purpose"):
+        description += " (%s)" % holder["purpose"]
+    acquired_at = holder.get("acquired_at")
+    if isinstance(acquired_at, (int, float)):
+        description += " for %ds" % max(0, time.time() - acquired_at)
+    return description
+
+
+def lock_status(lock_file):
+    """Return whether `lock_file` is held right now and its holder metadata
+
+    The result is a dict with `lock_file`, `held`, `shared` (held only by
+    shared lock holders) and `holder` (None when no metadata was recorded).
+    Probing never waits and never creates lock files that don't exist yet.
+    """
+    held = shared = False
+    if os.path.exists(lock_file):
+        probe = FileLock(lock_file, timeout=0)
+        try:
+            probe.acquire(blocking=False)
+        except Timeout:
+            held = True
+        else:
+            probe.release()
+    if held and fcntl is not None:
+        fd = _try_flock(lock_file, fcntl.LOCK_SH)
+        if fd is not None:
+            shared = True
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+    return {
+        "lock_file": lock_file,
+        "held": held,
+        "shared": shared,
+        "holder": None if shared else read_holder(lock_file),
+    }
 
 
 @contextmanager
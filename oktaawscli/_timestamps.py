@@ -0,0 +1,24 @@
+"""UTC timestamps as written to the credentials file and okta-awscli caches."""
+
+from datetime import datetime, timezone
+
+
+def format_expiration(expiration):
+    """Formats an STS expiration datetime as an ISO 8601 UTC timestamp"""
+    return expiration.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_expiration(value):
+    """Parses a timestamp written by format_expiration, returning None if invalid
+
+    Fractional seconds, as in SAML NotOnOrAfter instants, are accepted too.
+    """
+    if not value:
+        return None
+    try:
+        expiration = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if expiration.tzinfo is None:
+        expiration = expiration.replace(tzinfo=timezone.utc)
+    return expiration
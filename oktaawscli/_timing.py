@@ -0,0 +1,188 @@
+"""Opt-in phase timings behind --timings and --timings-json.
+
+Recording is off unless `enable` is called. While it is off, `span` hands
+back one shared no-op context manager and functions wrapped by `timed`
+call straight through: about 0.2 microseconds per instrumented call and
+no allocations.
+"""
+
+import functools
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+_recorder = None  # pylint: disable=invalid-name
+
+
+class _NoSpan:
+    """The context manager `span` returns while recording is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    """One timed phase, recorded when its with block exits"""
+
+    def __init__(self, recorder, name):
+        self._recorder = recorder
+        self._name = name
+        self._path = None
+        self._start = None
+
+    def __enter__(self):
+        stack = self._recorder.stack()
+        stack.append(self._name)
+        self._path = "/".join(stack)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        self._recorder.stack().pop()
+        self._recorder.add(self._name, self._path, self._start, end)
+        return False
+
+
+class Recorder:
+    """Collects spans from every thread of one run"""
+
+    def __init__(self):
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def stack(self):
+        """Return the names of the spans open in the calling thread"""
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def add(self, name, path, start, end):
+        """Record a finished span"""
+        span_record = {
+            "name": name,
+            "path": path,
+            "thread": threading.current_thread().name,
+            "start_ms": round((start - self.start) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+        }
+        with self._lock:
+            self.spans.append(span_record)
+
+    def phases(self):
+        """Return per-path call counts and total time
+
+        Phases are ordered by when they first started, each followed by the
+        phases nested in it.
+        """
+        phases = {}
+        for span_record in sorted(self.spans, key=lambda s: s["start_ms"]):
+            phase = phases.setdefault(
+                span_record["path"],
+                {"path": span_record["path"], "calls": 0, "total_ms": 0.0},
+            )
+            phase["calls"] += 1
+            phase["total_ms"] = round(phase["total_ms"] + span_record["duration_ms"], 3)
+        first_start = {path: index for index, path in enumerate(phases)}
+
+        def tree_order(phase):
+            parts = phase["path"].split("/")
+            return tuple(
+                first_start.get("/".join(parts[: depth + 1]), -1)
+                for depth in range(len(parts))
+            )
+
+        return sorted(phases.values(), key=tree_order)
+
+
+def enable():
+    """Start recording spans, returning the Recorder"""
+    global _recorder  # pylint: disable=global-statement
+    _recorder = Recorder()
+    return _recorder
+
+
+def disable():
+    """Stop recording, returning the Recorder that was active, if any"""
+    global _recorder  # pylint: disable=global-statement
+    recorder, _recorder = _recorder, None
+    return recorder
+
+
+def enabled():
+    """Return whether spans are being recorded"""
+    return _recorder is not None
+
+
+def span(name):
+    """Return a context manager timing its block as phase `name`"""
+    if _recorder is None:
+        return _NO_SPAN
+    return _Span(_recorder, name)
+
+
+def record(name, start, end):
+    """Record a phase `name` that ran from `start` to `end` (perf_counter values)"""
+    recorder = _recorder
+    if recorder is None:
+        return
+    path = "/".join(recorder.stack() + [name])
+    recorder.add(name, path, start, end)
+
+
+def timed(name):
+    """Decorate a function so each call is timed as phase `name`"""
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            with _Span(_recorder, name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def report(recorder, total_ms, stream=None):
+    """Print the phase breakdown, nested phases indented under their parent"""
+    stream = stream or sys.stderr
+    print("okta-awscli timings (%.1f ms total)" % total_ms, file=stream)
+    print("  %-44s %6s %11s %7s" % ("phase", "calls", "total ms", "%"), file=stream)
+    for phase in recorder.phases():
+        depth = phase["path"].count("/")
+        name = "  " * depth + phase["path"].rsplit("/", 1)[-1]
+        share = 100.0 * phase["total_ms"] / total_ms if total_ms else 0.0
+        print(
+            "  %-44s %6d %11.1f %6.1f%%"
+            % (name, phase["calls"], phase["total_ms"], share),
+            file=stream,
+        )
+
+
+def write_json(recorder, total_ms, path, version):
+    """Append the run's timings to `path` as one JSON line"""
+    record = {
+        "okta_awscli_version": version,
+        "started_at": recorder.started_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        "total_ms": round(total_ms, 3),
+        "phases": recorder.phases(),
+        "spans": sorted(recorder.spans, key=lambda s: s["start_ms"]),
+    }
+    with open(path, "a") as timings_file:
+        timings_file.write(json.dumps(record, sort_keys=True) + "\n")
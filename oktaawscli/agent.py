@@ -0,0 +1,169 @@
+"""Long-running credential agent serving credential_process JSON over a Unix socket.
+
+The agent keeps STS credentials in memory, keyed by okta profile and account,
+and refreshes them in the background before they expire. Clients send one
+JSON request line and read one JSON response line, so `request_credentials`
+needs nothing beyond the standard library.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import threading
+
+SOCKET_NAME = ".okta-awscli-agent.sock"
+CLIENT_TIMEOUT_SECONDS = 330
+REFRESH_INTERVAL_SECONDS = 60
+MAX_MESSAGE_BYTES = 64 * 1024
+
+
+class AgentError(Exception):
+    """Raised by the client when the agent can't be reached or returns an error."""
+
+
+def socket_path():
+    """Return the per-user socket the agent listens on."""
+    return os.path.join(os.path.expanduser("~"), SOCKET_NAME)
+
+
+def request_credentials(
+    okta_profile, account, path=None, timeout=CLIENT_TIMEOUT_SECONDS
+):
+    """Ask a running agent for credentials, returning the credential_process document.
+
+    The timeout is generous because a cold request may wait on MFA in the
+    agent's terminal.
+    """
+    request = json.dumps({"okta_profile": okta_profile, "account": account})
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(timeout)
+            conn.connect(path or socket_path())
+            conn.sendall(request.encode("utf-8") + b"\n")
+            conn.shutdown(socket.SHUT_WR)
+            with conn.makefile("rb") as stream:
+                line = stream.readline(MAX_MESSAGE_BYTES)
+    except OSError as ex:
+        raise AgentError("okta-awscli agent unavailable: %s" % ex) from ex
+    try:
+        response = json.loads(line)
+    except ValueError as ex:
+        raise AgentError("Malformed response from okta-awscli agent") from ex
+    if "error" in response:
+        raise AgentError(response["error"])
+    return response["credentials"]
+
+
+class CredentialAgent:
+    """In-memory credential store shared by all agent connections.
+
+    `fetch(okta_profile, account)` returns a fresh credential_process
+    document; it is called under one lock because it may prompt for MFA.
+    """
+
+    def __init__(
+        self, fetch, logger, margin, refresh_interval=REFRESH_INTERVAL_SECONDS
+    ):
+        self.fetch = fetch
+        self.logger = logger
+        self.margin = margin
+        self.refresh_interval = refresh_interval
+        self._documents = {}
+        self._fetch_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def credentials(self, okta_profile, account):
+        """Return unexpired credentials, authenticating only when they're missing"""
+        from oktaawscli._credential_cache import is_fresh
+
+        key = (okta_profile, account)
+        document = self._documents.get(key)
+        if is_fresh(document, self.margin):
+            return document
+        with self._fetch_lock:
+            document = self._documents.get(key)
+            if not is_fresh(document, self.margin):
+                document = self.fetch(okta_profile, account)
+                self._documents[key] = document
+        return document
+
+    def refresh_expiring(self):
+        """Refetch credentials that would expire before the next refresh pass"""
+        from oktaawscli._credential_cache import is_fresh
+
+        horizon = self.margin + self.refresh_interval
+        for key, document in list(self._documents.items()):
+            if is_fresh(document, horizon):
+                continue
+            self.logger.info("Refreshing credentials for %s/%s", *key)
+            try:
+                with self._fetch_lock:
+                    self._documents[key] = self.fetch(*key)
+            except (Exception, SystemExit) as ex:  # pylint: disable=broad-except
+                # Keep serving what we have; the next pass tries again.
+                self.logger.warning("Could not refresh %s/%s: %s", *key, ex)
+
+    def _refresh_loop(self):
+        while not self._stopped.wait(self.refresh_interval):
+            self.refresh_expiring()
+
+    def serve(self, path=None):
+        """Listen on `path` (default ~/.okta-awscli-agent.sock) until interrupted"""
+        path = path or socket_path()
+        server = self.make_server(path)
+        refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+        refresher.start()
+        self.logger.warning("okta-awscli agent listening on %s", path)
+        try:
+            server.serve_forever()
+        finally:
+            self._stopped.set()
+            server.server_close()
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def make_server(self, path):
+        """Bind a user-only socket at `path`, replacing one left by a dead agent"""
+        if os.path.exists(path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(path)
+            except OSError:
+                os.unlink(path)
+            else:
+                raise AgentError(
+                    "An okta-awscli agent is already listening on %s" % path
+                )
+        # Create the socket 0600 from the start so no other user can connect.
+        old_umask = os.umask(0o177)
+        try:
+            server = _AgentServer(path, _AgentHandler)
+        finally:
+            os.umask(old_umask)
+        server.agent = self
+        return server
+
+
+class _AgentServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    agent = None
+
+
+class _AgentHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline(MAX_MESSAGE_BYTES))
+            document = self.server.agent.credentials(
+                request.get("okta_profile") or "default", request.get("account")
+            )
+            response = {"credentials": document}
+        except SystemExit:
+            # OktaAuth exits on fatal auth errors; report it instead of dying.
+            response = {"error": "Authentication failed; see the agent's output"}
+        except Exception as ex:  # pylint: disable=broad-except
+            self.server.agent.logger.error("Agent request failed: %s", ex)
+            response = {"error": str(ex)}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
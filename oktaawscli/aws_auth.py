@@ -1,17 +1,194 @@
 """AWS authentication"""
 
-import base64
+import atexit
+import fnmatch
 import json
 import os
-import xml.etree.ElementTree as ET
+import threading
+import time
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
-from datetime import date, datetime
-
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError, ProfileNotFound
+from datetime import date, datetime, timezone
 
+from oktaawscli._config_snapshot import load_config, to_bool
+from oktaawscli._credentials_store import CredentialsStore
 from oktaawscli._locking import atomic_write, locked
+from oktaawscli._timestamps import format_expiration, parse_expiration
+from oktaawscli._timing import timed
+from oktaawscli.saml import encoded, parse_assertion
+
+# boto3 and botocore are imported inside the methods that call AWS: together they
+# take hundreds of milliseconds to import and the cached-credentials path never
+# needs them.
+
+DEFAULT_ALIAS_CONCURRENCY = 8
+DEFAULT_ALIAS_TIMEOUT_SECONDS = 10
+DEFAULT_STS_CONCURRENCY = 8
+DEFAULT_STS_TIMEOUT_SECONDS = 10
+DEFAULT_EXPIRY_MARGIN_SECONDS = 300
+# Aliases older than alias-ttl days are served as they are for another
+# alias-stale-grace days while a background thread refreshes them; after that
+# they are looked up before the role list is shown.
+DEFAULT_ALIAS_TTL_DAYS = 7
+DEFAULT_ALIAS_STALE_GRACE_DAYS = 30
+# How long the process waits at exit for a background alias refresh. A
+# refresh can take far longer (each role tried costs an STS and an IAM call,
+# each retried and with separate connect and read timeouts, then a lock wait);
+# one cut off here is redone by a later run.
+ALIAS_REFRESH_EXIT_WAIT_SECONDS = 5
+# Entries not refreshed for ALIAS_CACHE_MAX_AGE_DAYS (or alias-ttl plus
+# alias-stale-grace, if longer) belong to accounts nobody has used in weeks and
+# are evicted, as are the least recently refreshed beyond ALIAS_CACHE_MAX_ENTRIES.
+ALIAS_CACHE_MAX_AGE_DAYS = 30
+ALIAS_CACHE_MAX_ENTRIES = 1000
+
+# Extra keys stored next to each profile in ~/.aws/credentials. The AWS SDKs
+# ignore unknown keys; we use them to decide validity without calling STS.
+EXPIRATION_KEY = "x_security_token_expires"
+ROLE_ARN_KEY = "x_role_arn"
+METADATA_KEYS = (EXPIRATION_KEY, ROLE_ARN_KEY)
+PROFILE_KEYS = (
+    "output",
+    "region",
+    "aws_access_key_id",
+    "aws_secret_access_key",
+    "aws_session_token",
+    "aws_security_token",
+) + METADATA_KEYS
+
+# AssumeRoleWithSAML errors that mean the assertion itself was refused, so a
+# freshly fetched one may succeed.
+REJECTED_ASSERTION_ERROR_CODES = ("ExpiredTokenException", "InvalidIdentityToken")
+
+AliasPolicy = namedtuple("AliasPolicy", ["ttl_days", "stale_grace_days"])
+# Worker pool size and per-call connect/read timeout for a kind of AWS call.
+CallLimits = namedtuple("CallLimits", ["concurrency", "timeout"])
+
+# (thread, join timeout) for background work the process waits on at exit.
+_BACKGROUND_THREADS = []
+_BACKGROUND_LOCK = threading.Lock()
+
+
+def is_rejected_assertion(error):
+    """Returns True if STS refused an AssumeRoleWithSAML call over the assertion"""
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in REJECTED_ASSERTION_ERROR_CODES
+
+
+def _account_id(role_arn):
+    """Returns the AWS account ID in a role ARN"""
+    return role_arn.split(":")[4]
+
+
+def _alias_updated_on(entry):
+    """Returns the date an ~/.okta-alias-info entry was refreshed, or date.min"""
+    try:
+        return datetime.strptime(entry.get("last_updated"), "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return date.min
+
+
+def _by_account(okta_info):
+    """Keys ~/.okta-alias-info entries by account ID
+
+    Older versions keyed entries by role ARN; those are folded into their
+    account, keeping the most recently refreshed.
+    """
+    accounts = {}
+    for key, entry in okta_info.items():
+        parts = key.split(":")
+        account_id = parts[4] if key.startswith("arn:") and len(parts) > 4 else key
+        current = accounts.get(account_id)
+        if current is None or _alias_updated_on(entry) > _alias_updated_on(current):
+            accounts[account_id] = entry
+    return accounts
+
+
+def _evict_aliases(okta_info, current_date, max_age_days):
+    """Drops aged-out entries, then the oldest beyond ALIAS_CACHE_MAX_ENTRIES"""
+    entries = [
+        (account_id, entry)
+        for account_id, entry in okta_info.items()
+        if (current_date - _alias_updated_on(entry)).days < max_age_days
+    ]
+    if len(entries) > ALIAS_CACHE_MAX_ENTRIES:
+        entries.sort(key=lambda item: (_alias_updated_on(item[1]), item[0]))
+        entries = entries[-ALIAS_CACHE_MAX_ENTRIES:]
+    return dict(entries)
+
+
+def _call_limits(config, okta_profile, name, concurrency, timeout):
+    """Reads the `<name>-concurrency` and `<name>-timeout` settings of a profile"""
+    return CallLimits(
+        max(
+            1,
+            config.get(
+                okta_profile,
+                name + "-concurrency",
+                fallback=concurrency,
+                convert=int,
+            ),
+        ),
+        config.get(okta_profile, name + "-timeout", fallback=timeout, convert=float),
+    )
+
+
+_sessions = threading.local()
+
+
+def _profileless_session():
+    """Returns this thread's boto3 session that ignores AWS_PROFILE and AWS_DEFAULT_PROFILE
+
+    The profile named there may not exist yet on first-time setup, and the
+    credentials fetched come from the SAML assertion anyway. The profile
+    session variable is read from no environment variable, so os.environ is
+    left alone. boto3 sessions are not thread-safe, so each thread keeps its
+    own; reusing it saves loading botocore's service models on every call.
+    """
+    import boto3
+    import botocore.session
+
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        core = botocore.session.Session(
+            session_vars={"profile": (None, None, None, None)}
+        )
+        session = boto3.session.Session(botocore_session=core)
+        _sessions.session = session
+    return session
+
+
+def run_in_background(target, join_timeout, name):
+    """Runs `target` on a daemon thread the process waits on at exit
+
+    At exit each thread gets up to `join_timeout` seconds to finish; work
+    cut off there is redone by a later run.
+    """
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    with _BACKGROUND_LOCK:
+        _BACKGROUND_THREADS[:] = [
+            entry for entry in _BACKGROUND_THREADS if entry[0].is_alive()
+        ]
+        _BACKGROUND_THREADS.append((thread, join_timeout))
+    thread.start()
+    return thread
+
+
+def join_background_threads():
+    """Waits for work started by run_in_background
+
+    Threads are waited on together: the whole wait lasts no longer than the
+    largest `join_timeout` among them.
+    """
+    with _BACKGROUND_LOCK:
+        pending, _BACKGROUND_THREADS[:] = list(_BACKGROUND_THREADS), []
+    start = time.monotonic()
+    for thread, join_timeout in pending:
+        thread.join(max(0.0, start + join_timeout - time.monotonic()))
+
+
+atexit.register(join_background_threads)
 
 
 class AwsAuth:
@@ -43,26 +220,76 @@ class AwsAuth:
         if not os.path.isfile(okta_info):
             open(okta_info, "a").close()
 
-        okta_config = os.path.join(home_dir, ".okta-aws")
-        parser = ConfigParser()
-        parser.read(okta_config)
-
-        if parser.has_option(okta_profile, "role") and not reset:
-            self.role = parser.get(okta_profile, "role")
+        config = load_config(os.path.join(home_dir, ".okta-aws"))
+        # A predefined role belongs to its own okta profile; a role set under
+        # [default] must not be assumed for other profiles. Other settings
+        # fall back to [default] like the rest of ~/.okta-aws.
+        role = config.get(okta_profile, "role", inherit=False)
+        if role is not None and not reset:
+            self.role = role
             self.logger.debug("Setting AWS role to %s" % self.role)
 
-    def choose_aws_role(self, assertion):
-        """Choose AWS role from SAML assertion"""
+        self.alias_limits = _call_limits(
+            config,
+            okta_profile,
+            "alias",
+            DEFAULT_ALIAS_CONCURRENCY,
+            DEFAULT_ALIAS_TIMEOUT_SECONDS,
+        )
+        self.sts_limits = _call_limits(
+            config,
+            okta_profile,
+            "sts",
+            DEFAULT_STS_CONCURRENCY,
+            DEFAULT_STS_TIMEOUT_SECONDS,
+        )
+        self.expiry_margin = config.get(
+            okta_profile,
+            "expiry-margin",
+            fallback=DEFAULT_EXPIRY_MARGIN_SECONDS,
+            convert=int,
+        )
+        self.remote_creds_check = config.get(
+            okta_profile,
+            "remote-creds-check",
+            fallback=False,
+            convert=to_bool,
+        )
+        self.alias_policy = AliasPolicy(
+            config.get(
+                okta_profile,
+                "alias-ttl",
+                fallback=DEFAULT_ALIAS_TTL_DAYS,
+                convert=int,
+            ),
+            config.get(
+                okta_profile,
+                "alias-stale-grace",
+                fallback=DEFAULT_ALIAS_STALE_GRACE_DAYS,
+                convert=int,
+            ),
+        )
+
+    @timed("aws.choose_role")
+    def choose_aws_role(self, assertion, resolve_alias=True):
+        """Choose AWS role from SAML assertion
+
+        Returns (role_arn, principal_arn, alias). Account aliases are looked up
+        for every role only when the menu is shown; a predefined or only role
+        gets its alias looked up just if `resolve_alias` is set. The alias is
+        "unknown" if the role may not read it, and None if it wasn't looked up
+        or the lookup failed.
+        """
 
-        roles = self.__extract_available_roles_from(assertion)
+        assertion = parse_assertion(assertion)
+        roles = assertion.roles
         if self.account:
             roles = [elem for elem in roles if self.account in elem[1]]
-        role_info = self.__get_role_info(roles, assertion)
         if self.role:
-            predefined_role = self.__find_predefined_role_from(role_info)
+            predefined_role = self.__find_predefined_role_from(roles)
             if predefined_role:
                 self.logger.info("Using predefined role: %s" % self.role)
-                return predefined_role
+                return self.__with_alias(predefined_role, assertion, resolve_alias)
             else:
                 self.logger.info(
                     "Predefined role, %s, not found in the list of roles assigned to you."
@@ -72,8 +299,9 @@ class AwsAuth:
 
         if len(roles) == 1:
             print("One role found, using role: %s" % roles[0][1])
-            return role_info[0]
+            return self.__with_alias(roles[0], assertion, resolve_alias)
 
+        role_info = self.__get_role_info(roles, assertion)
         role_options = self.__create_options_from(role_info)
         role_choice = None
         while role_choice is None:
@@ -88,35 +316,92 @@ class AwsAuth:
                 print("\nYou have selected an invalid role index, please try again.\n")
                 role_choice = None
 
-    def get_sts_token(self, role_arn, principal_arn, assertion, duration):
-        """Gets a token from AWS STS"""
-        try:
-            # Temporarily remove the profile envvar because it can cause first-time setup issues
-            profile = os.environ.pop("AWS_PROFILE", None)
-            # Connect to the GovCloud STS endpoint if a GovCloud ARN is found.
-            arn_region = principal_arn.split(":")[1]
-            if arn_region == "aws-us-gov":
-                sts = boto3.client("sts", region_name="us-gov-west-1")
-            else:
-                sts = boto3.client("sts", region_name=self.region)
-            if profile is not None:
-                os.environ["AWS_PROFILE"] = profile
-        except ProfileNotFound:
-            self.logger.exception(
-                "Unable to handle AWS_PROFILE=%s" % os.environ["AWS_PROFILE"]
+    @timed("aws.choose_role")
+    def choose_aws_roles(self, assertion, patterns):
+        """Choose every AWS role from SAML assertion matching any of `patterns`
+
+        A pattern is a glob matched against the role ARN, the account alias and
+        the account ID.
+        """
+        assertion = parse_assertion(assertion)
+        roles = assertion.roles
+        if self.account:
+            roles = [elem for elem in roles if self.account in elem[1]]
+        role_info = self.__get_role_info(roles, assertion)
+        return [
+            role
+            for role in role_info
+            if any(
+                fnmatch.fnmatchcase(candidate, pattern)
+                for pattern in patterns
+                for candidate in (role[0], role[2] or "", role[0].split(":")[4])
             )
+        ]
+
+    @timed("aws.assume_roles")
+    def get_sts_tokens(self, roles, assertion, duration):
+        """
+        Gets tokens from AWS STS for several roles concurrently
+        :param roles: (role_arn, principal_arn, alias) tuples from choose_aws_roles.
+        :param assertion: The SAML assertion.
+        :param duration: The session duration in seconds.
+        :return: A list of (role, credentials, error) tuples in the order of `roles`.
+        Exactly one of credentials and error is None.
+        """
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        if not roles:
+            return []
+
+        with ThreadPoolExecutor(
+            max_workers=min(self.sts_limits.concurrency, len(roles))
+        ) as executor:
+            futures = [
+                executor.submit(
+                    self.__assume_role, role[0], role[1], assertion, duration
+                )
+                for role in roles
+            ]
 
+        results = []
+        for role, future in zip(roles, futures):
+            try:
+                results.append((role, future.result(), None))
+            except (BotoCoreError, ClientError) as ex:
+                self.logger.debug(
+                    "Unable to assume role %s", role[0], exc_info=self.debug
+                )
+                results.append((role, None, ex))
+        return results
+
+    def get_sts_token(self, role_arn, principal_arn, assertion, duration):
+        """Gets a token from AWS STS"""
+        return self.__assume_role(role_arn, principal_arn, assertion, duration)
+
+    @timed("aws.assume_role")
+    def __assume_role(self, role_arn, principal_arn, assertion, duration):
+        """Assumes a role with a client safe to use from a worker thread"""
+        # Connect to the GovCloud STS endpoint if a GovCloud ARN is found.
+        if principal_arn.split(":")[1] == "aws-us-gov":
+            region = "us-gov-west-1"
+        else:
+            region = self.region
+        sts = self.__thread_client("sts", self.sts_limits.timeout, region_name=region)
         response = sts.assume_role_with_saml(
             RoleArn=role_arn,
             PrincipalArn=principal_arn,
-            SAMLAssertion=assertion,
+            SAMLAssertion=encoded(assertion),
             DurationSeconds=duration,
         )
-        credentials = response["Credentials"]
-        return credentials
+        return response["Credentials"]
+
+    @timed("aws.check_credentials")
+    def check_sts_token(self, profile, margin=None):
+        """Verifies that STS credentials are valid
 
-    def check_sts_token(self, profile):
-        """Verifies that STS credentials are valid"""
+        With `margin`, credentials count as valid only if they outlive it by
+        their stored expiration; there is no remote fallback in that case.
+        """
         # Don't check for creds if profile is blank
         if not profile:
             return False
@@ -138,6 +423,47 @@ class AwsAuth:
             )
             return False
 
+        stored_role = parser.get(profile, ROLE_ARN_KEY, fallback=None)
+        if self.role and stored_role and stored_role != self.role:
+            self.logger.info(
+                "Stored credentials are for role %s, not %s. Requesting new credentials."
+                % (stored_role, self.role)
+            )
+            return False
+
+        expiration = parse_expiration(
+            parser.get(profile, EXPIRATION_KEY, fallback=None)
+        )
+        if expiration is None:
+            if self.remote_creds_check and margin is None:
+                return self.__check_sts_token_remotely(profile)
+            self.logger.info(
+                "No stored expiration for credentials. Requesting new credentials."
+            )
+            return False
+
+        if margin is None:
+            margin = self.expiry_margin
+        remaining = (expiration - datetime.now(timezone.utc)).total_seconds()
+        if remaining <= margin:
+            self.logger.info(
+                "Temporary credentials have expired or expire within %s seconds. "
+                "Requesting new credentials." % margin
+            )
+            return False
+
+        print("AWS credentials are valid. Nothing to do.")
+        self.logger.info(
+            "STS credentials are valid for another %d minutes. Nothing to do."
+            % (remaining // 60)
+        )
+        return True
+
+    def __check_sts_token_remotely(self, profile):
+        """Verifies that STS credentials are valid by calling sts:GetCallerIdentity"""
+        import boto3
+        from botocore.exceptions import ClientError, NoCredentialsError
+
         session = boto3.Session(profile_name=profile)
         sts = session.client("sts")
         try:
@@ -160,129 +486,302 @@ class AwsAuth:
         return True
 
     def write_sts_token(
-        self, profile, access_key_id, secret_access_key, session_token, region=None
+        self,
+        profile,
+        access_key_id,
+        secret_access_key,
+        session_token,
+        region=None,
+        expiration=None,
+        role_arn=None,
+        write_default=False,
     ):
         """Writes STS auth information to credentials file"""
-        region = region or self.region
-        output = "json"
-        if not os.path.exists(self.creds_dir):
-            os.makedirs(self.creds_dir)
-
-        with locked(self.creds_file):
-            config = ConfigParser()
-            if os.path.isfile(self.creds_file):
-                config.read(self.creds_file)
-            if not config.has_section(profile):
-                config.add_section(profile)
-            config.set(profile, "output", output)
-            config.set(profile, "region", region)
-            config.set(profile, "aws_access_key_id", access_key_id)
-            config.set(profile, "aws_secret_access_key", secret_access_key)
-            config.set(profile, "aws_session_token", session_token)
-            config.set(profile, "aws_security_token", session_token)
-            with atomic_write(self.creds_file) as configfile:
-                config.write(configfile)
-
-        print("Temporary credentials written to profile: %s" % profile)
-        self.logger.info("Invoke using: aws --profile %s <service> <command>" % profile)
+        self.write_sts_tokens(
+            [
+                {
+                    "profile": profile,
+                    "access_key_id": access_key_id,
+                    "secret_access_key": secret_access_key,
+                    "session_token": session_token,
+                    "region": region,
+                    "expiration": expiration,
+                    "role_arn": role_arn,
+                }
+            ],
+            write_default=write_default,
+        )
+
+    @timed("aws.write_credentials")
+    def write_sts_tokens(self, tokens, write_default=False):
+        """Writes several profiles to the credentials file in one locked read-modify-write
 
+        Each entry of `tokens` is a dict of write_sts_token keyword arguments.
+        With `write_default`, the first profile is also copied to [default] in
+        the same commit.
+        """
+        store = self.credentials_store()
+        for token in tokens:
+            expiration = token.get("expiration")
+            values = {
+                "output": "json",
+                "region": token.get("region") or self.region,
+                "aws_access_key_id": token["access_key_id"],
+                "aws_secret_access_key": token["secret_access_key"],
+                "aws_session_token": token["session_token"],
+                "aws_security_token": token["session_token"],
+                EXPIRATION_KEY: expiration and format_expiration(expiration),
+                ROLE_ARN_KEY: token.get("role_arn"),
+            }
+            # Drop metadata we weren't given so it can't vouch for the new keys.
+            store.upsert(
+                token["profile"],
+                {key: value for key, value in values.items() if value},
+                remove=[key for key in METADATA_KEYS if not values[key]],
+            )
+        profiles = [token["profile"] for token in tokens]
+        if write_default and tokens:
+            store.copy(profiles[0], "default", PROFILE_KEYS, METADATA_KEYS)
+            profiles.append("default")
+        store.commit()
+
+        for profile in profiles:
+            print("Temporary credentials written to profile: %s" % profile)
+            self.logger.info(
+                "Invoke using: aws --profile %s <service> <command>" % profile
+            )
+
+    @timed("aws.write_credentials")
     def copy_to_default(self, profile):
         """Reads STS auth information from credentials file"""
-        if not os.path.exists(self.creds_dir):
-            os.makedirs(self.creds_dir)
-
-        with locked(self.creds_file):
-            config = ConfigParser()
-            if os.path.isfile(self.creds_file):
-                config.read(self.creds_file)
-            if not config.has_section(profile):
-                config.add_section(profile)
-            if not config.has_section("default"):
-                config.add_section("default")
-
-            for key in (
-                "output",
-                "region",
-                "aws_access_key_id",
-                "aws_secret_access_key",
-                "aws_session_token",
-                "aws_security_token",
-            ):
-                if config.has_option(profile, key):
-                    config.set("default", key, config.get(profile, key))
-
-            with atomic_write(self.creds_file) as configfile:
-                config.write(configfile)
-
-    @staticmethod
-    def __extract_available_roles_from(assertion):
-        aws_attribute_role = "https://aws.amazon.com/SAML/Attributes/Role"
-        attribute_value_urn = "{urn:oasis:names:tc:SAML:2.0:assertion}AttributeValue"
-        roles = []
-        role_tuple = namedtuple("RoleTuple", ["principal_arn", "role_arn"])
-        root = ET.fromstring(base64.b64decode(assertion))
-        for saml2attribute in root.iter(
-            "{urn:oasis:names:tc:SAML:2.0:assertion}Attribute"
-        ):
-            if saml2attribute.get("Name") == aws_attribute_role:
-                for saml2attributevalue in saml2attribute.iter(attribute_value_urn):
-                    roles.append(role_tuple(*saml2attributevalue.text.split(",")))
-        return roles
+        store = self.credentials_store()
+        store.copy(profile, "default", PROFILE_KEYS, METADATA_KEYS)
+        store.commit()
+
+    def credentials_store(self):
+        """Returns a CredentialsStore that batches edits to the credentials file"""
+        return CredentialsStore(self.creds_file)
+
+    def __with_alias(self, role, assertion, resolve_alias):
+        """Returns a RoleTuple as (role_arn, principal_arn, alias)"""
+        if not resolve_alias:
+            return role.role_arn, role.principal_arn, None
+        role_info = self.__get_role_info([role], assertion)
+        if role_info:
+            return role_info[0]
+        # The alias lookup couldn't assume the role; let STS report why.
+        return role.role_arn, role.principal_arn, None
 
+    @timed("aws.role_info")
     def __get_role_info(self, roles, assertion):
-        """Gets role info from okta-info.json"""
+        """Gets role info from ~/.okta-alias-info, resolving missing aliases
+
+        Aliases are cached per account, so each account is looked up once
+        however many of its roles the assertion grants. The cache is read
+        under a shared lock and aliases are looked up with no lock held, so
+        runs with fresh aliases never wait behind a refresh. Aliases past
+        alias-ttl but within alias-stale-grace are used as they are and
+        refreshed on a background thread. Only merging refreshed aliases into
+        the cache takes the exclusive lock.
+        """
         info_file_path = os.path.expanduser("~") + "/.okta-alias-info"
 
-        with locked(info_file_path):
+        with locked(info_file_path, purpose="reading account aliases", shared=True):
+            okta_info = self.__read_alias_info(info_file_path)
+
+        current_date = date.today()
+        ttl_days, stale_grace_days = self.alias_policy
+        accounts = {}
+        for role in roles:
+            accounts.setdefault(_account_id(role.role_arn), []).append(role)
+
+        cached = {}
+        missing_accounts = {}
+        stale_accounts = {}
+        for account_id, account_roles in accounts.items():
+            entry = okta_info.get(account_id, {})
+            alias = entry.get("alias")
+
+            alias_age = current_date - _alias_updated_on(entry)
+            if alias is None or alias_age.days >= ttl_days + stale_grace_days:
+                missing_accounts[account_id] = account_roles
+            else:
+                cached[account_id] = alias
+                if alias_age.days >= ttl_days:
+                    stale_accounts[account_id] = account_roles
+
+        resolved, unassumable = self.__get_account_aliases(missing_accounts, assertion)
+
+        role_info = []
+        for role in roles:
+            account_id = _account_id(role.role_arn)
+            if role.role_arn in unassumable:
+                continue
+            if account_id in cached:
+                self.logger.info("Using cached alias for account %s" % account_id)
+                alias = cached[account_id]
+            elif account_id in resolved:
+                alias = resolved[account_id]
+                if alias is None:
+                    continue
+            else:
+                # The lookup failed without a verdict; show the role with no
+                # alias and leave it uncached so the next run retries it.
+                alias = None
+
+            role_info.append((role.role_arn, role.principal_arn, alias))
+
+        if resolved:
+            self.__merge_alias_info(info_file_path, resolved, current_date)
+        if stale_accounts:
+            self.__revalidate_aliases(info_file_path, stale_accounts, assertion)
+
+        return sorted(role_info, key=lambda role: (role[2] is None, role[2], role[0]))
+
+    def __revalidate_aliases(self, info_file_path, accounts, assertion):
+        """Refreshes the aliases of `accounts` on a background thread"""
+
+        def revalidate():
+            try:
+                resolved, _ = self.__get_account_aliases(accounts, assertion)
+                if resolved:
+                    self.__merge_alias_info(info_file_path, resolved, date.today())
+            except Exception:  # pylint: disable=broad-except
+                self.logger.debug("Background alias refresh failed", exc_info=True)
+
+        self.logger.info(
+            "Refreshing %d stale account aliases in the background" % len(accounts)
+        )
+        run_in_background(
+            revalidate,
+            ALIAS_REFRESH_EXIT_WAIT_SECONDS,
+            name="okta-awscli-alias-refresh",
+        )
+
+    @staticmethod
+    def __read_alias_info(info_file_path):
+        """Reads ~/.okta-alias-info, treating a missing or empty file as empty"""
+        try:
             with open(info_file_path, "r") as info_file:
                 okta_info = info_file.read()
-            if okta_info == "":
-                okta_info = {}
-            else:
-                okta_info = json.loads(okta_info)
-
-            role_info = []
-            new_okta_info = {}
-            for role in roles:
-                # read the role info from ~/.okta-info.json
-                role_updated = okta_info.get(role.role_arn, {})
-                alias = role_updated.get("alias")
-
-                last_updated = role_updated.get("last_updated", "0001-01-01")
-                last_updated = datetime.strptime(last_updated, "%Y-%m-%d").date()
-                current_date = date.today()
-                alias_age = current_date - last_updated
-                if alias_age.days >= 7 or alias is None:
-                    self.logger.info(
-                        "Refreshing cached alias for role %s" % role.role_arn
-                    )
-                    alias = self.__get_account_alias(
-                        role.role_arn, role.principal_arn, assertion
-                    )
-                    last_updated = current_date
-                    if alias is None:
-                        continue
-
-                self.logger.info("Using cached alias for role %s" % role.role_arn)
-                role_info.append((role.role_arn, role.principal_arn, alias))
-                new_okta_info[role.role_arn] = {
-                    "last_updated": last_updated,
-                    "alias": alias,
-                }
+        except FileNotFoundError:
+            return {}
+        return _by_account(json.loads(okta_info)) if okta_info else {}
 
+    def __merge_alias_info(self, info_file_path, resolved, current_date):
+        """Merges looked up aliases into ~/.okta-alias-info, writing only on change
+
+        `resolved` maps account IDs to aliases; accounts none of whose roles
+        can be assumed (None) are dropped. Entries for accounts outside this
+        run, e.g. when --account filters the roles, are kept until they age out.
+        """
+        max_age_days = max(ALIAS_CACHE_MAX_AGE_DAYS, sum(self.alias_policy))
+        with locked(info_file_path, purpose="saving account aliases"):
+            okta_info = self.__read_alias_info(info_file_path)
+            merged = dict(okta_info)
+            for account_id, alias in resolved.items():
+                if alias is None:
+                    merged.pop(account_id, None)
+                else:
+                    merged[account_id] = {
+                        "last_updated": current_date.isoformat(),
+                        "alias": alias,
+                    }
+            merged = _evict_aliases(merged, current_date, max_age_days)
+            if merged == okta_info:
+                return
             with atomic_write(info_file_path) as info_file:
                 info_file.write(
                     json.dumps(
-                        new_okta_info,
+                        merged,
                         sort_keys=True,
                         indent=4,
                         separators=(",", ": "),
                         default=str,
                     )
                 )
+        self.logger.debug("Saved %d account aliases", len(merged))
+
+    def __get_account_aliases(self, accounts, assertion):
+        """
+        Resolves the aliases of several accounts concurrently, one lookup per account
+        :param accounts: A dict of account ID to the RoleTuples granted in it.
+        :param assertion: The SAML assertion.
+        :return: A dict of account ID to alias, as returned by __resolve_account_alias,
+        and the set of role ARNs found to be unassumable. Accounts whose lookup raised
+        (e.g. a timeout) are left out.
+        """
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        if not accounts:
+            return {}, set()
+
+        for account_id in accounts:
+            self.logger.info("Refreshing cached alias for account %s" % account_id)
+
+        with ThreadPoolExecutor(
+            max_workers=min(self.alias_limits.concurrency, len(accounts))
+        ) as executor:
+            futures = {
+                account_id: executor.submit(
+                    self.__resolve_account_alias, account_roles, assertion
+                )
+                for account_id, account_roles in accounts.items()
+            }
+
+        aliases = {}
+        unassumable = set()
+        for account_id, future in futures.items():
+            try:
+                aliases[account_id], account_unassumable = future.result()
+            except (BotoCoreError, ClientError):
+                self.logger.warning(
+                    "Unable to get alias for account %s",
+                    account_id,
+                    exc_info=self.debug,
+                )
+                continue
+            unassumable.update(account_unassumable)
+        return aliases, unassumable
 
-        return sorted(role_info, key=lambda role: (role[2], role[0]))
+    def __resolve_account_alias(self, roles, assertion):
+        """
+        Gets an account's alias through the first of its roles able to read it
+        :param roles: The RoleTuples granted in the account, tried in turn.
+        :param assertion: The SAML assertion.
+        :return: The alias ("unknown" if no role tried may read it, None if no role can
+        be assumed) and the ARNs of the roles that could not be assumed.
+        """
+        alias = None
+        unassumable = []
+        for role in roles:
+            role_alias = self.__get_account_alias(
+                role.role_arn, role.principal_arn, assertion
+            )
+            if role_alias is None:
+                unassumable.append(role.role_arn)
+                continue
+            alias = role_alias
+            if alias != "unknown":
+                break
+        return alias, unassumable
+
+    def __thread_client(self, service, timeout, **kwargs):
+        """Creates a boto3 client from this thread's session.
+
+        Connect and read each wait at most `timeout` seconds, and a failed
+        call is retried once.
+        """
+        from botocore.config import Config
 
+        config = Config(
+            connect_timeout=timeout,
+            read_timeout=timeout,
+            retries={"max_attempts": 2},
+        )
+        return _profileless_session().client(service, config=config, **kwargs)
+
+    @timed("aws.alias_lookup")
     def __get_account_alias(self, role_arn, principal_arn, assertion):
         """
         Gets account alias for given role
@@ -292,17 +791,14 @@ class AwsAuth:
         :return: The alias of the account that this role is in. "Unknown" is returned if the role does not
         have access to the account's alias. None is returned if the role cannot be assumed.
         """
-        # Temporarily remove the profile envvar because it can cause first-time setup issues
-        profile = os.environ.pop("AWS_PROFILE", None)
-        try:
-            sts = boto3.client("sts")
-        except ProfileNotFound:
-            self.logger.exception(
-                "Unable to handle AWS_PROFILE=%s" % os.environ["AWS_PROFILE"]
-            )
+        from botocore.exceptions import ClientError
+
+        sts = self.__thread_client("sts", self.alias_limits.timeout)
         try:
             saml_resp = sts.assume_role_with_saml(
-                RoleArn=role_arn, PrincipalArn=principal_arn, SAMLAssertion=assertion
+                RoleArn=role_arn,
+                PrincipalArn=principal_arn,
+                SAMLAssertion=encoded(assertion),
             )
         except ClientError:
             self.logger.warning(
@@ -312,16 +808,14 @@ class AwsAuth:
             )
             return None
 
-        iam = boto3.client(
+        iam = self.__thread_client(
             "iam",
+            self.alias_limits.timeout,
             aws_access_key_id=saml_resp["Credentials"]["AccessKeyId"],
             aws_secret_access_key=saml_resp["Credentials"]["SecretAccessKey"],
             aws_session_token=saml_resp["Credentials"]["SessionToken"],
         )
 
-        if profile is not None:
-            os.environ["AWS_PROFILE"] = profile
-
         try:
             alias_resp = iam.list_account_aliases()
             return alias_resp["AccountAliases"][0]
@@ -344,11 +838,15 @@ class AwsAuth:
         for index, role in enumerate(roles):
             # role[0] is the role arn, role[2] is the account alias
             options.append(
-                "[%s]: %s : %s" % (str(index + 1).ljust(2), role[2].ljust(27), role[0])
+                "[%s]: %s : %s"
+                % (
+                    str(index + 1).ljust(2),
+                    (role[2] or "unresolved").ljust(27),
+                    role[0],
+                )
             )
         return options
 
     def __find_predefined_role_from(self, roles):
-        # role_tuple[0] is the role arn
-        found_roles = (role_tuple for role_tuple in roles if role_tuple[0] == self.role)
+        found_roles = (role for role in roles if role.role_arn == self.role)
         return next(found_roles, None)
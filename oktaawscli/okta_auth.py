@@ -1,20 +1,40 @@
 """Handles auth to Okta and returns SAML assertion"""
 
+import ipaddress
 import json
 import os
+import queue
 import random
+import select
 import sys
+import threading
 import time
-from datetime import datetime
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
 
 import requests
-from bs4 import BeautifulSoup as bs
+from requests.adapters import HTTPAdapter
 
 from oktaawscli._locking import INTERACTIVE_LOCK_TIMEOUT_SECONDS, atomic_write, locked
+from oktaawscli._timestamps import format_expiration, parse_expiration
+from oktaawscli._timing import timed
+from oktaawscli.saml import parse_assertion
+from oktaawscli.version import __version__
 
 MAX_OKTA_RATE_LIMIT_RETRIES = 5
 OKTA_RATE_LIMIT_BACKOFF_BASE_SECONDS = 1.0
 OKTA_REQUEST_TIMEOUT_SECONDS = 30
+OKTA_HTTP_POOL_SIZE = 10
+SAML_PAGE_CHUNK_SIZE = 16 * 1024
+SAML_CACHE_MARGIN_SECONDS = 30
+PUSH_POLL_INITIAL_INTERVAL_SECONDS = 0.5
+PUSH_POLL_MAX_INTERVAL_SECONDS = 5.0
+PUSH_POLL_BACKOFF_FACTOR = 1.5
+MFA_RACE_INPUT_POLL_SECONDS = 0.1
+MFA_RACE_PROMPT = "Approve the push or enter MFA token: "
+# Put on the race's queue when polling the push failed with an error.
+_PUSH_FAILED = object()
 
 try:
     input = input
@@ -22,11 +42,92 @@ except NameError:
     pass
 
 
+def new_http_session():
+    """Returns a keep-alive requests.Session shared by all calls to the Okta org"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OKTA_HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.headers.update(
+        {
+            "User-Agent": "okta-awscli/%s %s"
+            % (__version__, requests.utils.default_user_agent()),
+            "Connection": "keep-alive",
+        }
+    )
+    return session
+
+
+def okta_base_url(base_url):
+    """Returns the Okta org URL for a `base-url` setting, or None if it is refused
+
+    A bare host is reached over https. A scheme is accepted so tests and
+    benchmarks can point at a local server, but plain http only to a loopback
+    host: anywhere else it would send passwords and session cookies in clear.
+    """
+    if "://" not in base_url:
+        return "https://" + base_url
+    parts = urlsplit(base_url)
+    if parts.scheme == "https":
+        return base_url
+    if parts.scheme == "http" and parts.hostname:
+        if parts.hostname == "localhost":
+            return base_url
+        try:
+            if ipaddress.ip_address(parts.hostname).is_loopback:
+                return base_url
+        except ValueError:
+            pass
+    return None
+
+
+def rate_limit_delay(resp):
+    """Returns how long Okta asks us to wait before the next request, or None
+
+    Honors Retry-After, then X-Rate-Limit-Reset once X-Rate-Limit-Remaining
+    reaches zero. Both are absent while the org has budget left.
+    """
+    retry_after = resp.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    reset = resp.headers.get("X-Rate-Limit-Reset")
+    if reset and resp.headers.get("X-Rate-Limit-Remaining") == "0":
+        try:
+            return max(0.0, float(reset) - time.time())
+        except ValueError:
+            pass
+    return None
+
+
+class _SamlResponseFinder(HTMLParser):
+    """Incremental HTML parser remembering the value of the SAMLResponse input"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.assertion = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "input" and self.assertion is None:
+            attributes = dict(attrs)
+            if attributes.get("name") == "SAMLResponse":
+                self.assertion = attributes.get("value")
+
+
 class OktaAuth:
     """Handles auth to Okta and returns SAML assertion"""
 
     def __init__(
-        self, okta_profile, verbose, logger, totp_token, okta_auth_config, debug=False
+        self,
+        okta_profile,
+        verbose,
+        logger,
+        totp_token,
+        okta_auth_config,
+        debug=False,
+        session=None,
+        refresh_apps=False,
     ):
         self.okta_profile = okta_profile
         self.totp_token = totp_token
@@ -34,15 +135,37 @@ class OktaAuth:
         self.factor = ""
         self.verbose = verbose
         self.okta_auth_config = okta_auth_config
-        self.https_base_url = "https://%s" % okta_auth_config.base_url_for(okta_profile)
+        base_url = okta_auth_config.base_url_for(okta_profile)
+        self.https_base_url = okta_base_url(base_url)
+        if self.https_base_url is None:
+            logger.error(
+                "base-url %s must use https; http is only allowed for localhost"
+                % base_url
+            )
+            sys.exit(1)
         self.factor = okta_auth_config.factor_for(okta_profile)
         self.app = okta_auth_config.app_for(okta_profile)
         self.debug = debug
+        self.session = session or new_http_session()
+        self.apps_cache_ttl = okta_auth_config.get_apps_cache_ttl(okta_profile)
+        self.refresh_apps = refresh_apps
+        self.user_id = None
 
         self.token_path = os.path.join(os.path.expanduser("~"), ".okta-token")
         if not os.path.isfile(self.token_path):
             open(self.token_path, "a").close()
 
+    @property
+    def apps_cache_path(self):
+        """Path of the cached Okta app lists"""
+        return os.path.join(os.path.expanduser("~"), ".okta-apps-cache")
+
+    @property
+    def saml_cache_path(self):
+        """Path of the SAML assertions shared between concurrent runs"""
+        return os.path.join(os.path.expanduser("~"), ".okta-saml-cache")
+
+    @timed("okta.primary_auth")
     def primary_auth(self):
         """Performs primary auth against Okta, serializing parallel runs through a lock."""
         session_id = self.get_cached_session_id()
@@ -50,7 +173,11 @@ class OktaAuth:
             return session_id
 
         # 300s timeout accommodates interactive MFA in the holding process.
-        with locked(self.token_path, timeout=INTERACTIVE_LOCK_TIMEOUT_SECONDS):
+        with locked(
+            self.token_path,
+            timeout=INTERACTIVE_LOCK_TIMEOUT_SECONDS,
+            purpose="Okta login and MFA",
+        ):
             refreshed = self.get_cached_session_id()
             if refreshed is not None and refreshed != session_id:
                 self.logger.info(
@@ -59,6 +186,7 @@ class OktaAuth:
                 return refreshed
             return self.get_session(self._run_authn_flow())
 
+    @timed("okta.authn")
     def _run_authn_flow(self):
         """Runs the Okta authn POST and returns a sessionToken. Caller holds the lock."""
         self.logger.warning(
@@ -97,6 +225,7 @@ class OktaAuth:
         self.logger.error(resp_json)
         exit(1)
 
+    @timed("okta.mfa")
     def verify_mfa(self, factors_list, state_token):
         """Performs MFA auth against Okta"""
 
@@ -112,7 +241,11 @@ class OktaAuth:
             supported_factors,
             key=lambda factor: (factor["provider"], factor["factorType"]),
         )
-        if len(supported_factors) == 1:
+        race_factors = self._race_factors(supported_factors)
+        if race_factors is not None:
+            self.logger.info("Racing Okta Verify push against a TOTP code")
+            session_token = self.race_push_and_totp(*race_factors, state_token)
+        elif len(supported_factors) == 1:
             session_token = self.verify_single_factor(supported_factors[0], state_token)
         elif len(supported_factors) > 0:
             if not self.factor:
@@ -157,6 +290,124 @@ class OktaAuth:
             exit(1)
         return session_token
 
+    def _race_factors(self, supported_factors):
+        """Returns the (push, totp) factors to race, or None if racing is off
+
+        Racing needs mfa-race = True, both factor types enrolled, no TOTP
+        token on the command line and a stdin that select() can watch.
+        """
+        if self.totp_token or sys.platform == "win32":
+            return None
+        if self.okta_auth_config.get_mfa_race(self.okta_profile) != "True":
+            return None
+        by_type = {}
+        for factor in supported_factors:
+            by_type.setdefault(factor["factorType"], factor)
+        if "push" not in by_type or "token:software:totp" not in by_type:
+            return None
+        return by_type["push"], by_type["token:software:totp"]
+
+    def race_push_and_totp(self, push_factor, totp_factor, state_token):
+        """Sends a push and reads a TOTP code at once, returning the first sessionToken
+
+        The push is polled on a worker thread while stdin is watched with
+        select(), so whichever factor verifies first ends the other: a valid
+        code cancels the poller, an approved push stops reading input. If
+        polling fails with an error, e.g. a dropped connection, the race goes
+        on with TOTP alone, or exits if stdin is closed.
+        """
+        req_data = {"stateToken": state_token}
+        resp_json = self._http_request(
+            "POST", push_factor["_links"]["verify"]["href"], json=req_data
+        ).json()
+        if resp_json.get("status") == "SUCCESS":
+            return resp_json["sessionToken"]
+        if resp_json.get("status") != "MFA_CHALLENGE":
+            self.logger.error(resp_json.get("errorSummary", resp_json))
+            exit(1)
+
+        cancelled = threading.Event()
+        push_results = queue.Queue()
+
+        def poll():
+            try:
+                push_results.put(
+                    self.poll_push(
+                        resp_json["_links"]["next"]["href"], req_data, cancelled
+                    )
+                )
+            except SystemExit:
+                # Rejected or timed out; poll_push has told the user why.
+                push_results.put(None)
+            except Exception:  # pylint: disable=broad-except
+                self.logger.warning(
+                    "Unable to poll the push, enter an MFA token instead.",
+                    exc_info=self.debug,
+                )
+                push_results.put(_PUSH_FAILED)
+
+        poller = threading.Thread(target=poll, daemon=True)
+        poller.start()
+        print(MFA_RACE_PROMPT, end="", flush=True)
+        reading = True
+        push_failed = False
+        pending = ""
+        try:
+            while True:
+                if not push_failed:
+                    try:
+                        session_token = push_results.get(timeout=0 if reading else None)
+                    except queue.Empty:
+                        pass
+                    else:
+                        if session_token is None:
+                            exit(1)
+                        if session_token is _PUSH_FAILED:
+                            push_failed = True
+                        else:
+                            print()
+                            return session_token
+                if not reading:
+                    if push_failed:
+                        exit(1)
+                    continue
+                if not select.select([sys.stdin], [], [], MFA_RACE_INPUT_POLL_SECONDS)[
+                    0
+                ]:
+                    continue
+                # Read the descriptor directly: a buffered readline() could
+                # swallow a second typed line that select() would never report.
+                chunk = os.read(sys.stdin.fileno(), 1024).decode()
+                if not chunk:
+                    # stdin closed; the push is the only way left.
+                    reading = False
+                    continue
+                pending += chunk
+                while "\n" in pending:
+                    answer, pending = pending.split("\n", 1)
+                    session_token = self._verify_totp_answer(
+                        totp_factor, state_token, answer.strip()
+                    )
+                    if session_token is not None:
+                        return session_token
+                    print(MFA_RACE_PROMPT, end="", flush=True)
+        finally:
+            cancelled.set()
+            poller.join(PUSH_POLL_MAX_INTERVAL_SECONDS)
+
+    def _verify_totp_answer(self, factor, state_token, answer):
+        """Verifies a TOTP code, returning the sessionToken or None if Okta refuses it"""
+        resp = self._http_request(
+            "POST",
+            factor["_links"]["verify"]["href"],
+            json={"stateToken": state_token, "answer": answer},
+        )
+        resp_json = resp.json()
+        if resp_json.get("status") == "SUCCESS":
+            return resp_json["sessionToken"]
+        print(resp_json.get("errorSummary", "MFA token was not accepted"))
+        return None
+
     def verify_single_factor(self, factor, state_token):
         """Verifies a single MFA factor"""
         req_data = {"stateToken": state_token}
@@ -170,28 +421,14 @@ class OktaAuth:
             else:
                 req_data["answer"] = input("Enter MFA token: ")
         post_url = factor["_links"]["verify"]["href"]
-        resp = requests.post(post_url, json=req_data)
+        resp = self._http_request("POST", post_url, json=req_data)
         resp_json = resp.json()
         if "status" in resp_json:
             if resp_json["status"] == "SUCCESS":
                 return resp_json["sessionToken"]
             elif resp_json["status"] == "MFA_CHALLENGE":
                 print("Waiting for push verification...")
-                while True:
-                    resp = requests.post(
-                        resp_json["_links"]["next"]["href"], json=req_data
-                    )
-                    resp_json = resp.json()
-                    if resp_json["status"] == "SUCCESS":
-                        return resp_json["sessionToken"]
-                    elif resp_json["factorResult"] == "TIMEOUT":
-                        print("Verification timed out")
-                        exit(1)
-                    elif resp_json["factorResult"] == "REJECTED":
-                        print("Verification was rejected")
-                        exit(1)
-                    else:
-                        time.sleep(0.5)
+                return self.poll_push(resp_json["_links"]["next"]["href"], req_data)
         elif resp.status_code != 200:
             self.logger.error(resp_json["errorSummary"])
             exit(1)
@@ -200,6 +437,61 @@ class OktaAuth:
             exit(1)
         return None
 
+    def poll_push(self, poll_url, req_data, cancelled=None):
+        """Polls a pending push until it is answered, returning the sessionToken
+
+        The interval grows from 0.5s to 5s and stretches further when Okta
+        asks for it through Retry-After or exhausted X-Rate-Limit headers.
+        Gives up after the profile's push-timeout. Returns None as soon as
+        the optional `cancelled` event is set.
+        """
+        deadline_seconds = self.okta_auth_config.get_push_timeout(self.okta_profile)
+        started = time.monotonic()
+        interval = PUSH_POLL_INITIAL_INTERVAL_SECONDS
+        polls = 0
+        while True:
+            resp_json, resp = self._okta_json_request(
+                "POST", poll_url, "poll_push", with_response=True, json=req_data
+            )
+            polls += 1
+            elapsed = time.monotonic() - started
+            if cancelled is not None and cancelled.is_set():
+                self.logger.info(
+                    "Push cancelled after %d polls in %.1fs", polls, elapsed
+                )
+                return None
+            if resp_json["status"] == "SUCCESS":
+                self.logger.info(
+                    "Push approved after %d polls in %.1fs", polls, elapsed
+                )
+                return resp_json["sessionToken"]
+            if resp_json.get("factorResult") == "REJECTED":
+                self.logger.info(
+                    "Push rejected after %d polls in %.1fs", polls, elapsed
+                )
+                print("Verification was rejected")
+                exit(1)
+            delay = max(interval, rate_limit_delay(resp) or 0)
+            if resp_json.get("factorResult") == "TIMEOUT" or (
+                elapsed + delay > deadline_seconds
+            ):
+                self.logger.info(
+                    "Push timed out after %d polls in %.1fs", polls, elapsed
+                )
+                print("Verification timed out")
+                exit(1)
+            if cancelled is None:
+                time.sleep(delay)
+            elif cancelled.wait(delay):
+                self.logger.info(
+                    "Push cancelled after %d polls in %.1fs", polls, elapsed
+                )
+                return None
+            interval = min(
+                interval * PUSH_POLL_BACKOFF_FACTOR, PUSH_POLL_MAX_INTERVAL_SECONDS
+            )
+
+    @timed("okta.session")
     def get_session(self, session_token):
         """Gets a session cookie from a session token"""
         data = {"sessionToken": session_token}
@@ -207,12 +499,15 @@ class OktaAuth:
         resp = self._okta_json_request(
             "POST", "/api/v1/sessions", "get_session", json=data
         )
-        self.cache_session_id(resp["id"], resp["expiresAt"])
+        self.user_id = resp.get("userId")
+        self.cache_session_id(resp["id"], resp["expiresAt"], self.user_id)
         return resp["id"]
 
-    def cache_session_id(self, session_id, expiration_date):
+    def cache_session_id(self, session_id, expiration_date, user_id=None):
         """Stores Okta session id in ~/.okta-token"""
         session_info = {"session_id": session_id, "expiration_date": expiration_date}
+        if user_id:
+            session_info["user_id"] = user_id
         self.logger.info("Cacheing Okta session id to ~/.okta-token")
         with atomic_write(self.token_path) as session_file:
             session_file.write(
@@ -243,19 +538,23 @@ class OktaAuth:
         current_time = datetime.utcnow()
         if max([current_time, expiration_date]) == expiration_date:
             self.logger.info("Using cached Okta session id from ~/.okta-token")
+            self.user_id = session_info.get("user_id")
             return session_info.get("session_id")
         return None
 
+    @timed("okta.session_check")
     def check_for_desync(self, session_id):
         """Returns True if there's a desync between the local and remote token state, False otherwise"""
         try:
             sid = "sid=%s" % session_id
             headers = {"Cookie": sid}
             # https://developer.okta.com/docs/api/openapi/okta-management/management/tag/User/#tag/User/operation/getUser
-            raw_resp = requests.get(
-                self.https_base_url + "/api/v1/users/me", headers=headers
+            raw_resp = self._http_request(
+                "GET", self.https_base_url + "/api/v1/users/me", headers=headers
             )
             raw_resp.raise_for_status()
+            if not self.user_id:
+                self.user_id = raw_resp.json().get("id")
             return False
         except requests.HTTPError as e:
             if (
@@ -268,20 +567,30 @@ class OktaAuth:
             self.logger.error(message)
             return True
 
-    def _okta_json_request(self, method, path, context, **kwargs):
+    def _http_request(self, method, url, **kwargs):
+        """Issue an HTTP request through the shared session with a default timeout."""
+        kwargs.setdefault("timeout", OKTA_REQUEST_TIMEOUT_SECONDS)
+        return self.session.request(method, url, **kwargs)
+
+    def _okta_json_request(self, method, path, context, with_response=False, **kwargs):
         """Issue an HTTP request against https_base_url + path, retrying on Okta rate-limit.
 
-        Returns parsed JSON for non-error responses. Exits 1 on a non-rate-limit
-        Okta error body or after exhausting retries.
+        `path` may also be an absolute URL taken from an Okta `_links` entry.
+        Returns parsed JSON for non-error responses, paired with the response
+        when `with_response` is set. Exits 1 on a non-rate-limit Okta error
+        body or after exhausting retries.
         """
-        url = self.https_base_url + path
-        kwargs.setdefault("timeout", OKTA_REQUEST_TIMEOUT_SECONDS)
+        url = path if "://" in path else self.https_base_url + path
         for attempt in range(MAX_OKTA_RATE_LIMIT_RETRIES):
-            resp = requests.request(method, url, **kwargs)
+            resp = self._http_request(method, url, **kwargs)
             body = resp.json()
-            if isinstance(body, dict) and body.get("errorCode") == "E0000047":
-                delay = OKTA_RATE_LIMIT_BACKOFF_BASE_SECONDS * (2**attempt)
-                delay += random.uniform(0, delay)
+            if resp.status_code == 429 or (
+                isinstance(body, dict) and body.get("errorCode") == "E0000047"
+            ):
+                delay = rate_limit_delay(resp)
+                if delay is None:
+                    delay = OKTA_RATE_LIMIT_BACKOFF_BASE_SECONDS * (2**attempt)
+                    delay += random.uniform(0, delay)
                 self.logger.warning(
                     "Okta rate-limited in %s; retrying in %.1fs (attempt %d/%d)",
                     context,
@@ -292,7 +601,7 @@ class OktaAuth:
                 time.sleep(delay)
                 continue
             self._exit_on_okta_error(body, context)
-            return body
+            return (body, resp) if with_response else body
         self.logger.error(
             "Okta API still rate-limited in %s after %d retries; giving up.",
             context,
@@ -316,22 +625,20 @@ class OktaAuth:
             )
             sys.exit(1)
 
-    def get_apps(self, session_id):
-        """Gets apps for the user"""
-        sid = "sid=%s" % session_id
-        headers = {"Cookie": sid}
-        # https://developer.okta.com/docs/api/openapi/okta-management/management/tag/UserResources/#tag/UserResources/operation/listAppLinks
-        resp = self._okta_json_request(
-            "GET", "/api/v1/users/me/appLinks", "get_apps", headers=headers
-        )
-
-        aws_apps = []
-        for app in resp:
-            if app["appName"] == "amazon_aws":
-                aws_apps.append(app)
-        if not aws_apps:
-            self.logger.error("No AWS apps are available for your user. Exiting.")
-            sys.exit(1)
+    def get_apps(self, session_id, refresh=False):
+        """Gets apps for the user, from ~/.okta-apps-cache when fresh"""
+        label, link_url, _ = self._choose_app(session_id, refresh)
+        return label, link_url
+
+    @timed("okta.get_apps")
+    def _choose_app(self, session_id, refresh=False):
+        """Like get_apps, also returning whether the app list came from the cache"""
+        aws_apps = None
+        if not (refresh or self.refresh_apps):
+            aws_apps = self._load_cached_apps()
+        from_cache = aws_apps is not None
+        if aws_apps is None:
+            aws_apps = self._fetch_aws_apps(session_id)
 
         aws_apps = sorted(aws_apps, key=lambda app: app["sortOrder"])
         app_choice = None
@@ -346,28 +653,252 @@ class OktaAuth:
                 self.okta_profile, aws_apps[app_choice]["label"]
             )
 
-        return aws_apps[app_choice]["label"], aws_apps[app_choice]["linkUrl"]
+        return (
+            aws_apps[app_choice]["label"],
+            aws_apps[app_choice]["linkUrl"],
+            from_cache,
+        )
 
-    def get_saml_assertion(self, html):
-        """Returns the SAML assertion from HTML"""
-        soup = bs(html.text, "html.parser")
-        assertion = ""
+    def _fetch_aws_apps(self, session_id):
+        """Gets the user's amazon_aws app links from Okta and caches them"""
+        sid = "sid=%s" % session_id
+        headers = {"Cookie": sid}
+        # https://developer.okta.com/docs/api/openapi/okta-management/management/tag/UserResources/#tag/UserResources/operation/listAppLinks
+        resp = self._okta_json_request(
+            "GET", "/api/v1/users/me/appLinks", "get_apps", headers=headers
+        )
 
-        for input_tag in soup.find_all("input"):
-            if input_tag.get("name") == "SAMLResponse":
-                assertion = input_tag.get("value")
+        aws_apps = []
+        for app in resp:
+            if app["appName"] == "amazon_aws":
+                aws_apps.append(
+                    {
+                        "label": app["label"],
+                        "linkUrl": app["linkUrl"],
+                        "sortOrder": app["sortOrder"],
+                    }
+                )
+        if not aws_apps:
+            self.logger.error("No AWS apps are available for your user. Exiting.")
+            sys.exit(1)
 
+        self._store_cached_apps(aws_apps)
+        return aws_apps
+
+    def _apps_cache_key(self):
+        """Returns the ~/.okta-apps-cache key for this org and user, or None if unknown"""
+        if not self.user_id or self.apps_cache_ttl <= 0:
+            return None
+        return "%s|%s" % (self.https_base_url, self.user_id)
+
+    @staticmethod
+    def _read_json_cache(path):
+        try:
+            with open(path, "r") as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _load_cached_apps(self):
+        """Gets the cached AWS app list if it is younger than apps-cache-ttl"""
+        key = self._apps_cache_key()
+        if key is None:
+            return None
+        entry = self._read_json_cache(self.apps_cache_path).get(key)
+        if not entry or time.time() - entry["fetched_at"] >= self.apps_cache_ttl:
+            return None
+        self.logger.info("Using cached Okta app list from ~/.okta-apps-cache")
+        return entry["apps"]
+
+    def _store_cached_apps(self, aws_apps):
+        key = self._apps_cache_key()
+        if key is None:
+            return
+        with locked(self.apps_cache_path, purpose="caching app list"):
+            cache = self._read_json_cache(self.apps_cache_path)
+            cache[key] = {"fetched_at": time.time(), "apps": aws_apps}
+            with atomic_write(self.apps_cache_path) as cache_file:
+                cache_file.write(json.dumps(cache, sort_keys=True, indent=4))
+
+    def invalidate_apps_cache(self):
+        """Drops this org and user's entry from ~/.okta-apps-cache"""
+        key = self._apps_cache_key()
+        if key is None:
+            return
+        with locked(self.apps_cache_path, purpose="caching app list"):
+            cache = self._read_json_cache(self.apps_cache_path)
+            if cache.pop(key, None) is not None:
+                with atomic_write(self.apps_cache_path) as cache_file:
+                    cache_file.write(json.dumps(cache, sort_keys=True, indent=4))
+
+    def get_saml_assertion(self, resp):
+        """Returns the SAML assertion from the app link response
+
+        The page is scanned as it streams in and the download stops at the
+        SAMLResponse input. Pages where it isn't found that way get a full
+        BeautifulSoup parse as a fallback.
+        """
+        assertion = self.extract_saml_assertion(resp)
         if not assertion:
-            self.logger.error("SAML assertion not valid: " + assertion)
+            self.logger.error("SAML assertion not valid: %s" % assertion)
             exit(-1)
         return assertion
 
-    def get_assertion(self):
-        """Main method to get SAML assertion from Okta"""
+    def extract_saml_assertion(self, resp):
+        """Returns the SAML assertion from the app link response, or None"""
+        if resp.status_code >= 400:
+            self.logger.debug("App link returned HTTP %s" % resp.status_code)
+            return None
+        assertion, page = self._stream_saml_assertion(resp)
+        if not assertion and page:
+            self.logger.debug("SAMLResponse input not found while streaming")
+            assertion = self._soup_saml_assertion(page)
+        return assertion
+
+    @staticmethod
+    def _stream_saml_assertion(resp):
+        """Scans the response body chunk by chunk for the SAMLResponse input
+
+        Only the tag around each "SAMLResponse" occurrence is handed to
+        _SamlResponseFinder, so the cost doesn't grow with the branding and
+        scripts on the page. Returns (assertion, None) as soon as the assertion
+        is found, otherwise (None, page) with the full page for the fallback.
+        """
+        marker = "SAMLResponse"
+        if resp.encoding is None:
+            resp.encoding = "utf-8"
+        chunks = []
+        pending = ""
+        for chunk in resp.iter_content(
+            chunk_size=SAML_PAGE_CHUNK_SIZE, decode_unicode=True
+        ):
+            chunks.append(chunk)
+            pending += chunk
+            pos = pending.find(marker)
+            while pos != -1:
+                tag_start = max(pending.rfind("<", 0, pos), 0)
+                tag_end = pending.find(">", pos)
+                if tag_end == -1:
+                    # The tag continues in the next chunk.
+                    pending = pending[tag_start:]
+                    break
+                finder = _SamlResponseFinder()
+                finder.feed(pending[tag_start : tag_end + 1])
+                if finder.assertion:
+                    resp.close()
+                    return finder.assertion, None
+                pos = pending.find(marker, tag_end)
+            else:
+                # Keep an unterminated tag, or enough to catch a split marker.
+                tag_start = pending.rfind("<")
+                if tag_start != -1 and pending.find(">", tag_start) == -1:
+                    pending = pending[tag_start:]
+                else:
+                    pending = pending[-len(marker) :]
+        return None, "".join(chunks)
+
+    @staticmethod
+    def _soup_saml_assertion(page):
+        """Finds a SAMLResponse field anywhere in the page, input or not"""
+        from bs4 import BeautifulSoup as bs
+
+        soup = bs(page, "html.parser")
+        for tag in soup.find_all(attrs={"name": "SAMLResponse"}):
+            assertion = tag.get("value") or tag.get_text(strip=True)
+            if assertion:
+                return assertion
+        return None
+
+    @timed("okta.assertion")
+    def get_assertion(self, refresh=False):
+        """Main method to get SAML assertion from Okta
+
+        Returns the app name and the parsed SamlAssertion. Assertions are
+        shared with other runs through ~/.okta-saml-cache until shortly before
+        they expire. `refresh` skips the cached one, e.g. after AWS rejected it.
+        """
         session_id = self.primary_auth()
-        app_name, app_link = self.get_apps(session_id)
+        app_name, app_link, apps_from_cache = self._choose_app(session_id)
+        cache_key = None if self.user_id is None else "%s|%s" % (self.user_id, app_link)
+        if cache_key is None:
+            return self._get_app_assertion(
+                session_id, app_name, app_link, apps_from_cache
+            )
+
+        assertion = None if refresh else self._load_cached_assertion(cache_key)
+        if assertion:
+            return app_name, assertion
+        with locked(self.saml_cache_path, purpose="fetching SAML assertion"):
+            # Another run may have fetched one while we waited for the lock.
+            assertion = None if refresh else self._load_cached_assertion(cache_key)
+            if assertion:
+                return app_name, assertion
+            app_name, assertion = self._get_app_assertion(
+                session_id, app_name, app_link, apps_from_cache
+            )
+            self._store_cached_assertion(cache_key, assertion)
+        return app_name, assertion
+
+    def _get_app_assertion(self, session_id, app_name, app_link, apps_from_cache):
+        """Fetches and parses the app link's assertion, refreshing a stale cached link once"""
+        assertion = self._fetch_saml_assertion(session_id, app_link)
+        if not assertion and apps_from_cache:
+            self.logger.warning(
+                "Cached link for app %s failed; refreshing the app list." % app_name
+            )
+            self.invalidate_apps_cache()
+            app_name, app_link = self.get_apps(session_id, refresh=True)
+            assertion = self._fetch_saml_assertion(session_id, app_link)
+        if not assertion:
+            self.logger.error("SAML assertion not valid: %s" % assertion)
+            exit(-1)
+        try:
+            assertion = parse_assertion(assertion)
+        except ValueError as ex:
+            self.logger.error("%s", ex)
+            exit(-1)
+        return app_name, assertion
+
+    def _load_cached_assertion(self, cache_key):
+        """Gets a cached SAML assertion not expiring within SAML_CACHE_MARGIN_SECONDS"""
+        entry = self._read_json_cache(self.saml_cache_path).get(cache_key)
+        if not entry:
+            return None
+        not_on_or_after = parse_expiration(entry.get("not_on_or_after"))
+        if not_on_or_after is None:
+            return None
+        remaining = (not_on_or_after - datetime.now(timezone.utc)).total_seconds()
+        if remaining <= SAML_CACHE_MARGIN_SECONDS:
+            return None
+        try:
+            assertion = parse_assertion(entry["assertion"])
+        except (KeyError, ValueError):
+            return None
+        self.logger.info("Using cached SAML assertion from ~/.okta-saml-cache")
+        return assertion
+
+    def _store_cached_assertion(self, cache_key, assertion):
+        """Caches the assertion until its NotOnOrAfter. Caller holds the lock."""
+        not_on_or_after = assertion.not_on_or_after
+        if not_on_or_after is None:
+            return
+        now = datetime.now(timezone.utc)
+        cache = {
+            key: entry
+            for key, entry in self._read_json_cache(self.saml_cache_path).items()
+            if (parse_expiration(entry.get("not_on_or_after")) or now) > now
+        }
+        cache[cache_key] = {
+            "assertion": assertion.raw,
+            "not_on_or_after": format_expiration(not_on_or_after),
+        }
+        with atomic_write(self.saml_cache_path) as cache_file:
+            cache_file.write(json.dumps(cache, sort_keys=True, indent=4))
+
+    @timed("okta.saml_fetch")
+    def _fetch_saml_assertion(self, session_id, app_link):
+        """Opens the app link and returns its SAML assertion, or None"""
         sid = "sid=%s" % session_id
         headers = {"Cookie": sid}
-        resp = requests.get(app_link, headers=headers)
-        assertion = self.get_saml_assertion(resp)
-        return app_name, assertion
+        with self._http_request("GET", app_link, headers=headers, stream=True) as resp:
+            return self.extract_saml_assertion(resp)
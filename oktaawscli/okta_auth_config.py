@@ -4,7 +4,9 @@ import os
 from configparser import ConfigParser
 from getpass import getpass, getuser
 
+from oktaawscli._config_snapshot import DEFAULT_SECTION, load_config
 from oktaawscli._locking import atomic_write, locked
+from oktaawscli._timing import timed
 
 try:
     input = raw_input  # type: ignore[name-defined]  # noqa: F821  # py2 compat
@@ -12,18 +14,15 @@ except NameError:
     pass
 
 
-DEFAULT_SECTION = "default"
-
-
 class OktaAuthConfig:
     """Config helper class"""
 
+    @timed("config.load")
     def __init__(self, logger, reset):
         self.logger = logger
         self.reset = reset
         self.config_path = os.path.expanduser("~") + "/.okta-aws"
-        self._value = ConfigParser(default_section=DEFAULT_SECTION)
-        self._value.read(self.config_path)
+        self._value = load_config(self.config_path)
 
     def base_url_for(self, okta_profile):
         """Gets base URL from config"""
@@ -110,11 +109,15 @@ class OktaAuthConfig:
         )
         return auto_write_profile
 
-    def get_session_duration(self, okta_profile):
-        """Gets STS session duration from config as an int"""
+    def get_session_duration(self, okta_profile, max_duration=None):
+        """Gets STS session duration from config as an int
+
+        `max_duration` is the SessionDuration of the SAML assertion, if it has
+        one; longer configured durations are capped to it.
+        """
         # AWS docs say default duration is 1 hour (3600 seconds)
-        session_duration = int(
-            self._value.get(okta_profile, "session-duration", fallback="3600")
+        session_duration = self._value.get(
+            okta_profile, "session-duration", fallback=3600, convert=int
         )
 
         if session_duration > 43200 or session_duration < 3600:
@@ -123,9 +126,46 @@ class OktaAuthConfig:
             )
             session_duration = 3600
 
+        if max_duration is not None and session_duration > max_duration:
+            self.logger.info(
+                "Capping session duration to the SAML assertion's SessionDuration"
+                " of %s seconds." % max_duration
+            )
+            session_duration = max_duration
+
         self.logger.info("Configured session duration: %s seconds" % session_duration)
         return session_duration
 
+    def get_apps_cache_ttl(self, okta_profile):
+        """Gets how long the Okta AWS app list may be cached, in seconds"""
+        apps_cache_ttl = self._value.get(
+            okta_profile, "apps-cache-ttl", fallback=86400, convert=int
+        )
+        self.logger.debug("Okta app list cache TTL: %s seconds" % apps_cache_ttl)
+        return apps_cache_ttl
+
+    def get_mfa_race(self, okta_profile):
+        """Gets if push and TOTP should be raced when both are enrolled"""
+        mfa_race = self._value.get(okta_profile, "mfa-race", fallback="False")
+        self.logger.debug("Race push and TOTP factors: %s" % mfa_race)
+        return mfa_race
+
+    def get_push_timeout(self, okta_profile):
+        """Gets how long to wait for a push MFA approval, in seconds"""
+        push_timeout = self._value.get(
+            okta_profile, "push-timeout", fallback=120, convert=int
+        )
+        self.logger.debug("Push MFA timeout: %s seconds" % push_timeout)
+        return push_timeout
+
+    def get_refresh_jitter(self, okta_profile):
+        """Gets the upper bound of the per-host --refresh-within delay, in seconds"""
+        refresh_jitter = self._value.get(
+            okta_profile, "refresh-jitter", fallback=60, convert=int
+        )
+        self.logger.debug("Refresh jitter: up to %s seconds" % refresh_jitter)
+        return refresh_jitter
+
     def save_chosen_role_for_profile(self, okta_profile, role_arn):
         """Saves role to config"""
         self._save_config_value(
@@ -150,8 +190,9 @@ class OktaAuthConfig:
             value=app,
         )
 
+    @timed("config.save")
     def _save_config_value(self, section, key, value):
-        with locked(self.config_path):
+        with locked(self.config_path, purpose="saving ~/.okta-aws"):
             # Re-read inside the lock so concurrent saves merge instead of clobbering.
             fresh = ConfigParser(default_section=DEFAULT_SECTION)
             fresh.read(self.config_path)
@@ -163,4 +204,4 @@ class OktaAuthConfig:
             with atomic_write(self.config_path) as configfile:
                 fresh.write(configfile)
 
-            self._value = fresh
+            self._value = load_config(self.config_path)
@@ -1,17 +1,40 @@
 """Wrapper script for awscli which handles Okta auth"""
 
+import hashlib
+import json
 import logging
 import os
+import socket
+import sys
+import time
+from contextlib import redirect_stdout
 from subprocess import call
 
 import click
 from filelock import Timeout
 
-from oktaawscli.aws_auth import AwsAuth
-from oktaawscli.okta_auth import OktaAuth
+from oktaawscli import _credential_cache, _locking, _timing
+from oktaawscli._locking import INTERACTIVE_LOCK_TIMEOUT_SECONDS, locked
+from oktaawscli.aws_auth import (
+    DEFAULT_EXPIRY_MARGIN_SECONDS,
+    AwsAuth,
+    is_rejected_assertion,
+)
 from oktaawscli.okta_auth_config import OktaAuthConfig
 from oktaawscli.version import __version__
 
+# Exit status of --refresh-within when the credentials outlive the threshold.
+EXIT_NO_REFRESH_NEEDED = 3
+# Files okta-awscli guards with `<file>.lock`, relative to the home directory.
+LOCKED_FILES = (
+    ".okta-aws",
+    ".okta-token",
+    ".okta-apps-cache",
+    ".okta-saml-cache",
+    ".okta-alias-info",
+    os.path.join(".aws", "credentials"),
+)
+
 
 def get_credentials(
     okta_profile,
@@ -27,8 +50,15 @@ def get_credentials(
     force,
     region,
     debug=False,
+    refresh_apps=False,
+    refresh_within=None,
 ):
-    """Gets credentials from Okta"""
+    """Gets credentials from Okta
+
+    With `refresh_within` (seconds), credentials are refreshed only if they
+    expire within that time, after a per-host delay; otherwise the run exits
+    with EXIT_NO_REFRESH_NEEDED.
+    """
     okta_auth_config = OktaAuthConfig(logger, reset)
 
     aws_auth = AwsAuth(
@@ -43,31 +73,48 @@ def get_credentials(
     )
 
     check_creds = okta_auth_config.get_check_valid_creds(okta_profile)
-    if not force and not export and check_creds and aws_auth.check_sts_token(profile):
+    if refresh_within is not None and not force:
+        if aws_auth.check_sts_token(profile, margin=refresh_within):
+            if write_default:
+                aws_auth.copy_to_default(profile)
+                print("Copying AWS profile creds to default")
+            exit(EXIT_NO_REFRESH_NEEDED)
+        # Never wait so long that the credentials run out before we refresh.
+        max_delay = min(
+            okta_auth_config.get_refresh_jitter(okta_profile), refresh_within / 2
+        )
+        delay = host_jitter(max_delay, okta_profile, profile)
+        logger.info("Waiting %.1f seconds of per-host jitter before refreshing", delay)
+        time.sleep(delay)
+    elif not force and not export and check_creds and aws_auth.check_sts_token(profile):
         if write_default:
             aws_auth.copy_to_default(profile)
             print("Copying AWS profile creds to default")
         exit(0)
 
-    okta = OktaAuth(
-        okta_profile, verbose, logger, totp_token, okta_auth_config, debug=debug
+    # The account alias is only needed to name the profile.
+    alias_profile = (
+        okta_auth_config.get_auto_write_profile(okta_profile) == "True"
+        and profile is None
     )
-    _, assertion = okta.get_assertion()
-    role = aws_auth.choose_aws_role(assertion)
-    role_arn, principal_arn, alias = role
+    role, sts_token, duration = fetch_sts_token(
+        okta_profile,
+        okta_auth_config,
+        aws_auth,
+        verbose,
+        logger,
+        totp_token,
+        debug,
+        refresh_apps=refresh_apps,
+        resolve_alias=alias_profile,
+    )
+    role_arn, _, alias = role
 
-    auto_write = okta_auth_config.get_auto_write_profile(okta_profile)
-    if auto_write == "True" and profile is None:
-        profile_name = "default" if alias == "unknown" else alias
+    if alias_profile:
+        profile_name = alias_profile_name(role_arn, alias, logger)
     else:
         profile_name = profile
 
-    store_role = okta_auth_config.get_store_role(okta_profile)
-    if store_role == "True":
-        okta_auth_config.save_chosen_role_for_profile(okta_profile, role_arn)
-
-    duration = okta_auth_config.get_session_duration(okta_profile)
-    sts_token = aws_auth.get_sts_token(role_arn, principal_arn, assertion, duration)
     access_key_id = sts_token["AccessKeyId"]
     secret_access_key = sts_token["SecretAccessKey"]
     session_token = sts_token["SessionToken"]
@@ -85,46 +132,26 @@ def get_credentials(
             cache.close()
         exit(0)
     else:
-        # Check okta config again for region, but now with manually chosen account alias
-        default_region = okta_auth_config.region_for("default")
-        okta_region = okta_auth_config.region_for(okta_profile, default=None)
-        account_region = okta_auth_config.region_for(profile_name, default=None)
-
-        if region:
-            logger.debug("Keeping CLI region: %s", region)
-        elif okta_region is not None and okta_region != default_region:
-            region = okta_region
-            logger.debug("Setting region=%s via okta-profile=%s", region, okta_profile)
-        elif account_region is not None and account_region != default_region:
-            region = account_region
-            logger.debug(
-                "Setting region=%s via account profile=%s", region, profile_name
-            )
-        else:
-            region = default_region
-            logger.debug("Setting region=%s via defaults", region)
-
+        region = resolve_region(
+            okta_auth_config, okta_profile, profile_name, region, logger
+        )
         logger.info(
             "Export flag not set, will write credentials to ~/.aws/credentials."
         )
+        if write_default:
+            print("Writing to default AWS profile")
         aws_auth.write_sts_token(
             profile=profile_name,
             access_key_id=access_key_id,
             secret_access_key=secret_access_key,
             session_token=session_token,
             region=region,
+            expiration=sts_token["Expiration"],
+            role_arn=role_arn,
+            write_default=write_default,
         )
-        if write_default:
-            print("Writing to default AWS profile")
-            aws_auth.write_sts_token(
-                profile="default",
-                access_key_id=access_key_id,
-                secret_access_key=secret_access_key,
-                session_token=session_token,
-                region=region,
-            )
         # Only print usage message if account argument wasn't specified
-        elif account is None:
+        if not write_default and account is None:
             usage_msg = "".join(
                 [
                     "\nTo start using these temporary credentials, run:\n",
@@ -135,6 +162,415 @@ def get_credentials(
         exit(0)
 
 
+def host_jitter(max_seconds, *keys):
+    """Returns a delay in [0, max_seconds) that is stable for this host and `keys`
+
+    Cron jobs across a fleet land on different seconds, while each host keeps
+    the same slot from run to run.
+    """
+    seed = "\0".join((socket.gethostname(),) + tuple(key or "" for key in keys))
+    digest = hashlib.sha256(seed.encode("utf-8")).digest()
+    return max_seconds * int.from_bytes(digest[:4], "big") / 2**32
+
+
+def alias_profile_name(role_arn, alias, logger):
+    """Names the auto-write profile after the account alias
+
+    A role that may not read its alias writes `default`, as it always has.
+    If looking the alias up failed, the account ID is used instead so a
+    flaky STS or IAM call never overwrites `default`.
+    """
+    if alias == "unknown":
+        return "default"
+    if alias is None:
+        account_id = role_arn.split(":")[4]
+        logger.warning(
+            "Unable to look up the account alias; writing profile %s instead.",
+            account_id,
+        )
+        return account_id
+    return alias
+
+
+def fetch_sts_token(
+    okta_profile,
+    okta_auth_config,
+    aws_auth,
+    verbose,
+    logger,
+    totp_token,
+    debug,
+    refresh_apps=False,
+    okta=None,
+    resolve_alias=False,
+):
+    """Authenticates to Okta and assumes the chosen role
+
+    Returns the (role_arn, principal_arn, alias) role, the STS credentials and
+    the session duration they were requested for. The alias is None unless
+    the role was chosen from the menu or `resolve_alias` is set, and also if
+    looking it up failed. A long-lived
+    caller can pass its own `okta` to keep the Okta session and connections
+    between calls.
+    """
+    # Imported here so runs that find valid credentials never load requests.
+    from botocore.exceptions import ClientError
+
+    from oktaawscli.okta_auth import OktaAuth
+
+    if okta is None:
+        okta = OktaAuth(
+            okta_profile,
+            verbose,
+            logger,
+            totp_token,
+            okta_auth_config,
+            debug=debug,
+            refresh_apps=refresh_apps,
+        )
+    _, assertion = okta.get_assertion()
+    role = aws_auth.choose_aws_role(assertion, resolve_alias=resolve_alias)
+    role_arn, principal_arn, _ = role
+
+    store_role = okta_auth_config.get_store_role(okta_profile)
+    if store_role == "True":
+        okta_auth_config.save_chosen_role_for_profile(okta_profile, role_arn)
+
+    duration = okta_auth_config.get_session_duration(
+        okta_profile, max_duration=assertion.session_duration
+    )
+    try:
+        sts_token = aws_auth.get_sts_token(role_arn, principal_arn, assertion, duration)
+    except ClientError as ex:
+        if not is_rejected_assertion(ex):
+            raise
+        # The assertion may have come from ~/.okta-saml-cache; fetch a new one once.
+        logger.warning("AWS rejected the SAML assertion (%s); fetching a new one.", ex)
+        _, assertion = okta.get_assertion(refresh=True)
+        sts_token = aws_auth.get_sts_token(role_arn, principal_arn, assertion, duration)
+    return role, sts_token, duration
+
+
+def get_credential_process_credentials(
+    okta_profile,
+    account,
+    verbose,
+    logger,
+    totp_token,
+    reset,
+    force,
+    region,
+    debug,
+    refresh_apps=False,
+):
+    """Prints credentials as AWS credential_process JSON, from cache when unexpired"""
+    okta_auth_config = OktaAuthConfig(logger, reset)
+    aws_auth = AwsAuth(
+        profile=None,
+        okta_profile=okta_profile,
+        account=account,
+        verbose=verbose,
+        logger=logger,
+        region=region or okta_auth_config.region_for(okta_profile),
+        reset=reset,
+        debug=debug,
+    )
+    cache_path = _credential_cache.cache_path_for(okta_profile, account, aws_auth.role)
+    document = (
+        None if force else _credential_cache.load(cache_path, aws_auth.expiry_margin)
+    )
+    if document is None:
+        _credential_cache.ensure_cache_dir(cache_path)
+        # Concurrent SDK clients wait here for whoever is refreshing, then
+        # pick up its result instead of each authenticating separately.
+        with locked(
+            cache_path,
+            timeout=INTERACTIVE_LOCK_TIMEOUT_SECONDS,
+            purpose="credential_process refresh",
+        ):
+            if not force:
+                document = _credential_cache.load(cache_path, aws_auth.expiry_margin)
+            if document is None:
+                # stdout belongs to the SDK; prompts and notices go to stderr.
+                with redirect_stdout(sys.stderr):
+                    role, sts_token, _ = fetch_sts_token(
+                        okta_profile,
+                        okta_auth_config,
+                        aws_auth,
+                        verbose,
+                        logger,
+                        totp_token,
+                        debug,
+                        refresh_apps=refresh_apps,
+                    )
+                document = _credential_cache.credential_process_document(sts_token)
+                _credential_cache.store(cache_path, document)
+                # store-role may have just saved the chosen role to ~/.okta-aws,
+                # which puts the next call under that role's key.
+                role_cache_path = _credential_cache.cache_path_for(
+                    okta_profile, account, role[0]
+                )
+                if role_cache_path != cache_path:
+                    _credential_cache.store(role_cache_path, document)
+    else:
+        logger.info("Using cached credentials from %s", cache_path)
+
+    print(json.dumps(document, indent=2))
+    exit(0)
+
+
+def serve_agent(verbose, logger, totp_token, reset, region, debug, refresh_apps=False):
+    """Runs the credential agent, keeping Okta and AWS clients per okta profile
+
+    A TOTP code can only be used once, so `totp_token` is only sent for the
+    first login; later logins prompt in the agent's terminal.
+    """
+    from oktaawscli.agent import CredentialAgent
+    from oktaawscli.okta_auth import OktaAuth
+
+    clients = {}
+
+    def fetch(okta_profile, account):
+        nonlocal totp_token
+        key = (okta_profile, account)
+        if key not in clients:
+            okta_auth_config = OktaAuthConfig(logger, reset)
+            aws_auth = AwsAuth(
+                profile=None,
+                okta_profile=okta_profile,
+                account=account,
+                verbose=verbose,
+                logger=logger,
+                region=region or okta_auth_config.region_for(okta_profile),
+                reset=reset,
+                debug=debug,
+            )
+            okta = OktaAuth(
+                okta_profile,
+                verbose,
+                logger,
+                totp_token,
+                okta_auth_config,
+                debug=debug,
+                refresh_apps=refresh_apps,
+            )
+            clients[key] = (okta_auth_config, aws_auth, okta)
+        okta_auth_config, aws_auth, okta = clients[key]
+        _, sts_token, _ = fetch_sts_token(
+            okta_profile,
+            okta_auth_config,
+            aws_auth,
+            verbose,
+            logger,
+            totp_token,
+            debug,
+            okta=okta,
+        )
+        totp_token = None
+        for _, _, cached_okta in clients.values():
+            cached_okta.totp_token = None
+        return _credential_cache.credential_process_document(sts_token)
+
+    try:
+        CredentialAgent(fetch, logger, DEFAULT_EXPIRY_MARGIN_SECONDS).serve()
+    except KeyboardInterrupt:
+        pass
+    exit(0)
+
+
+def get_agent_credentials(okta_profile, account, logger):
+    """Prints credential_process JSON obtained from a running agent"""
+    from oktaawscli.agent import AgentError, request_credentials
+
+    try:
+        document = request_credentials(okta_profile, account)
+    except AgentError as ex:
+        logger.error("%s", ex)
+        exit(1)
+    print(json.dumps(document, indent=2))
+    exit(0)
+
+
+def resolve_region(okta_auth_config, okta_profile, profile_name, region, logger):
+    """Picks the region to write for `profile_name`, preferring the CLI region"""
+    # Check okta config again for region, but now with manually chosen account alias
+    default_region = okta_auth_config.region_for("default")
+    okta_region = okta_auth_config.region_for(okta_profile, default=None)
+    account_region = okta_auth_config.region_for(profile_name, default=None)
+
+    if region:
+        logger.debug("Keeping CLI region: %s", region)
+    elif okta_region is not None and okta_region != default_region:
+        region = okta_region
+        logger.debug("Setting region=%s via okta-profile=%s", region, okta_profile)
+    elif account_region is not None and account_region != default_region:
+        region = account_region
+        logger.debug("Setting region=%s via account profile=%s", region, profile_name)
+    else:
+        region = default_region
+        logger.debug("Setting region=%s via defaults", region)
+    return region
+
+
+def get_batch_credentials(
+    okta_profile,
+    patterns,
+    account,
+    verbose,
+    logger,
+    totp_token,
+    reset,
+    region,
+    debug=False,
+    refresh_apps=False,
+):
+    """Gets credentials for every role matching `patterns` from one Okta login"""
+    from oktaawscli.okta_auth import OktaAuth
+
+    okta_auth_config = OktaAuthConfig(logger, reset)
+
+    aws_auth = AwsAuth(
+        profile=None,
+        okta_profile=okta_profile,
+        account=account,
+        verbose=verbose,
+        logger=logger,
+        region=region or okta_auth_config.region_for(okta_profile),
+        reset=reset,
+        debug=debug,
+    )
+
+    okta = OktaAuth(
+        okta_profile,
+        verbose,
+        logger,
+        totp_token,
+        okta_auth_config,
+        debug=debug,
+        refresh_apps=refresh_apps,
+    )
+    _, assertion = okta.get_assertion()
+    roles = aws_auth.choose_aws_roles(assertion, patterns)
+    if not roles:
+        logger.error("No roles match %s. Exiting.", ", ".join(patterns))
+        exit(1)
+
+    duration = okta_auth_config.get_session_duration(
+        okta_profile, max_duration=assertion.session_duration
+    )
+    results = aws_auth.get_sts_tokens(roles, assertion, duration)
+    rejected = [role for role, _, error in results if is_rejected_assertion(error)]
+    if rejected:
+        # The assertion may have come from ~/.okta-saml-cache; fetch a new one once.
+        logger.warning("AWS rejected the SAML assertion; fetching a new one.")
+        _, assertion = okta.get_assertion(refresh=True)
+        retried = {
+            role: (sts_token, error)
+            for role, sts_token, error in aws_auth.get_sts_tokens(
+                rejected, assertion, duration
+            )
+        }
+        results = [
+            (role,) + retried.get(role, (sts_token, error))
+            for role, sts_token, error in results
+        ]
+    profile_names = batch_profile_names(roles)
+
+    tokens = []
+    failures = 0
+    for role, sts_token, error in results:
+        if error is not None:
+            failures += 1
+            print("FAILED  %s: %s" % (role[0], error))
+            continue
+        profile_name = profile_names[role[0]]
+        tokens.append(
+            {
+                "profile": profile_name,
+                "access_key_id": sts_token["AccessKeyId"],
+                "secret_access_key": sts_token["SecretAccessKey"],
+                "session_token": sts_token["SessionToken"],
+                "region": resolve_region(
+                    okta_auth_config, okta_profile, profile_name, region, logger
+                ),
+                "expiration": sts_token["Expiration"],
+                "role_arn": role[0],
+            }
+        )
+        print("OK      %s -> %s" % (role[0], profile_name))
+
+    if tokens:
+        aws_auth.write_sts_tokens(tokens)
+    print(
+        "%d of %d roles refreshed, valid for %s hours"
+        % (len(tokens), len(results), round(duration / 3600, 1))
+    )
+    exit(1 if failures else 0)
+
+
+def batch_profile_names(roles):
+    """Maps role ARNs to profile names, named after the account alias where possible
+
+    Roles sharing an account get the role name appended so profiles don't collide.
+    """
+    base_names = {}
+    for role_arn, _, alias in roles:
+        base_names[role_arn] = (
+            alias if alias not in (None, "unknown") else role_arn.split(":")[4]
+        )
+    counts = {}
+    for base_name in base_names.values():
+        counts[base_name] = counts.get(base_name, 0) + 1
+    return {
+        role_arn: (
+            base_name
+            if counts[base_name] == 1
+            else "%s-%s" % (base_name, role_arn.split("/")[-1])
+        )
+        for role_arn, base_name in base_names.items()
+    }
+
+
+def print_lock_status():
+    """Prints whether each okta-awscli lock is held, and by whom"""
+    home = os.path.expanduser("~")
+    lock_files = [os.path.join(home, name + ".lock") for name in LOCKED_FILES]
+    cache_dir = os.path.join(home, _credential_cache.CACHE_DIR_NAME)
+    if os.path.isdir(cache_dir):
+        lock_files.extend(
+            os.path.join(cache_dir, name)
+            for name in sorted(os.listdir(cache_dir))
+            if name.endswith(".lock")
+        )
+    for lock_file in lock_files:
+        status = _locking.lock_status(lock_file)
+        if status["shared"]:
+            state = "held shared by readers"
+        elif status["held"]:
+            state = _locking.describe_holder(status["holder"])
+        elif status["holder"]:
+            # The holder died without releasing cleanly; flock already let go.
+            state = "free (stale holder record: %s)" % _locking.describe_holder(
+                status["holder"]
+            )
+        else:
+            state = "free"
+        print("%s: %s" % (lock_file.replace(home, "~", 1), state))
+
+
+def finish_timings(recorder, timings, timings_json, logger):
+    """Stops recording and reports the run's phase timings"""
+    _timing.disable()
+    total_ms = (time.perf_counter() - recorder.start) * 1000
+    if timings:
+        _timing.report(recorder, total_ms)
+    if timings_json:
+        try:
+            _timing.write_json(recorder, total_ms, timings_json, __version__)
+        except OSError as ex:
+            logger.warning("Could not write timings to %s: %s", timings_json, ex)
+
+
 def console_output(access_key_id, secret_access_key, session_token, verbose):
     """Outputs STS credentials to console"""
     if verbose:
@@ -200,6 +636,63 @@ to ~/.okta-credentials.cache\n",
 Also writes AWS credentials to default profile ",
 )
 @click.option("-r", "--region", help="The AWS region to export credentials for")
+@click.option(
+    "-b",
+    "--batch",
+    multiple=True,
+    help="Role ARN, account alias or glob pattern to write credentials for. \
+Repeatable; all matching roles are refreshed from one Okta login, each to a \
+profile named after its account alias.",
+)
+@click.option(
+    "--credential-process",
+    is_flag=True,
+    help="Prints credentials as JSON for use as an AWS SDK \
+credential_process, reusing cached credentials until they expire",
+)
+@click.option(
+    "--refresh-apps",
+    is_flag=True,
+    help="Ignores the cached Okta app list in ~/.okta-apps-cache \
+and fetches it again",
+)
+@click.option(
+    "--agent",
+    is_flag=True,
+    help="Runs a credential agent that keeps credentials in memory, \
+refreshes them before they expire and serves them on ~/.okta-awscli-agent.sock",
+)
+@click.option(
+    "--from-agent",
+    is_flag=True,
+    help="Prints credential_process JSON fetched from a running \
+okta-awscli agent",
+)
+@click.option(
+    "--refresh-within",
+    type=click.IntRange(min=1),
+    metavar="MINUTES",
+    help="Refreshes the --profile credentials only if they expire \
+within MINUTES, after a per-host delay of up to refresh-jitter seconds; exits \
+3 without contacting Okta otherwise",
+)
+@click.option(
+    "--lock-status",
+    is_flag=True,
+    help="Shows which okta-awscli lock files are held, by which process \
+and for what, then exits",
+)
+@click.option(
+    "--timings",
+    is_flag=True,
+    help="Prints how long each phase of the run took to stderr",
+)
+@click.option(
+    "--timings-json",
+    type=click.Path(dir_okay=False, writable=True),
+    metavar="PATH",
+    help="Appends this run's phase timings to PATH as one JSON line",
+)
 @click.argument("awscli_args", nargs=-1, type=click.UNPROCESSED)
 def main(
     okta_profile,
@@ -216,6 +709,15 @@ def main(
     reset,
     account,
     region,
+    batch,
+    credential_process,
+    refresh_apps,
+    agent,
+    from_agent,
+    refresh_within,
+    timings,
+    timings_json,
+    lock_status,
 ):
     """Authenticate to awscli using Okta"""
     if version:
@@ -234,6 +736,10 @@ def main(
         handler.setLevel(logging.DEBUG)
     logger.addHandler(handler)
 
+    if lock_status:
+        print_lock_status()
+        exit(0)
+
     if not okta_profile:
         okta_profile = "default"
     if account:
@@ -241,7 +747,43 @@ def main(
         okta_profile = account
     if region:
         logger.debug("Overwriting region to be %s", region)
+    if refresh_within and not profile:
+        logger.error("--refresh-within needs --profile or --account. Exiting.")
+        exit(1)
+    recorder = _timing.enable() if timings or timings_json else None
     try:
+        if from_agent:
+            get_agent_credentials(okta_profile, account, logger)
+        if agent:
+            serve_agent(
+                verbose, logger, token, reset, region, debug, refresh_apps=refresh_apps
+            )
+        if credential_process:
+            get_credential_process_credentials(
+                okta_profile,
+                account,
+                verbose,
+                logger,
+                token,
+                reset,
+                force,
+                region,
+                debug,
+                refresh_apps=refresh_apps,
+            )
+        if batch:
+            get_batch_credentials(
+                okta_profile,
+                batch,
+                account,
+                verbose,
+                logger,
+                token,
+                reset,
+                region,
+                debug=debug,
+                refresh_apps=refresh_apps,
+            )
         get_credentials(
             okta_profile,
             profile,
@@ -256,15 +798,24 @@ def main(
             force,
             region,
             debug=debug,
+            refresh_apps=refresh_apps,
+            refresh_within=None if refresh_within is None else refresh_within * 60,
         )
     except Timeout as exc:
         # Use print() so click's CliRunner captures the message in result.output;
         # the logger writes to stderr which CliRunner doesn't capture by default.
         print(
             "Could not acquire lock on %s — another okta-awscli process is "
-            "holding it. Try again." % exc.lock_file
+            "holding it (%s). Try again."
+            % (
+                exc.lock_file,
+                _locking.describe_holder(_locking.read_holder(exc.lock_file)),
+            )
         )
         exit(1)
+    finally:
+        if recorder is not None:
+            finish_timings(recorder, timings, timings_json, logger)
 
     if awscli_args:
         cmdline = ["aws", "--profile", profile] + list(awscli_args)
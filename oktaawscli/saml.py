@@ -0,0 +1,91 @@
+"""Parsed SAML assertions
+
+Okta's SAMLResponse is decoded and parsed once, by `parse_assertion`, into a
+`SamlAssertion`. STS is sent the base64 form it arrived in.
+"""
+
+import base64
+import binascii
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+from oktaawscli._timestamps import parse_expiration
+
+SAML_ASSERTION_NS = "{urn:oasis:names:tc:SAML:2.0:assertion}"
+ROLE_ATTRIBUTE = "https://aws.amazon.com/SAML/Attributes/Role"
+SESSION_DURATION_ATTRIBUTE = "https://aws.amazon.com/SAML/Attributes/SessionDuration"
+
+RoleTuple = namedtuple("RoleTuple", ["principal_arn", "role_arn"])
+
+SamlAssertion = namedtuple(
+    "SamlAssertion",
+    ["raw", "roles", "session_duration", "not_on_or_after", "subject"],
+)
+SamlAssertion.__doc__ = """A SAMLResponse as sent by Okta
+
+raw: the base64 SAMLResponse, as passed to AssumeRoleWithSAML
+roles: the RoleTuples granted by the AWS Role attribute
+session_duration: the AWS SessionDuration attribute in seconds, or None
+not_on_or_after: the earliest NotOnOrAfter as an aware datetime, or None
+subject: the Subject's NameID, or None
+"""
+
+
+def _attribute_values(root, name):
+    for attribute in root.iter(SAML_ASSERTION_NS + "Attribute"):
+        if attribute.get("Name") == name:
+            for value in attribute.iter(SAML_ASSERTION_NS + "AttributeValue"):
+                yield (value.text or "").strip()
+
+
+def parse_assertion(assertion):
+    """Parses a base64 SAMLResponse into a SamlAssertion
+
+    A SamlAssertion is returned as it is. Raises ValueError if `assertion`
+    isn't base64-encoded XML.
+    """
+    if isinstance(assertion, SamlAssertion):
+        return assertion
+    try:
+        root = ET.fromstring(base64.b64decode(assertion))
+    except (binascii.Error, ValueError, ET.ParseError) as ex:
+        raise ValueError("Invalid SAML assertion: %s" % ex) from ex
+
+    roles = [
+        RoleTuple(*value.split(","))
+        for value in _attribute_values(root, ROLE_ATTRIBUTE)
+    ]
+    session_duration = None
+    for value in _attribute_values(root, SESSION_DURATION_ATTRIBUTE):
+        if value.isdigit():
+            session_duration = int(value)
+            break
+    deadlines = [
+        parse_expiration(element.get("NotOnOrAfter"))
+        for element in root.iter()
+        if element.get("NotOnOrAfter")
+    ]
+    deadlines = [deadline for deadline in deadlines if deadline is not None]
+    name_id = next(
+        (
+            name_id
+            for subject in root.iter(SAML_ASSERTION_NS + "Subject")
+            for name_id in subject.iter(SAML_ASSERTION_NS + "NameID")
+        ),
+        None,
+    )
+    raw = assertion.decode("ascii") if isinstance(assertion, bytes) else assertion
+    return SamlAssertion(
+        raw=raw,
+        roles=roles,
+        session_duration=session_duration,
+        not_on_or_after=min(deadlines) if deadlines else None,
+        subject=name_id.text.strip() if name_id is not None and name_id.text else None,
+    )
+
+
+def encoded(assertion):
+    """Returns the base64 SAMLResponse of a SamlAssertion or raw assertion"""
+    if isinstance(assertion, SamlAssertion):
+        return assertion.raw
+    return assertion
@@ -0,0 +1,118 @@
+"""Tests for oktaawscli.agent."""
+
+import logging
+import os
+import stat
+import threading
+from datetime import datetime, timedelta, timezone
+
+from tests.test_locking import _HomeIsolatedTestCase
+
+
+def _document(expires_in=3600, key_id="AKIA_TEST"):
+    expiration = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+    return {
+        "Version": 1,
+        "AccessKeyId": key_id,
+        "SecretAccessKey": "secret_TEST",
+        "SessionToken": "session_TEST",
+        "Expiration": expiration.strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+
+
+class TestCredentialAgent(_HomeIsolatedTestCase):
+    """The agent serves in-memory credentials over a user-only Unix socket."""
+
+    def setUp(self):
+        super().setUp()
+        self.fetched = []
+        self.documents = [_document()]
+
+    def _fetch(self, okta_profile, account):
+        self.fetched.append((okta_profile, account))
+        document = self.documents[min(len(self.fetched), len(self.documents)) - 1]
+        if isinstance(document, Exception):
+            raise document
+        return document
+
+    def _serve(self):
+        from oktaawscli.agent import CredentialAgent, socket_path
+
+        agent = CredentialAgent(self._fetch, logging.getLogger("test"), margin=300)
+        server = agent.make_server(socket_path())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return agent
+
+    def test_repeat_requests_are_served_from_memory(self):
+        from oktaawscli.agent import request_credentials
+
+        self._serve()
+        first = request_credentials("default", None)
+        second = request_credentials("default", None)
+
+        self.assertEqual(first, self.documents[0])
+        self.assertEqual(second, first)
+        self.assertEqual(self.fetched, [("default", None)])
+
+    def test_profiles_and_accounts_are_cached_separately(self):
+        from oktaawscli.agent import request_credentials
+
+        self._serve()
+        request_credentials("default", None)
+        request_credentials("prod", "prod")
+        request_credentials("prod", "prod")
+
+        self.assertEqual(self.fetched, [("default", None), ("prod", "prod")])
+
+    def test_socket_is_user_only(self):
+        from oktaawscli.agent import socket_path
+
+        self._serve()
+        mode = stat.S_IMODE(os.stat(socket_path()).st_mode)
+        self.assertEqual(mode, 0o600)
+
+    def test_fetch_errors_are_returned_to_the_client(self):
+        from oktaawscli.agent import AgentError, request_credentials
+
+        self.documents = [RuntimeError("MFA rejected")]
+        self._serve()
+        with self.assertRaisesRegex(AgentError, "MFA rejected"):
+            request_credentials("default", None)
+
+    def test_missing_agent_raises_agent_error(self):
+        from oktaawscli.agent import AgentError, request_credentials
+
+        with self.assertRaisesRegex(AgentError, "unavailable"):
+            request_credentials("default", None)
+
+    def test_stale_socket_is_replaced(self):
+        import socket
+
+        from oktaawscli.agent import request_credentials, socket_path
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as dead:
+            dead.bind(socket_path())
+        self._serve()
+        self.assertEqual(request_credentials("default", None), self.documents[0])
+
+    def test_expiring_credentials_are_refreshed_ahead_of_time(self):
+        self.documents = [_document(expires_in=330), _document(key_id="AKIA_NEW")]
+        agent = self._serve()
+        agent.credentials("default", None)
+
+        agent.refresh_expiring()
+
+        self.assertEqual(len(self.fetched), 2)
+        self.assertEqual(agent.credentials("default", None)["AccessKeyId"], "AKIA_NEW")
+
+    def test_failed_refresh_keeps_serving_current_credentials(self):
+        self.documents = [_document(expires_in=330), RuntimeError("Okta down")]
+        agent = self._serve()
+        agent.credentials("default", None)
+
+        agent.refresh_expiring()
+
+        self.assertEqual(agent.credentials("default", None)["AccessKeyId"], "AKIA_TEST")
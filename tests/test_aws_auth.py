@@ -0,0 +1,714 @@
+"""Tests for oktaawscli.aws_auth."""
+
+import json
+import os
+import threading
+import time
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from tests.test_locking import _HomeIsolatedTestCase
+
+RoleTuple = namedtuple("RoleTuple", ["principal_arn", "role_arn"])
+
+
+def _roles(*account_ids):
+    return [
+        RoleTuple(
+            f"arn:aws:iam::{account_id}:saml-provider/p",
+            f"arn:aws:iam::{account_id}:role/r",
+        )
+        for account_id in account_ids
+    ]
+
+
+class TestConcurrentAliasResolution(_HomeIsolatedTestCase):
+    """`AwsAuth.__get_role_info` resolves stale aliases over a bounded worker pool."""
+
+    def setUp(self):
+        super().setUp()
+        self.info_path = os.path.join(self.tempdir, ".okta-alias-info")
+
+    def _write_config(self, body):
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write(body)
+
+    def test_lookups_run_concurrently_up_to_configured_limit(self):
+        self._write_config("[default]\nalias-concurrency = 3\n")
+        auth = self._make_aws_auth("test")
+        self.assertEqual(auth.alias_limits.concurrency, 3)
+
+        in_flight = []
+        peak = []
+        guard = threading.Lock()
+
+        def fake_alias(role_arn, principal_arn, assertion):
+            with guard:
+                in_flight.append(role_arn)
+                peak.append(len(in_flight))
+            time.sleep(0.1)
+            with guard:
+                in_flight.remove(role_arn)
+            return "alias-" + role_arn.split(":")[4]
+
+        with mock.patch.object(
+            auth, "_AwsAuth__get_account_alias", side_effect=fake_alias
+        ):
+            result = auth._AwsAuth__get_role_info(
+                _roles("111", "222", "333", "444", "555", "666"), b"unused"
+            )
+
+        self.assertEqual(max(peak), 3)
+        self.assertEqual(
+            [alias for _, _, alias in result],
+            [f"alias-{n}" for n in ("111", "222", "333", "444", "555", "666")],
+        )
+
+    def test_failed_lookup_does_not_block_or_get_cached(self):
+        from botocore.exceptions import ReadTimeoutError
+
+        auth = self._make_aws_auth("test")
+
+        def fake_alias(role_arn, principal_arn, assertion):
+            if "222" in role_arn:
+                raise ReadTimeoutError(endpoint_url="https://sts.amazonaws.com")
+            if "333" in role_arn:
+                return None
+            return "acct-one"
+
+        with mock.patch.object(
+            auth, "_AwsAuth__get_account_alias", side_effect=fake_alias
+        ):
+            result = auth._AwsAuth__get_role_info(
+                _roles("111", "222", "333"), b"unused"
+            )
+
+        self.assertEqual(
+            result,
+            [
+                (
+                    "arn:aws:iam::111:role/r",
+                    "arn:aws:iam::111:saml-provider/p",
+                    "acct-one",
+                ),
+                (
+                    "arn:aws:iam::222:role/r",
+                    "arn:aws:iam::222:saml-provider/p",
+                    None,
+                ),
+            ],
+        )
+        with open(self.info_path) as f:
+            cached = json.load(f)
+        self.assertEqual(list(cached), ["111"])
+
+    def test_lookups_ignore_aws_profile_without_changing_it(self):
+        auth = self._make_aws_auth("test")
+        seen = []
+
+        def fake_alias(role_arn, principal_arn, assertion):
+            seen.append(os.environ.get("AWS_PROFILE"))
+            # Raises ProfileNotFound if the missing profile were read.
+            auth._AwsAuth__thread_client("sts", 1, region_name="us-east-1")
+            return "acct"
+
+        with mock.patch.dict(os.environ, {"AWS_PROFILE": "missing"}), mock.patch.object(
+            auth, "_AwsAuth__get_account_alias", side_effect=fake_alias
+        ):
+            result = auth._AwsAuth__get_role_info(_roles("111", "222"), b"unused")
+
+        self.assertEqual(seen, ["missing", "missing"])
+        self.assertEqual([alias for _, _, alias in result], ["acct", "acct"])
+
+
+class _AliasCacheTestCase(_HomeIsolatedTestCase):
+    """Helpers for ~/.okta-alias-info tests; entries are keyed by account ID."""
+
+    def setUp(self):
+        from datetime import date, timedelta
+
+        super().setUp()
+        self.info_path = os.path.join(self.tempdir, ".okta-alias-info")
+        self.today = date.today().isoformat()
+        self.stale = (date.today() - timedelta(days=8)).isoformat()
+        self.expired = (date.today() - timedelta(days=40)).isoformat()
+
+    def _write_info(self, entries):
+        with open(self.info_path, "w") as f:
+            json.dump(
+                {
+                    account: {"alias": alias, "last_updated": updated}
+                    for account, (alias, updated) in entries.items()
+                },
+                f,
+            )
+
+    def _read_info(self):
+        with open(self.info_path) as f:
+            return {
+                account: (entry["alias"], entry["last_updated"])
+                for account, entry in json.load(f).items()
+            }
+
+    def _role_info(self, roles, fake_alias, before_join=None):
+        """Runs __get_role_info, then waits out any background refresh"""
+        from oktaawscli.aws_auth import join_background_threads
+
+        auth = self._make_aws_auth("test")
+        with mock.patch.object(
+            auth, "_AwsAuth__get_account_alias", side_effect=fake_alias
+        ):
+            result = auth._AwsAuth__get_role_info(roles, b"unused")
+            if before_join:
+                before_join()
+            join_background_threads()
+        return result
+
+
+class TestAliasCacheMerge(_AliasCacheTestCase):
+    """~/.okta-alias-info is merged into, written only on change and aged out."""
+
+    def setUp(self):
+        super().setUp()
+        # Look stale aliases up right away; TestStaleAliases covers the grace.
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write("[default]\nalias-stale-grace = 0\n")
+
+    def test_filtered_run_keeps_other_accounts(self):
+        self._write_info({"111": ("one", self.today), "222": ("two", self.stale)})
+
+        self._role_info(_roles("222"), lambda *args: "two-new")
+
+        self.assertEqual(
+            self._read_info(),
+            {"111": ("one", self.today), "222": ("two-new", self.today)},
+        )
+
+    def test_all_hits_do_not_write(self):
+        self._write_info({"111": ("one", self.today), "222": ("two", self.today)})
+
+        with mock.patch("oktaawscli.aws_auth.atomic_write") as mock_write:
+            result = self._role_info(_roles("111"), AssertionError)
+
+        mock_write.assert_not_called()
+        self.assertEqual([alias for _, _, alias in result], ["one"])
+
+    def test_unchanged_merge_does_not_write(self):
+        from datetime import date
+
+        self._write_info({"111": ("one", self.today)})
+        auth = self._make_aws_auth("test")
+
+        with mock.patch("oktaawscli.aws_auth.atomic_write") as mock_write:
+            auth._AwsAuth__merge_alias_info(
+                self.info_path,
+                {"111": "one"},
+                date.today(),
+            )
+
+        mock_write.assert_not_called()
+
+    def test_unassumable_role_is_dropped(self):
+        self._write_info({"111": ("one", self.stale), "222": ("two", self.today)})
+
+        self._role_info(_roles("111"), lambda *args: None)
+
+        self.assertEqual(self._read_info(), {"222": ("two", self.today)})
+
+    def test_concurrent_writes_are_merged(self):
+        self._write_info({"111": ("one", self.stale)})
+
+        def fake_alias(role_arn, principal_arn, assertion):
+            # Another run saves its alias while this one is resolving.
+            self._write_info({"111": ("one", self.stale), "333": ("three", self.today)})
+            return "one"
+
+        self._role_info(_roles("111"), fake_alias)
+
+        self.assertEqual(
+            self._read_info(),
+            {"111": ("one", self.today), "333": ("three", self.today)},
+        )
+
+    def test_old_and_excess_entries_are_evicted(self):
+        from datetime import date, timedelta
+
+        self._write_info(
+            {
+                "111": ("one", self.stale),
+                "222": ("two", self.expired),
+                "333": ("three", (date.today() - timedelta(days=2)).isoformat()),
+                "444": ("four", (date.today() - timedelta(days=1)).isoformat()),
+            }
+        )
+
+        with mock.patch("oktaawscli.aws_auth.ALIAS_CACHE_MAX_ENTRIES", 2):
+            self._role_info(_roles("111"), lambda *args: "one")
+
+        self.assertEqual(
+            sorted(self._read_info()),
+            ["111", "444"],
+        )
+
+
+class TestPerAccountAliases(_AliasCacheTestCase):
+    """Each account's alias is looked up once, through any role that can read it."""
+
+    def _account_roles(self, account_id, *names):
+        return [
+            RoleTuple(
+                f"arn:aws:iam::{account_id}:saml-provider/p",
+                f"arn:aws:iam::{account_id}:role/{name}",
+            )
+            for name in names
+        ]
+
+    def test_one_lookup_per_account(self):
+        calls = []
+
+        def fake_alias(role_arn, principal_arn, assertion):
+            calls.append(role_arn)
+            return "alias-" + role_arn.split(":")[4]
+
+        result = self._role_info(
+            self._account_roles("111", "a", "b", "c")
+            + self._account_roles("222", "a", "b"),
+            fake_alias,
+        )
+
+        self.assertEqual(
+            sorted(calls), ["arn:aws:iam::111:role/a", "arn:aws:iam::222:role/a"]
+        )
+        self.assertEqual(len(result), 5)
+        self.assertEqual(
+            self._read_info(),
+            {"111": ("alias-111", self.today), "222": ("alias-222", self.today)},
+        )
+
+    def test_denied_role_falls_back_to_next_role(self):
+        verdicts = {"a": None, "b": "unknown", "c": "one"}
+        calls = []
+
+        def fake_alias(role_arn, principal_arn, assertion):
+            calls.append(role_arn.rsplit("/", 1)[1])
+            return verdicts[role_arn.rsplit("/", 1)[1]]
+
+        result = self._role_info(self._account_roles("111", "a", "b", "c"), fake_alias)
+
+        self.assertEqual(calls, ["a", "b", "c"])
+        self.assertEqual(
+            [(arn.rsplit("/", 1)[1], alias) for arn, _, alias in result],
+            [("b", "one"), ("c", "one")],
+        )
+        self.assertEqual(self._read_info(), {"111": ("one", self.today)})
+
+    def test_new_role_in_known_account_is_a_cache_hit(self):
+        self._write_info({"111": ("one", self.today)})
+
+        result = self._role_info(self._account_roles("111", "new"), AssertionError)
+
+        self.assertEqual([alias for _, _, alias in result], ["one"])
+
+    def test_role_arn_keys_are_migrated(self):
+        with open(self.info_path, "w") as f:
+            json.dump(
+                {
+                    "arn:aws:iam::111:role/a": {
+                        "alias": "one",
+                        "last_updated": self.stale,
+                    },
+                    "arn:aws:iam::111:role/b": {
+                        "alias": "one",
+                        "last_updated": self.today,
+                    },
+                    "arn:aws:iam::222:role/a": {
+                        "alias": "two",
+                        "last_updated": self.today,
+                    },
+                },
+                f,
+            )
+
+        result = self._role_info(_roles("111", "333"), lambda role_arn, *_: "three")
+
+        self.assertEqual([alias for _, _, alias in result], ["one", "three"])
+        self.assertEqual(
+            self._read_info(),
+            {
+                "111": ("one", self.today),
+                "222": ("two", self.today),
+                "333": ("three", self.today),
+            },
+        )
+
+
+class TestStaleAliases(_AliasCacheTestCase):
+    """Aliases within alias-stale-grace are served at once and refreshed later."""
+
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write("[default]\nalias-ttl = 7\nalias-stale-grace = 10\n")
+
+    def test_stale_alias_is_served_while_refreshing(self):
+        self._write_info({"111": ("one", self.stale)})
+        release = threading.Event()
+
+        def fake_alias(role_arn, principal_arn, assertion):
+            release.wait(5)
+            return "one-renamed"
+
+        def check_then_release():
+            self.assertEqual(self._read_info(), {"111": ("one", self.stale)})
+            release.set()
+
+        result = self._role_info(
+            _roles("111"), fake_alias, before_join=check_then_release
+        )
+
+        self.assertEqual([alias for _, _, alias in result], ["one"])
+        self.assertEqual(self._read_info(), {"111": ("one-renamed", self.today)})
+
+    def test_alias_past_grace_is_looked_up_first(self):
+        from datetime import date, timedelta
+
+        self._write_info(
+            {"111": ("one", (date.today() - timedelta(days=17)).isoformat())}
+        )
+
+        with mock.patch("oktaawscli.aws_auth.run_in_background") as mock_background:
+            result = self._role_info(_roles("111"), lambda *args: "one-renamed")
+
+        mock_background.assert_not_called()
+        self.assertEqual([alias for _, _, alias in result], ["one-renamed"])
+
+    def test_fresh_alias_starts_no_refresh(self):
+        self._write_info({"111": ("one", self.today)})
+
+        with mock.patch("oktaawscli.aws_auth.run_in_background") as mock_background:
+            self._role_info(_roles("111"), AssertionError)
+
+        mock_background.assert_not_called()
+
+    def test_failed_refresh_keeps_stale_alias(self):
+        from botocore.exceptions import ReadTimeoutError
+
+        self._write_info({"111": ("one", self.stale)})
+
+        def fake_alias(role_arn, principal_arn, assertion):
+            raise ReadTimeoutError(endpoint_url="https://sts.amazonaws.com")
+
+        self._role_info(_roles("111"), fake_alias)
+
+        self.assertEqual(self._read_info(), {"111": ("one", self.stale)})
+
+
+class TestBackgroundThreads(unittest.TestCase):
+    """The exit wait for background work is bounded."""
+
+    def test_threads_are_waited_on_together(self):
+        from oktaawscli.aws_auth import join_background_threads, run_in_background
+
+        release = threading.Event()
+        self.addCleanup(release.set)
+        for _ in range(3):
+            run_in_background(release.wait, 0.2, name="test-blocked")
+
+        start = time.monotonic()
+        join_background_threads()
+        self.assertLess(time.monotonic() - start, 0.5)
+
+
+class TestOfflineCredentialCheck(_HomeIsolatedTestCase):
+    """`AwsAuth.check_sts_token` decides validity from the stored expiration."""
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.tempdir, ".aws"))
+
+    def _write_profile(self, expires_in=None, role_arn=None):
+        from datetime import datetime, timedelta, timezone
+
+        auth = self._make_aws_auth("p")
+        expiration = None
+        if expires_in is not None:
+            expiration = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+        auth.write_sts_token(
+            "p", "AKIA", "secret", "session", expiration=expiration, role_arn=role_arn
+        )
+
+    def _check(self, auth=None):
+        auth = auth or self._make_aws_auth("p")
+        with mock.patch("boto3.Session", side_effect=AssertionError("network")):
+            return auth.check_sts_token("p")
+
+    def test_unexpired_credentials_are_valid_without_network(self):
+        self._write_profile(expires_in=3600)
+        self.assertTrue(self._check())
+
+    def test_credentials_inside_safety_margin_are_refreshed(self):
+        self._write_profile(expires_in=120)
+        self.assertFalse(self._check())
+
+    def test_safety_margin_is_configurable(self):
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write("[default]\nexpiry-margin = 60\n")
+        self._write_profile(expires_in=120)
+        self.assertTrue(self._check())
+
+    def test_credentials_for_another_role_are_refreshed(self):
+        self._write_profile(expires_in=3600, role_arn="arn:aws:iam::111:role/a")
+        auth = self._make_aws_auth("p")
+        auth.role = "arn:aws:iam::111:role/b"
+        self.assertFalse(self._check(auth))
+
+    def test_missing_expiration_is_refreshed_without_network(self):
+        self._write_profile()
+        self.assertFalse(self._check())
+
+    def test_missing_expiration_falls_back_to_sts_when_enabled(self):
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write("[default]\nremote-creds-check = True\n")
+        self._write_profile()
+        auth = self._make_aws_auth("p")
+        with mock.patch("boto3.Session") as mock_session:
+            self.assertTrue(auth.check_sts_token("p"))
+        mock_session.return_value.client.return_value.get_caller_identity.assert_called_once_with()
+
+    def test_rewrite_without_expiration_drops_stale_metadata(self):
+        from configparser import ConfigParser
+
+        self._write_profile(expires_in=3600, role_arn="arn:aws:iam::111:role/a")
+        self._write_profile()
+        config = ConfigParser()
+        config.read(os.path.join(self.tempdir, ".aws", "credentials"))
+        self.assertFalse(config.has_option("p", "x_security_token_expires"))
+        self.assertFalse(config.has_option("p", "x_role_arn"))
+
+
+def _assertion(*roles):
+    """Builds a base64 SAML assertion listing `roles` as (principal_arn, role_arn)."""
+    import base64
+
+    values = "".join(
+        "<saml2:AttributeValue>%s,%s</saml2:AttributeValue>" % role for role in roles
+    )
+    xml = (
+        '<saml2p:Response xmlns:saml2p="urn:oasis:names:tc:SAML:2.0:protocol" '
+        'xmlns:saml2="urn:oasis:names:tc:SAML:2.0:assertion"><saml2:Assertion>'
+        "<saml2:AttributeStatement>"
+        '<saml2:Attribute Name="https://aws.amazon.com/SAML/Attributes/Role">'
+        "%s</saml2:Attribute></saml2:AttributeStatement>"
+        "</saml2:Assertion></saml2p:Response>" % values
+    )
+    return base64.b64encode(xml.encode()).decode()
+
+
+class TestLazyRoleChoice(_HomeIsolatedTestCase):
+    """Aliases are looked up only for the menu or when a profile is named after one."""
+
+    def setUp(self):
+        super().setUp()
+        self.roles = [
+            ("arn:aws:iam::111:saml-provider/p", "arn:aws:iam::111:role/admin"),
+            ("arn:aws:iam::222:saml-provider/p", "arn:aws:iam::222:role/admin"),
+        ]
+        self.lookups = []
+
+    def _choose(self, config, resolve_alias, roles=None):
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write("[default]\n" + config)
+        auth = self._make_aws_auth("test")
+
+        def fake_alias(role_arn, principal_arn, assertion):
+            self.lookups.append(role_arn)
+            return "alias-" + role_arn.split(":")[4]
+
+        with mock.patch.object(
+            auth, "_AwsAuth__get_account_alias", side_effect=fake_alias
+        ):
+            return auth.choose_aws_role(
+                _assertion(*(roles or self.roles)), resolve_alias=resolve_alias
+            )
+
+    def test_predefined_role_makes_no_lookups(self):
+        role = self._choose("role = arn:aws:iam::222:role/admin\n", False)
+
+        self.assertEqual(
+            role,
+            ("arn:aws:iam::222:role/admin", "arn:aws:iam::222:saml-provider/p", None),
+        )
+        self.assertEqual(self.lookups, [])
+
+    def test_only_role_makes_no_lookups(self):
+        role = self._choose("", False, roles=self.roles[:1])
+
+        self.assertEqual(role[0], "arn:aws:iam::111:role/admin")
+        self.assertEqual(self.lookups, [])
+
+    def test_alias_is_resolved_for_the_chosen_role_only(self):
+        role = self._choose("role = arn:aws:iam::222:role/admin\n", True)
+
+        self.assertEqual(role[2], "alias-222")
+        self.assertEqual(self.lookups, ["arn:aws:iam::222:role/admin"])
+
+    def test_failed_lookup_leaves_alias_unresolved(self):
+        from botocore.exceptions import ReadTimeoutError
+
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write("[default]\nrole = arn:aws:iam::222:role/admin\n")
+        auth = self._make_aws_auth("test")
+        with mock.patch.object(
+            auth,
+            "_AwsAuth__get_account_alias",
+            side_effect=ReadTimeoutError(endpoint_url="https://sts.amazonaws.com"),
+        ):
+            role = auth.choose_aws_role(_assertion(*self.roles), resolve_alias=True)
+
+        self.assertEqual(role[0], "arn:aws:iam::222:role/admin")
+        self.assertIsNone(role[2])
+
+    def test_menu_resolves_every_alias(self):
+        with mock.patch("builtins.input", return_value="2"), mock.patch(
+            "builtins.print"
+        ):
+            role = self._choose("", False)
+
+        self.assertEqual(role[2], "alias-222")
+        self.assertEqual(len(self.lookups), 2)
+
+
+class TestBatchRoles(_HomeIsolatedTestCase):
+    """Batch mode selects many roles, assumes them concurrently and writes once."""
+
+    def setUp(self):
+        super().setUp()
+        self.roles = [
+            ("arn:aws:iam::111:saml-provider/p", "arn:aws:iam::111:role/admin"),
+            ("arn:aws:iam::111:saml-provider/p", "arn:aws:iam::111:role/read"),
+            ("arn:aws:iam::222:saml-provider/p", "arn:aws:iam::222:role/admin"),
+        ]
+        aliases = {"111": "prod", "222": "dev"}
+        self.auth = self._make_aws_auth("test")
+        self.enterContext(
+            mock.patch.object(
+                self.auth,
+                "_AwsAuth__get_account_alias",
+                side_effect=lambda role_arn, *_: aliases[role_arn.split(":")[4]],
+            )
+        )
+
+    def test_patterns_match_arn_alias_and_account_id(self):
+        assertion = _assertion(*self.roles)
+        by_alias = self.auth.choose_aws_roles(assertion, ["prod"])
+        by_glob = self.auth.choose_aws_roles(assertion, ["*:role/admin"])
+        by_account = self.auth.choose_aws_roles(assertion, ["222"])
+
+        self.assertEqual(
+            [r[0] for r in by_alias],
+            ["arn:aws:iam::111:role/admin", "arn:aws:iam::111:role/read"],
+        )
+        self.assertEqual(
+            [r[0] for r in by_glob],
+            ["arn:aws:iam::222:role/admin", "arn:aws:iam::111:role/admin"],
+        )
+        self.assertEqual([r[0] for r in by_account], ["arn:aws:iam::222:role/admin"])
+
+    def test_one_failed_role_does_not_abort_the_batch(self):
+        from botocore.exceptions import ClientError
+
+        def fake_assume(role_arn, principal_arn, assertion, duration):
+            if role_arn.endswith("read"):
+                raise ClientError(
+                    {"Error": {"Code": "AccessDenied"}}, "AssumeRoleWithSAML"
+                )
+            return {"AccessKeyId": role_arn}
+
+        roles = [(role_arn, principal, "x") for principal, role_arn in self.roles]
+        with mock.patch.object(
+            self.auth, "_AwsAuth__assume_role", side_effect=fake_assume
+        ):
+            results = self.auth.get_sts_tokens(roles, "assertion", 3600)
+
+        self.assertEqual([r[0] for r in results], roles)
+        self.assertEqual(results[0][1], {"AccessKeyId": "arn:aws:iam::111:role/admin"})
+        self.assertIsNone(results[1][1])
+        self.assertIsInstance(results[1][2], ClientError)
+        self.assertIsNone(results[2][2])
+
+    def test_single_and_batch_calls_share_sts_settings(self):
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write(
+                "[default]\nsts-concurrency = 2\nsts-timeout = 4\nalias-timeout = 9\n"
+            )
+        auth = self._make_aws_auth("test")
+        session = mock.Mock()
+        session.client.return_value.assume_role_with_saml.return_value = {
+            "Credentials": {"AccessKeyId": "AKIA_TEST"}
+        }
+
+        with mock.patch(
+            "oktaawscli.aws_auth._profileless_session", return_value=session
+        ):
+            token = auth.get_sts_token(
+                "arn:aws-us-gov:iam::111:role/r",
+                "arn:aws-us-gov:iam::111:saml-provider/p",
+                "assertion",
+                900,
+            )
+
+        self.assertEqual(token, {"AccessKeyId": "AKIA_TEST"})
+        self.assertEqual(auth.sts_limits, (2, 4.0))
+        self.assertEqual(auth.alias_limits.timeout, 9.0)
+        _, kwargs = session.client.call_args
+        self.assertEqual(kwargs["region_name"], "us-gov-west-1")
+        self.assertEqual(kwargs["config"].read_timeout, 4.0)
+
+    def test_all_profiles_are_written_under_one_lock(self):
+        from configparser import ConfigParser
+
+        from oktaawscli import _locking as locking_module
+
+        tokens = [
+            {
+                "profile": name,
+                "access_key_id": "AKIA_" + name,
+                "secret_access_key": "secret",
+                "session_token": "session",
+            }
+            for name in ("prod-admin", "prod-read", "dev")
+        ]
+        with mock.patch(
+            "oktaawscli._credentials_store.locked", wraps=locking_module.locked
+        ) as mock_locked:
+            self.auth.write_sts_tokens(tokens)
+
+        mock_locked.assert_called_once_with(
+            self.auth.creds_file, purpose="writing credentials"
+        )
+        config = ConfigParser()
+        config.read(self.auth.creds_file)
+        self.assertEqual(config.sections(), ["prod-admin", "prod-read", "dev"])
+        self.assertEqual(config.get("dev", "aws_access_key_id"), "AKIA_dev")
+
+    def test_profile_names_disambiguate_roles_in_the_same_account(self):
+        from oktaawscli.okta_awscli import batch_profile_names
+
+        names = batch_profile_names(
+            [
+                ("arn:aws:iam::111:role/admin", "p", "prod"),
+                ("arn:aws:iam::111:role/read", "p", "prod"),
+                ("arn:aws:iam::222:role/admin", "p", "dev"),
+                ("arn:aws:iam::333:role/admin", "p", "unknown"),
+            ]
+        )
+        self.assertEqual(
+            names,
+            {
+                "arn:aws:iam::111:role/admin": "prod-admin",
+                "arn:aws:iam::111:role/read": "prod-read",
+                "arn:aws:iam::222:role/admin": "dev",
+                "arn:aws:iam::333:role/admin": "333",
+            },
+        )
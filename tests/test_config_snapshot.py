@@ -0,0 +1,108 @@
+"""Tests for oktaawscli._config_snapshot."""
+
+import logging
+import os
+from configparser import ConfigParser
+from unittest import mock
+
+from tests.test_locking import _HomeIsolatedTestCase
+
+
+class TestConfigSnapshot(_HomeIsolatedTestCase):
+    """~/.okta-aws is parsed once per change and shared by every reader."""
+
+    def setUp(self):
+        super().setUp()
+        self.config_path = os.path.join(self.tempdir, ".okta-aws")
+        self._write(
+            "[default]\nbase-url = example.okta.com\nregion = eu-west-1\n"
+            "role = arn:default\nsession-duration = 7200\nalias-ttl = 3\n"
+            "[prod]\nexpiry-margin = 600\nremote-creds-check = yes\n"
+        )
+        self.logger = logging.getLogger("test")
+
+    def _write(self, content):
+        # Replace the file the way _save_config_value does, so the inode changes.
+        tmp_path = self.config_path + ".new"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, self.config_path)
+
+    def _aws_auth(self, okta_profile):
+        from oktaawscli.aws_auth import AwsAuth
+
+        return AwsAuth(
+            profile=None,
+            okta_profile=okta_profile,
+            account=None,
+            verbose=False,
+            logger=self.logger,
+            region="us-east-1",
+            reset=False,
+        )
+
+    def test_config_and_aws_auth_share_one_parse(self):
+        from oktaawscli.okta_auth_config import OktaAuthConfig
+
+        with mock.patch(
+            "oktaawscli._config_snapshot.ConfigParser.read",
+            autospec=True,
+            side_effect=ConfigParser.read,
+        ) as mock_read:
+            OktaAuthConfig(self.logger, reset=False)
+            OktaAuthConfig(self.logger, reset=False)
+            self._aws_auth("prod")
+
+        self.assertEqual(mock_read.call_count, 1)
+
+    def test_changed_file_is_reparsed(self):
+        from oktaawscli._config_snapshot import load_config
+
+        first = load_config(self.config_path)
+        self.assertIs(load_config(self.config_path), first)
+
+        self._write("[default]\nregion = us-west-2\n")
+        second = load_config(self.config_path)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.get("default", "region"), "us-west-2")
+
+    def test_lookups_do_not_touch_the_disk(self):
+        from oktaawscli.okta_auth_config import OktaAuthConfig
+
+        config = OktaAuthConfig(self.logger, reset=False)
+        with mock.patch("os.stat", side_effect=AssertionError("disk I/O")), mock.patch(
+            "builtins.open", side_effect=AssertionError("disk I/O")
+        ):
+            for _ in range(3):
+                self.assertEqual(config.get_session_duration("default"), 7200)
+                self.assertEqual(config.region_for("prod"), "eu-west-1")
+
+    def test_okta_auth_config_inherits_from_existing_profiles_only(self):
+        from oktaawscli.okta_auth_config import OktaAuthConfig
+
+        config = OktaAuthConfig(self.logger, reset=False)
+        self.assertEqual(config.region_for("prod"), "eu-west-1")
+        self.assertEqual(config.get_session_duration("prod"), 7200)
+        self.assertEqual(config.region_for("missing"), "us-east-1")
+
+    def test_aws_auth_inherits_everything_but_role(self):
+        prod = self._aws_auth("prod")
+        self.assertEqual(prod.role, "")
+        self.assertEqual(prod.expiry_margin, 600)
+        self.assertIs(prod.remote_creds_check, True)
+        self.assertEqual(prod.alias_policy.ttl_days, 3)
+
+        default = self._aws_auth("default")
+        self.assertEqual(default.role, "arn:default")
+        self.assertIs(default.remote_creds_check, False)
+
+    def test_saved_values_are_visible_immediately(self):
+        from oktaawscli.okta_auth_config import OktaAuthConfig
+
+        config = OktaAuthConfig(self.logger, reset=False)
+        config.save_chosen_app_for_profile("prod", "AWS Prod")
+
+        self.assertEqual(config.app_for("prod"), "AWS Prod")
+        self.assertEqual(
+            OktaAuthConfig(self.logger, reset=False).app_for("prod"), "AWS Prod"
+        )
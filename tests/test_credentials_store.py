@@ -0,0 +1,178 @@
+"""Tests for oktaawscli._credentials_store."""
+
+import os
+from configparser import ConfigParser
+from unittest import mock
+
+from tests.test_locking import _HomeIsolatedTestCase
+
+
+class TestCredentialsStore(_HomeIsolatedTestCase):
+    """Staged edits reach ~/.aws/credentials in one locked commit."""
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.tempdir, ".aws", "credentials")
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as f:
+            f.write(
+                "[old]\naws_access_key_id = AKIA_OLD\n\n"
+                "[keep]\naws_access_key_id = AKIA_KEEP\nx_role_arn = arn:keep\n\n"
+            )
+
+    def _store(self):
+        from oktaawscli._credentials_store import CredentialsStore
+
+        return CredentialsStore(self.path)
+
+    def _read(self):
+        config = ConfigParser()
+        config.read(self.path)
+        return config
+
+    def test_operations_apply_in_order_under_one_lock(self):
+        from oktaawscli import _locking as locking_module
+
+        store = self._store()
+        store.upsert("new", {"aws_access_key_id": "AKIA_NEW", "region": "eu-west-1"})
+        store.copy("new", "default", ("aws_access_key_id", "region", "x_role_arn"))
+        store.upsert("keep", {"region": "us-east-1"}, remove=["x_role_arn"])
+        store.delete("old")
+        self.assertIn("old", self._read().sections())
+
+        with mock.patch(
+            "oktaawscli._credentials_store.locked", wraps=locking_module.locked
+        ) as mock_locked:
+            self.assertTrue(store.commit())
+
+        mock_locked.assert_called_once_with(self.path, purpose="writing credentials")
+        config = self._read()
+        self.assertEqual(config.sections(), ["keep", "new", "default"])
+        self.assertEqual(config.get("default", "aws_access_key_id"), "AKIA_NEW")
+        self.assertEqual(config.get("default", "region"), "eu-west-1")
+        self.assertFalse(config.has_option("keep", "x_role_arn"))
+
+    def test_unchanged_content_is_not_rewritten(self):
+        store = self._store()
+        inode = os.stat(self.path).st_ino
+
+        store.upsert("keep", {"aws_access_key_id": "AKIA_KEEP"})
+        with mock.patch("oktaawscli._credentials_store.atomic_write") as mock_write:
+            self.assertFalse(store.commit())
+
+        mock_write.assert_not_called()
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+
+    def test_empty_commit_does_not_lock(self):
+        with mock.patch("oktaawscli._credentials_store.locked") as mock_locked:
+            self.assertFalse(self._store().commit())
+        mock_locked.assert_not_called()
+
+    def test_write_default_is_one_commit(self):
+        from datetime import datetime, timezone
+
+        from oktaawscli import _locking as locking_module
+
+        auth = self._make_aws_auth("dev")
+        with mock.patch(
+            "oktaawscli._credentials_store.locked", wraps=locking_module.locked
+        ) as mock_locked:
+            auth.write_sts_token(
+                "dev",
+                "AKIA_DEV",
+                "secret_DEV",
+                "session_DEV",
+                expiration=datetime(2099, 1, 1, tzinfo=timezone.utc),
+                role_arn="arn:dev",
+                write_default=True,
+            )
+
+        mock_locked.assert_called_once_with(self.path, purpose="writing credentials")
+        config = self._read()
+        for profile in ("dev", "default"):
+            self.assertEqual(config.get(profile, "aws_access_key_id"), "AKIA_DEV")
+            self.assertEqual(config.get(profile, "x_role_arn"), "arn:dev")
+            self.assertEqual(
+                config.get(profile, "x_security_token_expires"), "2099-01-01T00:00:00Z"
+            )
+
+
+class TestCredentialsDocument(_HomeIsolatedTestCase):
+    """Edits rewrite only the target profile's block."""
+
+    ORIGINAL = (
+        "# managed by okta-awscli and by hand\n"
+        "[personal]\n"
+        "aws_access_key_id=AKIA_PERSONAL  \n"
+        "; long-lived, do not rotate\n"
+        "aws_secret_access_key : secret_PERSONAL\n"
+        "\n"
+        "[work]\n"
+        "AWS_Access_Key_Id = AKIA_OLD\n"
+        "aws_session_token = line one\n"
+        "\tline two\n"
+        "# trailing note about [work]\n"
+        "\n"
+        "[zeta]\n"
+        "region=us-west-2"
+    )
+
+    def _document(self, text=ORIGINAL):
+        from oktaawscli._credentials_store import CredentialsDocument
+
+        return CredentialsDocument(text)
+
+    def test_untouched_document_round_trips_byte_identical(self):
+        self.assertEqual(self._document().text(), self.ORIGINAL)
+
+    def test_only_target_block_changes(self):
+        document = self._document()
+        document.upsert(
+            "work",
+            {
+                "aws_access_key_id": "AKIA_NEW",
+                "aws_session_token": "tok",
+                "region": "x",
+            },
+        )
+        text = document.text()
+
+        personal_block = self.ORIGINAL[: self.ORIGINAL.index("[work]")]
+        zeta_block = self.ORIGINAL[self.ORIGINAL.index("[zeta]") :]
+        self.assertTrue(text.startswith(personal_block))
+        self.assertTrue(text.endswith(zeta_block))
+        self.assertIn(
+            "[work]\naws_access_key_id = AKIA_NEW\naws_session_token = tok\n"
+            "region = x\n# trailing note about [work]\n\n",
+            text,
+        )
+
+    def test_result_parses_like_configparser_expects(self):
+        document = self._document()
+        document.upsert("new", {"aws_access_key_id": "AKIA_N"})
+        document.upsert("zeta", {"output": "json"}, remove=["region"])
+        document.copy("personal", "default", ("aws_access_key_id", "x_role_arn"))
+        config = ConfigParser()
+        config.read_string(document.text())
+
+        self.assertEqual(
+            config.sections(), ["personal", "work", "zeta", "new", "default"]
+        )
+        self.assertEqual(config.get("work", "aws_session_token"), "line one\nline two")
+        self.assertEqual(config.get("zeta", "output"), "json")
+        self.assertFalse(config.has_option("zeta", "region"))
+        self.assertEqual(config.get("default", "aws_access_key_id"), "AKIA_PERSONAL")
+
+    def test_delete_removes_only_that_block(self):
+        document = self._document()
+        document.delete("work")
+        self.assertEqual(
+            document.text(),
+            self.ORIGINAL[: self.ORIGINAL.index("[work]")]
+            + self.ORIGINAL[self.ORIGINAL.index("[zeta]") :],
+        )
+
+    def test_new_profile_in_empty_file(self):
+        document = self._document("")
+        document.upsert("a", {"region": "eu-west-1"})
+        self.assertEqual(document.text(), "[a]\nregion = eu-west-1\n\n")
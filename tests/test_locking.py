@@ -2,6 +2,7 @@
 
 import multiprocessing
 import os
+import sys
 import tempfile
 import time
 import unittest
@@ -17,6 +18,27 @@ def _hold_lock(lock_file_path, ready_path, hold_seconds):
         time.sleep(hold_seconds)
 
 
+def _hold_locked(target_path, ready_path, hold_seconds, purpose):
+    """Subprocess entry: like _hold_lock, through locked() with a purpose."""
+    from oktaawscli._locking import locked
+
+    with locked(target_path, purpose=purpose):
+        open(ready_path, "w").close()
+        time.sleep(hold_seconds)
+
+
+def _hold_shared(target_path, hold_seconds, times_path):
+    """Subprocess entry: hold a shared lock, appending enter/exit times."""
+    from oktaawscli._locking import locked
+
+    with locked(target_path, shared=True):
+        entered = time.time()
+        time.sleep(hold_seconds)
+        exited = time.time()
+    with open(times_path, "a") as times_file:
+        times_file.write("%f %f\n" % (entered, exited))
+
+
 def _child_write_sts(home_dir, profile_name):
     """Subprocess entry: set HOME, build AwsAuth, call write_sts_token."""
     import logging
@@ -71,6 +93,77 @@ class TestLockingTimeout(unittest.TestCase):
             proc.join(10)
 
 
+@unittest.skipIf(sys.platform == "win32", "shared locks need flock")
+class TestSharedLocks(unittest.TestCase):
+    """Shared locks admit many readers but exclude, and wait for, writers."""
+
+    def setUp(self):
+        self.tempdir = self.enterContext(tempfile.TemporaryDirectory())
+        self.target = os.path.join(self.tempdir, "data.txt")
+
+    def test_shared_holders_coexist_and_exclude_writers(self):
+        from filelock import Timeout
+
+        from oktaawscli._locking import locked
+
+        with locked(self.target, shared=True), locked(self.target, shared=True):
+            with self.assertRaises(Timeout):
+                with locked(self.target, timeout=0.1):
+                    pass
+        with locked(self.target, timeout=0.1):
+            pass
+
+    def test_reader_waits_for_writer_in_another_process(self):
+        from filelock import Timeout
+
+        from oktaawscli._locking import locked
+
+        ready = os.path.join(self.tempdir, "ready")
+        ctx = multiprocessing.get_context("fork")
+        proc = ctx.Process(target=_hold_lock, args=(self.target + ".lock", ready, 0.5))
+        proc.start()
+        try:
+            deadline = time.time() + 5
+            while not os.path.exists(ready) and time.time() < deadline:
+                time.sleep(0.01)
+            with self.assertRaises(Timeout):
+                with locked(self.target, timeout=0.1, shared=True):
+                    pass
+            with locked(self.target, timeout=5, shared=True) as lock:
+                pass
+        finally:
+            proc.join()
+        self.assertGreater(lock.waited, 0.1)
+
+    def test_32_concurrent_readers_hold_the_lock_together(self):
+        readers, hold_seconds = 32, 0.5
+        times_path = os.path.join(self.tempdir, "times")
+        ctx = multiprocessing.get_context("fork")
+        procs = [
+            ctx.Process(
+                target=_hold_shared, args=(self.target, hold_seconds, times_path)
+            )
+            for _ in range(readers)
+        ]
+        start = time.time()
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        elapsed = time.time() - start
+
+        with open(times_path) as times_file:
+            spans = [tuple(map(float, line.split())) for line in times_file]
+        self.assertEqual(len(spans), readers)
+        # Exclusive locks would serialize them: readers * hold_seconds = 16s.
+        self.assertLess(elapsed, readers * hold_seconds / 4)
+        peak = max(
+            sum(1 for entered, exited in spans if entered <= moment < exited)
+            for moment, _ in spans
+        )
+        self.assertGreater(peak, readers // 2)
+
+
 class TestAtomicWrite(unittest.TestCase):
     """`atomic_write(path)` replaces `path` only if the with-block exits cleanly."""
 
@@ -124,7 +217,7 @@ class _HomeIsolatedTestCase(unittest.TestCase):
         """Build a minimally-wired OktaAuth bypassing __init__ for unit tests."""
         import logging
 
-        from oktaawscli.okta_auth import OktaAuth
+        from oktaawscli.okta_auth import OktaAuth, new_http_session
 
         auth = OktaAuth.__new__(OktaAuth)
         auth.logger = logging.getLogger("test")
@@ -137,6 +230,10 @@ class _HomeIsolatedTestCase(unittest.TestCase):
         auth.verbose = False
         auth.debug = False
         auth.token_path = os.path.join(self.tempdir, ".okta-token")
+        auth.session = new_http_session()
+        auth.apps_cache_ttl = 86400
+        auth.refresh_apps = False
+        auth.user_id = None
         return auth
 
     def _make_aws_auth(self, profile):
@@ -168,7 +265,7 @@ class TestWriteStsTokenLocking(_HomeIsolatedTestCase):
 
         auth = self._make_aws_auth("test_profile")
         with mock.patch(
-            "oktaawscli.aws_auth.locked", wraps=locking_module.locked
+            "oktaawscli._credentials_store.locked", wraps=locking_module.locked
         ) as mock_locked:
             auth.write_sts_token(
                 "test_profile",
@@ -176,7 +273,9 @@ class TestWriteStsTokenLocking(_HomeIsolatedTestCase):
                 "secret_TEST",
                 "session_TEST",
             )
-        mock_locked.assert_called_once_with(auth.creds_file)
+        mock_locked.assert_called_once_with(
+            auth.creds_file, purpose="writing credentials"
+        )
 
     def test_two_parallel_writes_preserve_both_profiles(self):
         from configparser import ConfigParser
@@ -226,11 +325,13 @@ class TestCopyToDefaultLocking(_HomeIsolatedTestCase):
 
         auth = self._make_aws_auth("source")
         with mock.patch(
-            "oktaawscli.aws_auth.locked", wraps=locking_module.locked
+            "oktaawscli._credentials_store.locked", wraps=locking_module.locked
         ) as mock_locked:
             auth.copy_to_default("source")
 
-        mock_locked.assert_called_once_with(auth.creds_file)
+        mock_locked.assert_called_once_with(
+            auth.creds_file, purpose="writing credentials"
+        )
         config = ConfigParser()
         config.read(os.path.join(self.tempdir, ".aws", "credentials"))
         self.assertEqual(config.get("default", "aws_access_key_id"), "AKIA_SRC")
@@ -294,15 +395,19 @@ class TestGetRoleInfoLocking(_HomeIsolatedTestCase):
         ]
         auth = self._make_aws_auth("test")
 
+        mtime = os.stat(self.info_path).st_mtime_ns
         with mock.patch(
             "oktaawscli.aws_auth.locked", wraps=locking_module.locked
         ) as mock_locked:
             auth._AwsAuth__get_role_info(roles, b"unused-because-cache-is-fresh")
 
-        mock_locked.assert_called_once_with(self.info_path)
+        mock_locked.assert_called_once_with(
+            self.info_path, purpose="reading account aliases", shared=True
+        )
+        self.assertEqual(os.stat(self.info_path).st_mtime_ns, mtime)
 
-    def test_lock_is_held_across_get_account_alias_call(self):
-        """The lock spans __get_account_alias so parallel runs serialize cold-cache fetches."""
+    def test_lock_is_not_held_across_get_account_alias_call(self):
+        """Lookups run unlocked; only the write of their results takes the lock."""
         import json
         from collections import namedtuple
 
@@ -331,8 +436,7 @@ class TestGetRoleInfoLocking(_HomeIsolatedTestCase):
         timed_out = []
 
         def fake_alias(*args, **kwargs):
-            # Inside __get_role_info's locked block; try to grab the same lock.
-            # If the outer lock is held, this attempt times out — proof of invariant.
+            # A concurrent writer can take the exclusive lock mid-lookup.
             try:
                 with locking_module.locked(self.info_path, timeout=0.2):
                     timed_out.append(False)
@@ -342,10 +446,21 @@ class TestGetRoleInfoLocking(_HomeIsolatedTestCase):
 
         with mock.patch.object(
             auth, "_AwsAuth__get_account_alias", side_effect=fake_alias
-        ):
+        ), mock.patch(
+            "oktaawscli.aws_auth.locked", wraps=locking_module.locked
+        ) as mock_locked:
             result = auth._AwsAuth__get_role_info(roles, b"unused")
 
-        self.assertEqual(timed_out, [True])
+        self.assertEqual(timed_out, [False])
+        self.assertEqual(
+            mock_locked.call_args_list,
+            [
+                mock.call(
+                    self.info_path, purpose="reading account aliases", shared=True
+                ),
+                mock.call(self.info_path, purpose="saving account aliases"),
+            ],
+        )
         self.assertEqual(
             result,
             [
@@ -464,9 +579,7 @@ class TestOktaApiErrorHandling(_HomeIsolatedTestCase):
         mock_resp = mock.MagicMock()
         mock_resp.json.return_value = error_response
         mock_resp.status_code = 401
-        with mock.patch(
-            "oktaawscli.okta_auth.requests.request", return_value=mock_resp
-        ):
+        with mock.patch.object(auth.session, "request", return_value=mock_resp):
             with self.assertRaises(SystemExit) as cm:
                 auth.get_apps("stale_sid")
         self.assertEqual(cm.exception.code, 1)
@@ -485,9 +598,7 @@ class TestOktaApiErrorHandling(_HomeIsolatedTestCase):
         mock_resp = mock.MagicMock()
         mock_resp.json.return_value = error_response
         mock_resp.status_code = 401
-        with mock.patch(
-            "oktaawscli.okta_auth.requests.request", return_value=mock_resp
-        ):
+        with mock.patch.object(auth.session, "request", return_value=mock_resp):
             with self.assertRaises(SystemExit) as cm:
                 auth.get_session("bad_session_token")
         self.assertEqual(cm.exception.code, 1)
@@ -531,14 +642,16 @@ class TestPrimaryAuthLocking(_HomeIsolatedTestCase):
         ) as mock_get_session, mock.patch(
             "oktaawscli.okta_auth.locked",
             wraps=locking_module.locked,
-        ) as mock_locked, mock.patch(
-            "oktaawscli.okta_auth.requests.request", return_value=fake_resp
+        ) as mock_locked, mock.patch.object(
+            auth.session, "request", return_value=fake_resp
         ):
             result = auth.primary_auth()
 
         self.assertEqual(result, "fresh_sid")
         mock_locked.assert_called_once_with(
-            auth.token_path, timeout=INTERACTIVE_LOCK_TIMEOUT_SECONDS
+            auth.token_path,
+            timeout=INTERACTIVE_LOCK_TIMEOUT_SECONDS,
+            purpose="Okta login and MFA",
         )
         mock_get_session.assert_called_once_with("stoken")
 
@@ -559,14 +672,16 @@ class TestPrimaryAuthLocking(_HomeIsolatedTestCase):
         ) as mock_desync, mock.patch(
             "oktaawscli.okta_auth.locked",
             wraps=locking_module.locked,
-        ) as mock_locked, mock.patch(
-            "oktaawscli.okta_auth.requests.request"
+        ) as mock_locked, mock.patch.object(
+            auth.session, "request"
         ) as mock_post:
             result = auth.primary_auth()
 
         self.assertEqual(result, "peer_refreshed_sid")
         mock_locked.assert_called_once_with(
-            auth.token_path, timeout=INTERACTIVE_LOCK_TIMEOUT_SECONDS
+            auth.token_path,
+            timeout=INTERACTIVE_LOCK_TIMEOUT_SECONDS,
+            purpose="Okta login and MFA",
         )
         self.assertEqual(mock_get_cached.call_count, 2)
         mock_post.assert_not_called()
@@ -616,8 +731,8 @@ class TestOktaRateLimitRetry(_HomeIsolatedTestCase):
             self._success_apps_response(),
         ]
 
-        with mock.patch(
-            "oktaawscli.okta_auth.requests.request", side_effect=responses
+        with mock.patch.object(
+            auth.session, "request", side_effect=responses
         ) as mock_get, mock.patch("oktaawscli.okta_auth.time.sleep") as mock_sleep:
             label, link = auth.get_apps("sid")
 
@@ -632,8 +747,9 @@ class TestOktaRateLimitRetry(_HomeIsolatedTestCase):
         auth = self._make_okta_auth()
         auth.app = "AWS Prod"
 
-        with mock.patch(
-            "oktaawscli.okta_auth.requests.request",
+        with mock.patch.object(
+            auth.session,
+            "request",
             return_value=self._rate_limit_response(),
         ) as mock_get, mock.patch("oktaawscli.okta_auth.time.sleep"):
             with self.assertRaises(SystemExit) as cm:
@@ -657,8 +773,8 @@ class TestOktaRateLimitRetry(_HomeIsolatedTestCase):
 
         responses = [self._rate_limit_response(), success]
 
-        with mock.patch(
-            "oktaawscli.okta_auth.requests.request", side_effect=responses
+        with mock.patch.object(
+            auth.session, "request", side_effect=responses
         ) as mock_post, mock.patch.object(auth, "cache_session_id"), mock.patch(
             "oktaawscli.okta_auth.time.sleep"
         ):
@@ -680,8 +796,9 @@ class TestOktaRateLimitRetry(_HomeIsolatedTestCase):
         }
         non_rate_limit_resp.status_code = 401
 
-        with mock.patch(
-            "oktaawscli.okta_auth.requests.request",
+        with mock.patch.object(
+            auth.session,
+            "request",
             return_value=non_rate_limit_resp,
         ) as mock_get, mock.patch("oktaawscli.okta_auth.time.sleep") as mock_sleep:
             with self.assertRaises(SystemExit):
@@ -689,3 +806,93 @@ class TestOktaRateLimitRetry(_HomeIsolatedTestCase):
 
         self.assertEqual(mock_get.call_count, 1)
         mock_sleep.assert_not_called()
+
+
+class TestLockTelemetry(_HomeIsolatedTestCase):
+    """Held locks advertise their holder; waiters and --lock-status report it."""
+
+    def _hold_in_child(self, target, purpose, hold_seconds=1.0):
+        ready = os.path.join(self.tempdir, "ready")
+        ctx = multiprocessing.get_context("fork")
+        proc = ctx.Process(
+            target=_hold_locked, args=(target, ready, hold_seconds, purpose)
+        )
+        proc.start()
+        self.addCleanup(proc.join)
+        deadline = time.time() + 5
+        while not os.path.exists(ready) and time.time() < deadline:
+            time.sleep(0.01)
+        return proc
+
+    def test_holder_metadata_lives_as_long_as_the_lock(self):
+        from oktaawscli._locking import locked, read_holder
+
+        target = os.path.join(self.tempdir, "data.txt")
+        lock = locked(target, purpose="testing")
+        with lock:
+            holder = read_holder(target + ".lock")
+            with lock:
+                pass
+            self.assertEqual(read_holder(target + ".lock"), holder)
+
+        self.assertEqual(holder["pid"], os.getpid())
+        self.assertEqual(holder["purpose"], "testing")
+        self.assertIsNone(read_holder(target + ".lock"))
+        self.assertGreaterEqual(lock.waited, 0)
+
+    def test_waiter_logs_who_holds_the_lock(self):
+        from oktaawscli._locking import locked
+
+        target = os.path.join(self.tempdir, "data.txt")
+        proc = self._hold_in_child(target, "interactive MFA", hold_seconds=1.5)
+
+        with self.assertLogs("okta-awscli", level="WARNING") as logs:
+            with locked(target, timeout=5) as lock:
+                pass
+
+        self.assertIn("PID %d" % proc.pid, logs.output[0])
+        self.assertIn("(interactive MFA)", logs.output[0])
+        self.assertGreater(lock.waited, 1.0)
+
+    def test_lock_status_reports_holder_and_stale_records(self):
+        import json
+
+        from oktaawscli._locking import lock_status
+
+        target = os.path.join(self.tempdir, "data.txt")
+        self.assertEqual(
+            lock_status(target + ".lock"),
+            {
+                "lock_file": target + ".lock",
+                "held": False,
+                "shared": False,
+                "holder": None,
+            },
+        )
+        proc = self._hold_in_child(target, "writing credentials")
+        status = lock_status(target + ".lock")
+        self.assertTrue(status["held"])
+        self.assertEqual(status["holder"]["pid"], proc.pid)
+        proc.join()
+
+        with open(target + ".lock.holder", "w") as holder_file:
+            json.dump({"pid": 1, "purpose": "crashed"}, holder_file)
+        status = lock_status(target + ".lock")
+        self.assertFalse(status["held"])
+        self.assertEqual(status["holder"]["purpose"], "crashed")
+
+    def test_lock_status_option_lists_okta_awscli_locks(self):
+        from click.testing import CliRunner
+
+        from oktaawscli.okta_awscli import main
+
+        self._hold_in_child(
+            os.path.join(self.tempdir, ".okta-token"), "Okta login and MFA"
+        )
+        result = CliRunner().invoke(main, ["--lock-status"])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        lines = result.output.splitlines()
+        self.assertIn("~/.okta-aws.lock: free", lines)
+        token_line = next(line for line in lines if line.startswith("~/.okta-token"))
+        self.assertIn("(Okta login and MFA)", token_line)
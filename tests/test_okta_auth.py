@@ -0,0 +1,541 @@
+"""Tests for oktaawscli.okta_auth."""
+
+import os
+import threading
+import time
+from unittest import mock
+
+from tests.test_locking import _HomeIsolatedTestCase
+
+
+def _json_response(body, status_code=200, headers=None):
+    resp = mock.MagicMock()
+    resp.json.return_value = body
+    resp.status_code = status_code
+    resp.headers = headers or {}
+    return resp
+
+
+class TestSharedHttpSession(_HomeIsolatedTestCase):
+    """Every Okta call goes through the OktaAuth-owned session."""
+
+    def test_session_sets_user_agent_and_keep_alive(self):
+        from oktaawscli.okta_auth import new_http_session
+        from oktaawscli.version import __version__
+
+        session = new_http_session()
+        self.assertTrue(
+            session.headers["User-Agent"].startswith("okta-awscli/" + __version__)
+        )
+        self.assertEqual(session.headers["Connection"], "keep-alive")
+
+    def test_injected_session_is_used_for_factor_and_desync_calls(self):
+        from oktaawscli.okta_auth import OKTA_REQUEST_TIMEOUT_SECONDS, OktaAuth
+
+        config = mock.MagicMock()
+        config.base_url_for.return_value = "example.okta.com"
+        config.factor_for.return_value = None
+        config.app_for.return_value = None
+        session = mock.MagicMock()
+        session.request.side_effect = [
+            _json_response({"status": "SUCCESS", "sessionToken": "stoken"}),
+            _json_response({"id": "user"}),
+        ]
+        auth = OktaAuth(
+            "default", False, mock.MagicMock(), "123456", config, session=session
+        )
+
+        factor = {
+            "factorType": "token:software:totp",
+            "_links": {"verify": {"href": "https://example.okta.com/verify"}},
+        }
+        self.assertEqual(auth.verify_single_factor(factor, "state"), "stoken")
+        self.assertFalse(auth.check_for_desync("sid"))
+
+        self.assertEqual(session.request.call_count, 2)
+        for call in session.request.call_args_list:
+            self.assertEqual(call.kwargs["timeout"], OKTA_REQUEST_TIMEOUT_SECONDS)
+
+    def test_base_url_may_carry_a_scheme(self):
+        from oktaawscli.okta_auth import OktaAuth
+
+        config = mock.MagicMock()
+        config.factor_for.return_value = None
+        config.app_for.return_value = None
+        for base_url, expected in (
+            ("example.okta.com", "https://example.okta.com"),
+            ("https://example.okta.com", "https://example.okta.com"),
+            ("http://127.0.0.1:8080", "http://127.0.0.1:8080"),
+            ("http://localhost:8080", "http://localhost:8080"),
+            ("http://[::1]:8080", "http://[::1]:8080"),
+        ):
+            config.base_url_for.return_value = base_url
+            auth = OktaAuth(
+                "default", False, mock.MagicMock(), None, config, session=mock.Mock()
+            )
+            self.assertEqual(auth.https_base_url, expected)
+
+    def test_plain_http_to_a_remote_host_is_rejected(self):
+        from oktaawscli.okta_auth import OktaAuth
+
+        config = mock.MagicMock()
+        config.factor_for.return_value = None
+        config.app_for.return_value = None
+        for base_url in (
+            "http://example.okta.com",
+            "http://127.0.0.1.example.com",
+            "ftp://127.0.0.1",
+        ):
+            config.base_url_for.return_value = base_url
+            session = mock.Mock()
+            with self.assertRaises(SystemExit) as raised:
+                OktaAuth(
+                    "default", False, mock.MagicMock(), None, config, session=session
+                )
+            self.assertEqual(raised.exception.code, 1)
+            session.request.assert_not_called()
+
+
+class _CountingReader:
+    """File-like response body that records how many bytes were read."""
+
+    def __init__(self, data):
+        import io
+
+        self._body = io.BytesIO(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = self._body.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+    def close(self):
+        self._body.close()
+
+
+def _page_response(page):
+    import requests
+
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.raw = _CountingReader(page.encode("utf-8"))
+    resp.encoding = None
+    return resp
+
+
+class TestStreamingSamlExtraction(_HomeIsolatedTestCase):
+    """`OktaAuth.get_saml_assertion` streams the page and stops at SAMLResponse."""
+
+    FORM = (
+        '<form method="post" action="https://signin.aws.amazon.com/saml">'
+        '<input name="RelayState" type="hidden" value=""/>'
+        '<input name="SAMLResponse" type="hidden" value="PHNhbWw+&#x2b;dGVzdA=="/>'
+        "</form>"
+    )
+
+    def test_stops_reading_once_assertion_is_found(self):
+        from oktaawscli.okta_auth import SAML_PAGE_CHUNK_SIZE
+
+        trailer = "<script>" + "x" * (4 * SAML_PAGE_CHUNK_SIZE) + "</script>"
+        page = "<html><body>" + self.FORM + trailer + "</body></html>"
+        resp = _page_response(page)
+        raw = resp.raw
+
+        auth = self._make_okta_auth()
+        with mock.patch("bs4.BeautifulSoup") as mock_soup:
+            assertion = auth.get_saml_assertion(resp)
+
+        self.assertEqual(assertion, "PHNhbWw++dGVzdA==")
+        self.assertLess(raw.bytes_read, len(page))
+        mock_soup.assert_not_called()
+
+    def test_finds_assertion_split_across_chunks_in_large_branded_page(self):
+        from oktaawscli.okta_auth import SAML_PAGE_CHUNK_SIZE
+
+        # Push the input so it straddles a chunk boundary.
+        head = "<html><head><style>%s</style></head><body>" % (
+            "." * (SAML_PAGE_CHUNK_SIZE - 40)
+        )
+        page = head + self.FORM + "</body></html>"
+
+        auth = self._make_okta_auth()
+        self.assertEqual(
+            auth.get_saml_assertion(_page_response(page)), "PHNhbWw++dGVzdA=="
+        )
+
+    def test_falls_back_to_full_parse_for_unusual_layouts(self):
+        page = '<html><body><textarea name="SAMLResponse">dGVzdA==</textarea></body></html>'
+
+        auth = self._make_okta_auth()
+        self.assertEqual(auth.get_saml_assertion(_page_response(page)), "dGVzdA==")
+
+    def test_exits_when_page_has_no_assertion(self):
+        auth = self._make_okta_auth()
+        with self.assertRaises(SystemExit):
+            auth.get_saml_assertion(_page_response("<html><body>login</body></html>"))
+
+
+class TestAppLinksCache(_HomeIsolatedTestCase):
+    """`OktaAuth.get_apps` caches the amazon_aws app list per org and user."""
+
+    APPS = [
+        {
+            "appName": "salesforce",
+            "label": "SF",
+            "linkUrl": "https://sf",
+            "sortOrder": 0,
+        },
+        {
+            "appName": "amazon_aws",
+            "label": "AWS Prod",
+            "linkUrl": "https://example.okta.com/aws-prod",
+            "sortOrder": 1,
+        },
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.auth = self._make_okta_auth()
+        self.auth.app = "AWS Prod"
+        self.auth.user_id = "00u1"
+
+    def _get_apps(self, **kwargs):
+        with mock.patch.object(
+            self.auth.session, "request", return_value=_json_response(self.APPS)
+        ) as mock_request:
+            result = self.auth.get_apps("sid", **kwargs)
+        return result, mock_request.call_count
+
+    def test_second_call_within_ttl_skips_applinks(self):
+        first, first_calls = self._get_apps()
+        second, second_calls = self._get_apps()
+
+        self.assertEqual(first, ("AWS Prod", "https://example.okta.com/aws-prod"))
+        self.assertEqual(second, first)
+        self.assertEqual((first_calls, second_calls), (1, 0))
+
+    def test_expired_entry_is_refetched(self):
+        self._get_apps()
+        self.auth.apps_cache_ttl = 0.01
+        import time
+
+        time.sleep(0.02)
+        self.assertEqual(self._get_apps()[1], 1)
+
+    def test_refresh_flag_bypasses_cache(self):
+        self._get_apps()
+        self.auth.refresh_apps = True
+        self.assertEqual(self._get_apps()[1], 1)
+
+    def test_cache_is_keyed_by_user(self):
+        self._get_apps()
+        self.auth.user_id = "00u2"
+        self.assertEqual(self._get_apps()[1], 1)
+
+    def test_failing_cached_link_invalidates_and_refetches_once(self):
+        import json
+
+        self._get_apps()
+        assertion = _saml_response("2099-01-01T00:00:00.000Z")
+        with mock.patch.object(
+            self.auth, "primary_auth", return_value="sid"
+        ), mock.patch.object(
+            self.auth, "_fetch_saml_assertion", side_effect=[None, assertion]
+        ) as mock_fetch, mock.patch.object(
+            self.auth.session, "request", return_value=_json_response(self.APPS)
+        ) as mock_request:
+            app_name, parsed = self.auth.get_assertion()
+
+        self.assertEqual((app_name, parsed.raw), ("AWS Prod", assertion))
+
+        self.assertEqual(mock_fetch.call_count, 2)
+        self.assertEqual(mock_request.call_count, 1)
+        with open(self.auth.apps_cache_path) as f:
+            self.assertEqual(len(json.load(f)), 1)
+
+
+def _saml_response(not_on_or_after):
+    import base64
+
+    xml = (
+        '<saml2p:Response xmlns:saml2p="urn:oasis:names:tc:SAML:2.0:protocol" '
+        'xmlns:saml2="urn:oasis:names:tc:SAML:2.0:assertion"><saml2:Assertion>'
+        "<saml2:Subject><saml2:SubjectConfirmation>"
+        '<saml2:SubjectConfirmationData NotOnOrAfter="%s"/>'
+        "</saml2:SubjectConfirmation></saml2:Subject>"
+        '<saml2:Conditions NotOnOrAfter="2099-01-01T00:00:00.000Z"/>'
+        "</saml2:Assertion></saml2p:Response>" % not_on_or_after
+    )
+    return base64.b64encode(xml.encode()).decode()
+
+
+class TestSamlAssertionCache(_HomeIsolatedTestCase):
+    """`OktaAuth.get_assertion` shares assertions until shortly before NotOnOrAfter."""
+
+    def setUp(self):
+        super().setUp()
+        self.auth = self._make_okta_auth()
+        self.auth.user_id = "00u1"
+        self.enterContext(
+            mock.patch.object(self.auth, "primary_auth", return_value="sid")
+        )
+        self.enterContext(
+            mock.patch.object(
+                self.auth,
+                "_choose_app",
+                return_value=("AWS Prod", "https://example.okta.com/aws", False),
+            )
+        )
+
+    @staticmethod
+    def _expiring_in(seconds):
+        from datetime import datetime, timedelta, timezone
+
+        moment = datetime.now(timezone.utc) + timedelta(seconds=seconds)
+        return moment.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+    def _get_assertion(self, fetched, **kwargs):
+        with mock.patch.object(
+            self.auth, "_fetch_saml_assertion", return_value=fetched
+        ) as mock_fetch:
+            result = self.auth.get_assertion(**kwargs)
+        return result, mock_fetch.call_count
+
+    def test_back_to_back_calls_reuse_the_assertion(self):
+        assertion = _saml_response(self._expiring_in(300))
+        first, first_fetches = self._get_assertion(assertion)
+        second, second_fetches = self._get_assertion("unused")
+
+        self.assertEqual((first[0], first[1].raw), ("AWS Prod", assertion))
+        self.assertEqual(second, first)
+        self.assertEqual((first_fetches, second_fetches), (1, 0))
+
+    def test_assertion_close_to_expiry_is_refetched(self):
+        self._get_assertion(_saml_response(self._expiring_in(10)))
+        fresh = _saml_response(self._expiring_in(300))
+        result, fetches = self._get_assertion(fresh)
+        self.assertEqual((result[1].raw, fetches), (fresh, 1))
+
+    def test_refresh_skips_cached_assertion(self):
+        self._get_assertion(_saml_response(self._expiring_in(300)))
+        fresh = _saml_response(self._expiring_in(290))
+        result, fetches = self._get_assertion(fresh, refresh=True)
+        self.assertEqual((result[1].raw, fetches), (fresh, 1))
+
+
+class TestPushPolling(_HomeIsolatedTestCase):
+    """Push MFA polls back off, honor Okta's rate-limit headers and give up."""
+
+    POLL_URL = "https://example.okta.com/api/v1/authn/factors/f1/verify"
+
+    def setUp(self):
+        super().setUp()
+        self.auth = self._make_okta_auth()
+        self.auth.okta_auth_config = mock.MagicMock()
+        self.auth.okta_auth_config.get_push_timeout.return_value = 120
+        self.now = 1000.0
+        self.sleeps = []
+        self.enterContext(
+            mock.patch("oktaawscli.okta_auth.time.monotonic", lambda: self.now)
+        )
+        self.enterContext(
+            mock.patch("oktaawscli.okta_auth.time.sleep", side_effect=self._sleep)
+        )
+
+    def _sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def _poll(self, *responses):
+        with mock.patch.object(
+            self.auth.session, "request", side_effect=list(responses)
+        ) as mock_request:
+            token = self.auth.poll_push(self.POLL_URL, {"stateToken": "st"})
+        return token, mock_request
+
+    @staticmethod
+    def _waiting(headers=None):
+        return _json_response(
+            {"status": "MFA_CHALLENGE", "factorResult": "WAITING"}, headers=headers
+        )
+
+    def test_interval_grows_until_approval(self):
+        with self.assertLogs(self.auth.logger, "INFO") as logs:
+            token, mock_request = self._poll(
+                self._waiting(),
+                self._waiting(),
+                self._waiting(),
+                _json_response({"status": "SUCCESS", "sessionToken": "tok"}),
+            )
+
+        self.assertEqual(token, "tok")
+        self.assertEqual(self.sleeps, [0.5, 0.75, 1.125])
+        self.assertEqual(mock_request.call_args.args, ("POST", self.POLL_URL))
+        self.assertIn("timeout", mock_request.call_args.kwargs)
+        self.assertIn("Push approved after 4 polls", "\n".join(logs.output))
+
+    def test_retry_after_stretches_the_interval(self):
+        self._poll(
+            self._waiting({"Retry-After": "3"}),
+            _json_response({"status": "SUCCESS", "sessionToken": "tok"}),
+        )
+        self.assertEqual(self.sleeps, [3.0])
+
+    def test_rate_limited_poll_waits_for_reset(self):
+        with mock.patch("oktaawscli.okta_auth.time.time", return_value=5000.0):
+            token, mock_request = self._poll(
+                _json_response(
+                    {"errorCode": "E0000047", "errorSummary": "API call exceeded"},
+                    status_code=429,
+                    headers={
+                        "X-Rate-Limit-Remaining": "0",
+                        "X-Rate-Limit-Reset": "5007",
+                    },
+                ),
+                _json_response({"status": "SUCCESS", "sessionToken": "tok"}),
+            )
+
+        self.assertEqual(token, "tok")
+        self.assertEqual(self.sleeps, [7.0])
+        self.assertEqual(mock_request.call_count, 2)
+
+    def test_gives_up_at_push_timeout(self):
+        self.auth.okta_auth_config.get_push_timeout.return_value = 10
+        with self.assertRaises(SystemExit):
+            self._poll(*[self._waiting() for _ in range(50)])
+
+        self.assertLessEqual(sum(self.sleeps), 10)
+        self.assertLess(len(self.sleeps), 10)
+
+    def test_rejected_push_exits(self):
+        with self.assertRaises(SystemExit):
+            self._poll(
+                _json_response({"status": "MFA_CHALLENGE", "factorResult": "REJECTED"})
+            )
+        self.assertEqual(self.sleeps, [])
+
+
+class TestPushTotpRace(_HomeIsolatedTestCase):
+    """With mfa-race, a push and a typed TOTP code race for the sessionToken."""
+
+    PUSH_VERIFY = "https://example.okta.com/api/v1/authn/factors/push/verify"
+    PUSH_POLL = PUSH_VERIFY + "?poll"
+    TOTP_VERIFY = "https://example.okta.com/api/v1/authn/factors/totp/verify"
+
+    def setUp(self):
+        super().setUp()
+        self.auth = self._make_okta_auth()
+        self.auth.okta_auth_config = mock.MagicMock()
+        self.auth.okta_auth_config.get_mfa_race.return_value = "True"
+        self.auth.okta_auth_config.get_push_timeout.return_value = 120
+        read_fd, self.stdin_writer = os.pipe()
+        self.stdin = os.fdopen(read_fd, "r")
+        self.addCleanup(self.stdin.close)
+        self.addCleanup(self._close_writer)
+        self.enterContext(mock.patch("sys.stdin", self.stdin))
+        self.push_polls = 0
+        self.push_approved_after = None
+        self.push_error = None
+        self.totp_answers = []
+
+    def _close_writer(self):
+        if self.stdin_writer is not None:
+            os.close(self.stdin_writer)
+            self.stdin_writer = None
+
+    def _request(self, method, url, **kwargs):
+        if url == self.PUSH_VERIFY:
+            return _json_response(
+                {
+                    "status": "MFA_CHALLENGE",
+                    "_links": {"next": {"href": self.PUSH_POLL}},
+                }
+            )
+        if url == self.PUSH_POLL:
+            self.push_polls += 1
+            if self.push_error:
+                raise self.push_error
+            if self.push_approved_after and self.push_polls >= self.push_approved_after:
+                return _json_response({"status": "SUCCESS", "sessionToken": "push-tok"})
+            return _json_response(
+                {"status": "MFA_CHALLENGE", "factorResult": "WAITING"}
+            )
+        if url == self.TOTP_VERIFY:
+            self.totp_answers.append(kwargs["json"]["answer"])
+            if kwargs["json"]["answer"] == "123456":
+                return _json_response({"status": "SUCCESS", "sessionToken": "totp-tok"})
+            return _json_response(
+                {"errorCode": "E0000068", "errorSummary": "Invalid Passcode"}, 403
+            )
+        raise AssertionError(url)
+
+    def _verify(self):
+        factors = [
+            {
+                "factorType": "push",
+                "provider": "OKTA",
+                "_links": {"verify": {"href": self.PUSH_VERIFY}},
+            },
+            {
+                "factorType": "token:software:totp",
+                "provider": "GOOGLE",
+                "_links": {"verify": {"href": self.TOTP_VERIFY}},
+            },
+        ]
+        with mock.patch.object(self.auth.session, "request", side_effect=self._request):
+            return self.auth.verify_mfa(factors, "state")
+
+    def test_approved_push_wins_without_input(self):
+        self.push_approved_after = 2
+        self.assertEqual(self._verify(), "push-tok")
+        self.assertEqual(self.totp_answers, [])
+
+    def test_typed_code_wins_and_cancels_push(self):
+        os.write(self.stdin_writer, b"123456\n")
+        self.assertEqual(self._verify(), "totp-tok")
+
+        polls = self.push_polls
+        time.sleep(1)
+        self.assertEqual(self.push_polls, polls)
+
+    def test_wrong_code_keeps_racing(self):
+        os.write(self.stdin_writer, b"000000\n123456\n")
+        self.assertEqual(self._verify(), "totp-tok")
+        self.assertEqual(self.totp_answers, ["000000", "123456"])
+
+    def test_closed_stdin_falls_back_to_push(self):
+        self._close_writer()
+        self.push_approved_after = 2
+        self.assertEqual(self._verify(), "push-tok")
+
+    def test_failed_poll_keeps_racing_on_totp(self):
+        import requests
+
+        self.push_error = requests.ConnectionError("connection reset")
+        typing = threading.Timer(0.5, os.write, args=(self.stdin_writer, b"123456\n"))
+        typing.start()
+        self.addCleanup(typing.cancel)
+
+        with self.assertLogs(self.auth.logger, "WARNING"):
+            self.assertEqual(self._verify(), "totp-tok")
+        self.assertEqual(self.push_polls, 1)
+
+    def test_failed_poll_with_closed_stdin_exits(self):
+        import requests
+
+        self.push_error = requests.Timeout("read timed out")
+        self._close_writer()
+
+        start = time.monotonic()
+        with self.assertRaises(SystemExit), self.assertLogs(self.auth.logger):
+            self._verify()
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_race_is_off_by_default(self):
+        self.auth.okta_auth_config.get_mfa_race.return_value = "False"
+        self.auth.factor = "GOOGLE"
+        os.write(self.stdin_writer, b"123456\n")
+        with mock.patch("oktaawscli.okta_auth.input", return_value="123456"):
+            self.assertEqual(self._verify(), "totp-tok")
+        self.assertEqual(self.push_polls, 0)
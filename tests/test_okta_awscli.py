@@ -0,0 +1,310 @@
+"""Tests for oktaawscli.okta_awscli."""
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from tests.test_locking import _HomeIsolatedTestCase
+
+
+def _sts_token(expires_in=3600):
+    return {
+        "AccessKeyId": "AKIA_TEST",
+        "SecretAccessKey": "secret_TEST",
+        "SessionToken": "session_TEST",
+        "Expiration": datetime.now(timezone.utc) + timedelta(seconds=expires_in),
+    }
+
+
+class TestCredentialProcess(_HomeIsolatedTestCase):
+    """`--credential-process` prints SDK JSON backed by a per-role cache."""
+
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write("[default]\nbase-url = example.okta.com\nrole = arn:r\n")
+
+    def _invoke(self, *args):
+        from click.testing import CliRunner
+
+        from oktaawscli.okta_awscli import main
+
+        return CliRunner().invoke(main, ["--credential-process", *args])
+
+    def test_cold_call_fetches_and_prints_sdk_schema(self):
+        role = ("arn:r", "arn:p", "acct")
+        with mock.patch(
+            "oktaawscli.okta_awscli.fetch_sts_token",
+            return_value=(role, _sts_token(), 3600),
+        ) as mock_fetch:
+            result = self._invoke()
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        document = json.loads(result.output)
+        self.assertEqual(document["Version"], 1)
+        self.assertEqual(document["AccessKeyId"], "AKIA_TEST")
+        self.assertEqual(document["SessionToken"], "session_TEST")
+        self.assertTrue(document["Expiration"].endswith("Z"))
+        mock_fetch.assert_called_once()
+
+    def test_warm_call_is_served_from_cache(self):
+        role = ("arn:r", "arn:p", "acct")
+        with mock.patch(
+            "oktaawscli.okta_awscli.fetch_sts_token",
+            return_value=(role, _sts_token(), 3600),
+        ):
+            first = self._invoke()
+        with mock.patch(
+            "oktaawscli.okta_awscli.fetch_sts_token",
+            side_effect=AssertionError("should not authenticate"),
+        ):
+            second = self._invoke()
+
+        self.assertEqual(second.exit_code, 0, second.output)
+        self.assertEqual(json.loads(first.output), json.loads(second.output))
+
+    def test_stored_role_does_not_miss_the_cache(self):
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write("[default]\nbase-url = example.okta.com\n")
+
+        def fetch_and_store_role(okta_profile, okta_auth_config, *args, **kwargs):
+            # As fetch_sts_token does with store-role on (the default).
+            okta_auth_config.save_chosen_role_for_profile(okta_profile, "arn:r")
+            return ("arn:r", "arn:p", "acct"), _sts_token(), 3600
+
+        with mock.patch(
+            "oktaawscli.okta_awscli.fetch_sts_token", side_effect=fetch_and_store_role
+        ):
+            first = self._invoke()
+        with mock.patch(
+            "oktaawscli.okta_awscli.fetch_sts_token",
+            side_effect=AssertionError("should not authenticate"),
+        ):
+            second = self._invoke()
+
+        self.assertEqual(second.exit_code, 0, second.output)
+        self.assertEqual(json.loads(first.output), json.loads(second.output))
+
+    def test_nearly_expired_cache_entry_is_refreshed(self):
+        role = ("arn:r", "arn:p", "acct")
+        with mock.patch(
+            "oktaawscli.okta_awscli.fetch_sts_token",
+            return_value=(role, _sts_token(expires_in=60), 3600),
+        ):
+            self._invoke()
+        with mock.patch(
+            "oktaawscli.okta_awscli.fetch_sts_token",
+            return_value=(role, _sts_token(), 3600),
+        ) as mock_fetch:
+            result = self._invoke()
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        mock_fetch.assert_called_once()
+
+
+class TestAutoWriteProfile(_HomeIsolatedTestCase):
+    """auto-write-profile names the profile after the account alias."""
+
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write(
+                "[default]\nbase-url = example.okta.com\n"
+                "role = arn:aws:iam::111:role/r\nauto-write-profile = True\n"
+            )
+
+    def _written_profiles(self, alias):
+        from click.testing import CliRunner
+
+        from oktaawscli.okta_awscli import main
+
+        role = ("arn:aws:iam::111:role/r", "arn:aws:iam::111:saml-provider/p", alias)
+        with mock.patch(
+            "oktaawscli.okta_awscli.fetch_sts_token",
+            return_value=(role, _sts_token(), 3600),
+        ) as mock_fetch:
+            result = CliRunner().invoke(main, [])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIs(mock_fetch.call_args.kwargs["resolve_alias"], True)
+        with open(os.path.join(self.tempdir, ".aws", "credentials")) as f:
+            return [line for line in f if line.startswith("[")]
+
+    def test_profile_is_named_after_alias(self):
+        self.assertEqual(self._written_profiles("prod"), ["[prod]\n"])
+
+    def test_failed_alias_lookup_never_writes_default(self):
+        self.assertEqual(self._written_profiles(None), ["[111]\n"])
+
+
+class TestRejectedAssertionRetry(_HomeIsolatedTestCase):
+    """A SAML assertion rejected by STS is refetched once."""
+
+    def _fetch(self, sts_side_effect):
+        import logging
+
+        from oktaawscli.okta_awscli import fetch_sts_token
+        from oktaawscli.saml import SamlAssertion
+
+        config = mock.MagicMock()
+        config.get_store_role.return_value = "False"
+        config.get_session_duration.return_value = 3600
+        aws_auth = mock.MagicMock()
+        aws_auth.choose_aws_role.return_value = ("arn:r", "arn:p", "acct")
+        aws_auth.get_sts_token.side_effect = sts_side_effect
+        with mock.patch("oktaawscli.okta_auth.OktaAuth") as mock_okta:
+            mock_okta.return_value.get_assertion.side_effect = [
+                ("app", SamlAssertion("cached", [], None, None, None)),
+                ("app", SamlAssertion("fresh", [], None, None, None)),
+            ]
+            result = fetch_sts_token(
+                "default", config, aws_auth, False, logging.getLogger("t"), None, False
+            )
+        return result, mock_okta.return_value, aws_auth
+
+    def test_expired_assertion_is_refetched_once(self):
+        from botocore.exceptions import ClientError
+
+        expired = ClientError(
+            {"Error": {"Code": "ExpiredTokenException"}}, "AssumeRoleWithSAML"
+        )
+        (_, sts_token, _), okta, aws_auth = self._fetch([expired, _sts_token()])
+
+        self.assertEqual(sts_token["AccessKeyId"], "AKIA_TEST")
+        okta.get_assertion.assert_called_with(refresh=True)
+        self.assertEqual(aws_auth.get_sts_token.call_args.args[2].raw, "fresh")
+
+    def test_other_errors_are_not_retried(self):
+        from botocore.exceptions import ClientError
+
+        denied = ClientError({"Error": {"Code": "AccessDenied"}}, "AssumeRoleWithSAML")
+        with self.assertRaises(ClientError):
+            self._fetch([denied])
+
+
+class TestRefreshWithin(_HomeIsolatedTestCase):
+    """`--refresh-within` refreshes only credentials that are about to expire."""
+
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write("[default]\nbase-url = example.okta.com\nrole = arn:r\n")
+        expires = datetime.now(timezone.utc) + timedelta(minutes=30)
+        os.makedirs(os.path.join(self.tempdir, ".aws"), exist_ok=True)
+        with open(os.path.join(self.tempdir, ".aws", "credentials"), "w") as f:
+            f.write(
+                "[tf]\naws_access_key_id = AKIA_OLD\n"
+                "aws_secret_access_key = s\naws_session_token = t\n"
+                "x_security_token_expires = %s\nx_role_arn = arn:r\n"
+                % expires.strftime("%Y-%m-%dT%H:%M:%SZ")
+            )
+        self.sleep = self.enterContext(mock.patch("oktaawscli.okta_awscli.time.sleep"))
+        self.fetch = self.enterContext(
+            mock.patch(
+                "oktaawscli.okta_awscli.fetch_sts_token",
+                return_value=(("arn:r", "arn:p", "acct"), _sts_token(), 3600),
+            )
+        )
+
+    def _invoke(self, *args):
+        from click.testing import CliRunner
+
+        from oktaawscli.okta_awscli import main
+
+        return CliRunner().invoke(main, list(args))
+
+    def test_credentials_outliving_threshold_exit_without_auth(self):
+        from oktaawscli.okta_awscli import EXIT_NO_REFRESH_NEEDED
+
+        result = self._invoke("--profile", "tf", "--refresh-within", "20")
+
+        self.assertEqual(result.exit_code, EXIT_NO_REFRESH_NEEDED, result.output)
+        self.fetch.assert_not_called()
+        self.sleep.assert_not_called()
+
+    def test_credentials_inside_threshold_are_refreshed_after_jitter(self):
+        result = self._invoke("--profile", "tf", "--refresh-within", "40")
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.fetch.assert_called_once()
+        (delay,), _ = self.sleep.call_args
+        self.assertTrue(0 <= delay < 60)
+        with open(os.path.join(self.tempdir, ".aws", "credentials")) as f:
+            self.assertIn("AKIA_TEST", f.read())
+
+    def test_jitter_is_capped_at_half_the_threshold(self):
+        with open(os.path.join(self.tempdir, ".okta-aws"), "a") as f:
+            f.write("refresh-jitter = 100000\n")
+        self._invoke("--profile", "tf", "--refresh-within", "40")
+
+        (delay,), _ = self.sleep.call_args
+        self.assertLess(delay, 40 * 60 / 2)
+
+    def test_profile_is_required(self):
+        result = self._invoke("--refresh-within", "20")
+        self.assertEqual(result.exit_code, 1)
+        self.fetch.assert_not_called()
+
+    def test_host_jitter_is_stable_per_host_and_profile(self):
+        from oktaawscli.okta_awscli import host_jitter
+
+        with mock.patch("socket.gethostname", return_value="ci-runner-1"):
+            first = host_jitter(60, "default", "tf")
+            again = host_jitter(60, "default", "tf")
+            other_profile = host_jitter(60, "default", "prod")
+        with mock.patch("socket.gethostname", return_value="ci-runner-2"):
+            other_host = host_jitter(60, "default", "tf")
+
+        self.assertEqual(first, again)
+        self.assertTrue(0 <= first < 60)
+        self.assertNotEqual(first, other_profile)
+        self.assertNotEqual(first, other_host)
+
+
+class TestAgentTotpToken(_HomeIsolatedTestCase):
+    """`--agent --token` only sends the single-use TOTP code for the first login."""
+
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write("[default]\nbase-url = example.okta.com\nrole = arn:r\n")
+
+    def test_token_is_cleared_after_first_login(self):
+        import logging
+
+        from oktaawscli.okta_awscli import serve_agent
+
+        clients = []
+
+        def new_okta(*args, **_):
+            clients.append(mock.Mock(totp_token=args[3]))
+            return clients[-1]
+
+        def new_agent(fetch, *_):
+            def serve():
+                fetch("default", None)
+                self.assertIsNone(clients[0].totp_token)
+                fetch("default", "222")
+
+            return mock.Mock(serve=serve)
+
+        role = ("arn:r", "arn:p", None)
+        with mock.patch(
+            "oktaawscli.agent.CredentialAgent", side_effect=new_agent
+        ), mock.patch(
+            "oktaawscli.okta_auth.OktaAuth", side_effect=new_okta
+        ), mock.patch(
+            "oktaawscli.okta_awscli.fetch_sts_token",
+            return_value=(role, _sts_token(), 3600),
+        ) as mock_fetch:
+            with self.assertRaises(SystemExit):
+                serve_agent(
+                    False, logging.getLogger("test"), "123456", False, None, False
+                )
+
+        self.assertEqual(len(clients), 2)
+        self.assertIsNone(clients[1].totp_token)
+        self.assertEqual(
+            [call.args[5] for call in mock_fetch.call_args_list], ["123456", None]
+        )
@@ -0,0 +1,97 @@
+"""Tests for oktaawscli.saml."""
+
+import base64
+import logging
+import os
+import unittest
+
+from tests.test_locking import _HomeIsolatedTestCase
+
+
+def _saml_response(session_duration=None):
+    duration = (
+        ""
+        if session_duration is None
+        else '<saml2:Attribute Name="https://aws.amazon.com/SAML/Attributes/'
+        'SessionDuration"><saml2:AttributeValue>%s</saml2:AttributeValue>'
+        "</saml2:Attribute>" % session_duration
+    )
+    xml = (
+        '<saml2p:Response xmlns:saml2p="urn:oasis:names:tc:SAML:2.0:protocol" '
+        'xmlns:saml2="urn:oasis:names:tc:SAML:2.0:assertion">'
+        "<saml2:Issuer>http://www.okta.com/exk1</saml2:Issuer><saml2:Assertion>"
+        "<saml2:Subject><saml2:NameID>jane@example.com</saml2:NameID>"
+        "<saml2:SubjectConfirmation>"
+        '<saml2:SubjectConfirmationData NotOnOrAfter="2030-01-01T00:05:00.000Z"/>'
+        "</saml2:SubjectConfirmation></saml2:Subject>"
+        '<saml2:Conditions NotOnOrAfter="2030-01-01T01:00:00.000Z"/>'
+        "<saml2:AttributeStatement>"
+        '<saml2:Attribute Name="https://aws.amazon.com/SAML/Attributes/Role">'
+        "<saml2:AttributeValue>arn:aws:iam::111:saml-provider/p,"
+        "arn:aws:iam::111:role/admin</saml2:AttributeValue>"
+        "<saml2:AttributeValue>arn:aws:iam::222:saml-provider/p,"
+        "arn:aws:iam::222:role/read</saml2:AttributeValue></saml2:Attribute>"
+        "%s</saml2:AttributeStatement></saml2:Assertion></saml2p:Response>" % duration
+    )
+    return base64.b64encode(xml.encode()).decode()
+
+
+class TestParseAssertion(unittest.TestCase):
+    """The SAMLResponse is decoded once into roles, limits and subject."""
+
+    def test_fields_are_parsed(self):
+        from oktaawscli.saml import RoleTuple, parse_assertion
+
+        raw = _saml_response(session_duration=7200)
+        assertion = parse_assertion(raw)
+
+        self.assertEqual(assertion.raw, raw)
+        self.assertEqual(
+            assertion.roles,
+            [
+                RoleTuple(
+                    "arn:aws:iam::111:saml-provider/p", "arn:aws:iam::111:role/admin"
+                ),
+                RoleTuple(
+                    "arn:aws:iam::222:saml-provider/p", "arn:aws:iam::222:role/read"
+                ),
+            ],
+        )
+        self.assertEqual(assertion.session_duration, 7200)
+        self.assertEqual(
+            assertion.not_on_or_after.isoformat(), "2030-01-01T00:05:00+00:00"
+        )
+        self.assertEqual(assertion.subject, "jane@example.com")
+
+    def test_parsed_assertion_is_returned_as_is(self):
+        from oktaawscli.saml import encoded, parse_assertion
+
+        assertion = parse_assertion(_saml_response())
+
+        self.assertIs(parse_assertion(assertion), assertion)
+        self.assertIsNone(assertion.session_duration)
+        self.assertEqual(encoded(assertion), encoded(assertion.raw))
+
+    def test_invalid_assertion_raises_value_error(self):
+        from oktaawscli.saml import parse_assertion
+
+        with self.assertRaises(ValueError):
+            parse_assertion("not base64 xml")
+
+
+class TestSessionDurationCap(_HomeIsolatedTestCase):
+    """SessionDuration caps the configured session-duration."""
+
+    def _duration(self, max_duration):
+        from oktaawscli.okta_auth_config import OktaAuthConfig
+
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write("[default]\nsession-duration = 43200\n")
+        config = OktaAuthConfig(logging.getLogger("test"), reset=False)
+        return config.get_session_duration("default", max_duration=max_duration)
+
+    def test_longer_configured_duration_is_capped(self):
+        self.assertEqual(self._duration(14400), 14400)
+
+    def test_no_session_duration_keeps_configured_duration(self):
+        self.assertEqual(self._duration(None), 43200)
@@ -0,0 +1,117 @@
+"""Import-time budget for the okta-awscli fast paths.
+
+Each check runs in a fresh interpreter so modules imported by other tests
+don't mask a regression.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+# Modules the fast paths must not load: each costs tens to hundreds of
+# milliseconds to import.
+HEAVY_MODULES = ("boto3", "botocore", "bs4", "requests")
+
+_PROBE = textwrap.dedent("""
+    import json
+    import sys
+    import time
+
+    start = time.perf_counter()
+    from oktaawscli.okta_awscli import main
+
+    try:
+        main(sys.argv[1:])
+    except SystemExit:
+        pass
+    elapsed = time.perf_counter() - start
+    heavy = [name for name in %r if name in sys.modules]
+    sys.stderr.write(json.dumps({"heavy": heavy, "elapsed": elapsed}) + "\\n")
+    """) % (HEAVY_MODULES,)
+
+
+class TestStartupBudget(unittest.TestCase):
+    """Fast paths finish without importing boto3, botocore, bs4 or requests."""
+
+    def setUp(self):
+        self.tempdir = self.enterContext(tempfile.TemporaryDirectory())
+        os.makedirs(os.path.join(self.tempdir, ".aws"))
+        expires = datetime.now(timezone.utc) + timedelta(hours=1)
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write("[default]\nbase-url = example.okta.com\n")
+        with open(os.path.join(self.tempdir, ".aws", "credentials"), "w") as f:
+            f.write(
+                "[cached]\n"
+                "aws_access_key_id = AKIA_TEST\n"
+                "aws_secret_access_key = secret_TEST\n"
+                "aws_session_token = session_TEST\n"
+                "x_security_token_expires = %s\n"
+                % expires.strftime("%Y-%m-%dT%H:%M:%SZ")
+            )
+
+    def _probe(self, *args):
+        env = dict(os.environ, HOME=self.tempdir)
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env["PYTHONPATH"] = os.pathsep.join(
+            filter(None, [repo_root, env.get("PYTHONPATH")])
+        )
+        proc = subprocess.run(
+            [sys.executable, "-c", _PROBE, *args],
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=60,
+            check=False,
+        )
+        return json.loads(proc.stderr.strip().splitlines()[-1])
+
+    def test_version_does_not_import_heavy_modules(self):
+        self.assertEqual(self._probe("--version")["heavy"], [])
+
+    def test_valid_cached_credentials_do_not_import_heavy_modules(self):
+        self.assertEqual(self._probe("--profile", "cached")["heavy"], [])
+
+    def test_cached_credential_process_does_not_import_heavy_modules(self):
+        from oktaawscli import _credential_cache
+
+        with mock.patch.dict(os.environ, {"HOME": self.tempdir}):
+            cache_path = _credential_cache.cache_path_for("default", None, "")
+        _credential_cache.ensure_cache_dir(cache_path)
+        _credential_cache.store(
+            cache_path,
+            _credential_cache.credential_process_document(
+                {
+                    "AccessKeyId": "AKIA_TEST",
+                    "SecretAccessKey": "secret_TEST",
+                    "SessionToken": "session_TEST",
+                    "Expiration": datetime.now(timezone.utc) + timedelta(hours=1),
+                }
+            ),
+        )
+        self.assertEqual(self._probe("--credential-process")["heavy"], [])
+
+    def test_from_agent_does_not_import_heavy_modules(self):
+        self.assertEqual(self._probe("--from-agent")["heavy"], [])
+
+    def test_okta_side_does_not_import_aws_auth(self):
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        proc = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, oktaawscli.okta_auth, oktaawscli._credential_cache;"
+                "print('oktaawscli.aws_auth' in sys.modules)",
+            ],
+            cwd=repo_root,
+            capture_output=True,
+            text=True,
+            timeout=60,
+            check=True,
+        )
+        self.assertEqual(proc.stdout.strip(), "False")
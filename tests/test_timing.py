@@ -0,0 +1,121 @@
+"""Tests for oktaawscli._timing and the --timings options."""
+
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from tests.test_locking import _HomeIsolatedTestCase
+
+
+class TestTiming(_HomeIsolatedTestCase):
+    """Spans are recorded only while timing is enabled."""
+
+    def setUp(self):
+        super().setUp()
+        from oktaawscli import _timing
+
+        self.addCleanup(_timing.disable)
+
+    def test_disabled_spans_record_nothing(self):
+        from oktaawscli import _timing
+        from oktaawscli._locking import locked
+
+        calls = []
+        traced = _timing.timed("phase")(lambda value: calls.append(value) or value)
+
+        self.assertIs(_timing.span("a"), _timing.span("b"))
+        self.assertEqual(traced(3), 3)
+        self.assertEqual(calls, [3])
+        with locked(os.path.join(self.tempdir, "file")):
+            _timing.record("phase", 0.0, 1.0)
+        self.assertIsNone(_timing.disable())
+
+    def test_nested_spans_are_reported_under_their_parent(self):
+        from oktaawscli import _timing
+        from oktaawscli._locking import locked
+
+        recorder = _timing.enable()
+
+        @_timing.timed("inner")
+        def inner():
+            with locked(os.path.join(self.tempdir, "file")):
+                pass
+
+        with _timing.span("outer"):
+            inner()
+            inner()
+        with _timing.span("after"):
+            pass
+        worker = threading.Thread(target=inner)
+        worker.start()
+        worker.join()
+        _timing.disable()
+
+        phases = [(p["path"], p["calls"]) for p in recorder.phases()]
+        self.assertEqual(
+            phases,
+            [
+                ("outer", 1),
+                ("outer/inner", 2),
+                ("outer/inner/lock file", 2),
+                ("outer/inner/lock file held", 2),
+                ("after", 1),
+                ("inner", 1),
+                ("inner/lock file", 1),
+                ("inner/lock file held", 1),
+            ],
+        )
+        outer = recorder.phases()[0]
+        self.assertGreaterEqual(outer["total_ms"], recorder.phases()[1]["total_ms"])
+
+
+class TestTimingsOptions(_HomeIsolatedTestCase):
+    """--timings prints a breakdown to stderr and --timings-json appends a line."""
+
+    def setUp(self):
+        super().setUp()
+        expires = datetime.now(timezone.utc) + timedelta(hours=1)
+        os.makedirs(os.path.join(self.tempdir, ".aws"))
+        with open(os.path.join(self.tempdir, ".okta-aws"), "w") as f:
+            f.write("[default]\nbase-url = example.okta.com\n")
+        with open(os.path.join(self.tempdir, ".aws", "credentials"), "w") as f:
+            f.write(
+                "[cached]\naws_access_key_id = AKIA_TEST\n"
+                "x_security_token_expires = %s\n"
+                % expires.strftime("%Y-%m-%dT%H:%M:%SZ")
+            )
+
+    def _invoke(self, *args):
+        from click.testing import CliRunner
+
+        from oktaawscli.okta_awscli import main
+
+        return CliRunner().invoke(main, ["--profile", "cached", *args])
+
+    def test_timings_report_goes_to_stderr(self):
+        from oktaawscli import _timing
+
+        result = self._invoke("--timings")
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("okta-awscli timings", result.stderr)
+        self.assertIn("aws.check_credentials", result.stderr)
+        self.assertNotIn("okta-awscli timings", result.stdout)
+        self.assertFalse(_timing.enabled())
+
+    def test_timings_json_appends_one_line_per_run(self):
+        path = os.path.join(self.tempdir, "timings.jsonl")
+
+        self._invoke("--timings-json", path)
+        result = self._invoke("--timings-json", path)
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertNotIn("okta-awscli timings", result.stderr)
+        with open(path) as f:
+            runs = [json.loads(line) for line in f]
+        self.assertEqual(len(runs), 2)
+        self.assertIn(
+            "aws.check_credentials", [phase["path"] for phase in runs[0]["phases"]]
+        )
+        self.assertTrue(all(run["total_ms"] >= 0 for run in runs))